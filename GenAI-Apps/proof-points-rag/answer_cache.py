@@ -0,0 +1,149 @@
+"""
+Summary:
+In-process semantic cache for chatbot answers.
+
+An answer is stored with the embedding of the question and the ids and content hash of the proof
+points that were retrieved as context. A later question reuses the answer when it retrieved the
+same proof points, in the same state, and its embedding is within a cosine-similarity threshold
+of the cached question. Entries expire after a TTL, the least recently used entries are evicted
+beyond a size bound, and entries can be invalidated by proof point id when a document changes.
+
+Usage:
+    from answer_cache import get_answer_cache
+
+    cache = get_answer_cache()
+    answer = cache.lookup(query_vector, context_ids, context)
+    if answer is None:
+        answer = ...
+        cache.store(query_vector, context_ids, context, answer)
+"""
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+from metrics import CACHE_REQUESTS
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def _context_key(context_ids, context):
+    # Any change to a retrieved proof point changes the rendered context and therefore the key
+    ids = tuple(sorted(str(document_id) for document_id in context_ids))
+    return ids, hashlib.sha256(context.encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache keyed on question embedding similarity and retrieved context.
+    Args:
+        threshold (float): Minimum cosine similarity between questions to reuse an answer.
+        max_entries (int): Maximum number of cached answers.
+        ttl (float): Seconds an answer stays valid.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=1024, ttl=3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()   # entry id -> (unit vector, context key, answer, created)
+        self._by_context = {}           # context key -> set of entry ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, query_vector, context_ids, context):
+        """
+        Find a cached answer for a similar question over the same context.
+        Args:
+            query_vector (list[float]): Embedding of the question.
+            context_ids (list): Ids of the retrieved proof points.
+            context (str): Context string sent to the LLM.
+        Returns:
+            str: The cached answer, or None.
+        """
+        key = _context_key(context_ids, context)
+        query = _normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._by_context.get(key, ())):
+                vector, _, _, created = self._entries[entry_id]
+                if now - created > self.ttl:
+                    self._remove(entry_id)
+                    continue
+                score = sum(a * b for a, b in zip(query, vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                CACHE_REQUESTS.inc(cache="answer", result="miss")
+                return None
+            self.hits += 1
+            CACHE_REQUESTS.inc(cache="answer", result="hit")
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id][2]
+
+    def store(self, query_vector, context_ids, context, answer):
+        """
+        Cache an answer for a question and its retrieved context.
+        """
+        key = _context_key(context_ids, context)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (_normalize(query_vector), key, answer, time.time())
+            self._by_context.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, document_id):
+        """
+        Drop every cached answer whose context included the given proof point.
+        Returns:
+            int: Number of answers dropped.
+        """
+        document_id = str(document_id)
+        with self._lock:
+            stale = [entry_id for key, entry_ids in self._by_context.items() if document_id in key[0]
+                     for entry_id in entry_ids]
+            for entry_id in stale:
+                self._remove(entry_id)
+            return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def _remove(self, entry_id):
+        _, key, _, _ = self._entries.pop(entry_id)
+        entry_ids = self._by_context[key]
+        entry_ids.discard(entry_id)
+        if not entry_ids:
+            del self._by_context[key]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """
+    Return the process-wide answer cache, configured from Config.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticAnswerCache(
+                threshold=getattr(Config, "ANSWER_CACHE_THRESHOLD", 0.95),
+                max_entries=getattr(Config, "ANSWER_CACHE_MAX_ENTRIES", 1024),
+                ttl=getattr(Config, "ANSWER_CACHE_TTL", 3600),
+            )
+        return _cache
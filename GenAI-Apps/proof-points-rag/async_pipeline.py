@@ -0,0 +1,117 @@
+"""
+Summary:
+Small asyncio pipeline used to process customer stories in parallel.
+
+A pipeline is a list of stages connected by bounded queues. Each stage runs its own number of
+workers, so every provider (web site, LLM, embedding API, MongoDB) gets its own concurrency limit,
+and a full queue makes the upstream stage wait instead of piling up work in memory. Stage
+functions can be coroutines or plain blocking functions, which are run in a thread pool. An item
+that raises is recorded as a failure for that stage and dropped, the rest of the run continues.
+
+Usage:
+    from async_pipeline import Stage, run_pipeline
+
+    stages = [Stage("fetch", fetch_story, concurrency=8), Stage("write", write_story, concurrency=1)]
+    stats = asyncio.run(run_pipeline(customer_info_array, stages))
+"""
+
+import asyncio
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+# Marks the end of the input on a queue
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """
+    One step of the pipeline.
+    Args:
+        name (str): Stage name used in stats and error messages.
+        func (callable): Takes an item and returns the item for the next stage (sync or async).
+        concurrency (int): Number of items processed at the same time by this stage.
+        queue_size (int): Maximum number of items waiting for this stage.
+    """
+    name: str
+    func: object
+    concurrency: int = 1
+    queue_size: int = 0
+    processed: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+    errors: list = field(default_factory=list)
+
+    def stats(self) -> dict:
+        return {"processed": self.processed, "failed": self.failed, "seconds": round(self.seconds, 3)}
+
+
+async def _run_stage(stage, inbox, outbox):
+    is_coroutine = inspect.iscoroutinefunction(stage.func)
+
+    async def worker():
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+            start = time.perf_counter()
+            try:
+                if is_coroutine:
+                    result = await stage.func(item)
+                else:
+                    result = await asyncio.to_thread(stage.func, item)
+            except Exception as e:
+                stage.failed += 1
+                stage.errors.append((item, e))
+                print(f"Stage '{stage.name}' failed: {e}")
+                continue
+            finally:
+                stage.seconds += time.perf_counter() - start
+            stage.processed += 1
+            if outbox is not None and result is not None:
+                # Blocks while the next stage is saturated (backpressure)
+                await outbox.put(result)
+
+    await asyncio.gather(*(worker() for _ in range(stage.concurrency)))
+
+
+async def run_pipeline(items, stages) -> dict:
+    """
+    Push items through the stages and wait until every item is processed or failed.
+    Args:
+        items (iterable): Input items for the first stage; iterators and generators are consumed lazily.
+        stages (list[Stage]): Stages in processing order.
+    Returns:
+        dict: Per-stage processed/failed counts and busy time.
+    """
+    # Blocking stage functions (and a lazy feed) run in threads; size the pool so no stage starves another
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=sum(stage.concurrency for stage in stages) + 1))
+
+    queues = [asyncio.Queue(maxsize=stage.queue_size or stage.concurrency * 2) for stage in stages]
+
+    async def run(index, stage):
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        await _run_stage(stage, queues[index], outbox)
+        # Tell every worker of the next stage that no more input is coming
+        if outbox is not None:
+            for _ in range(stages[index + 1].concurrency):
+                await outbox.put(_DONE)
+
+    async def feed():
+        if isinstance(items, (list, tuple)):
+            for item in items:
+                await queues[0].put(item)
+        else:
+            # Lazy sources (generators reading files or the network) are advanced in a thread,
+            # so the first items are processed while the rest are still being discovered
+            iterator = iter(items)
+            while (item := await asyncio.to_thread(next, iterator, _DONE)) is not _DONE:
+                await queues[0].put(item)
+        for _ in range(stages[0].concurrency):
+            await queues[0].put(_DONE)
+
+    await asyncio.gather(feed(), *(run(index, stage) for index, stage in enumerate(stages)))
+    return {stage.name: stage.stats() for stage in stages}
@@ -0,0 +1,263 @@
+"""
+Summary:
+Offline benchmark of the proof-points-rag pipelines against local stand-ins (see benchmark_fakes.py),
+so throughput and latency can be compared between commits without network access, API keys or costs.
+
+Benchmarks:
+- generator: proofpoint-generator.py, proof points per second.
+- updater: proofpoint-updater.py embedding the generated proof points, documents per second.
+- gatherer: proofpoint-gatherer.py over a generated listing page, stories per minute.
+- gatherer_batch: the same with `--batch`, extracting through the fake Batch API, stories per minute.
+- chatbot: proofbot.py retrieval and completion with N concurrent users, p50/p95 latency and throughput.
+
+Embeddings come from a fake HuggingFace/OpenAI server with deterministic vectors and the chat model
+from a fake completions endpoint with configurable latency. MongoDB is an in-memory stand-in unless
+`--mongodb-uri` points at a real (local) server, which gives more realistic write numbers.
+
+Results are written as JSON; `--compare` reports the change against an earlier results file and
+exits with status 1 when a metric regressed by more than `--tolerance`.
+
+Usage:
+    python benchmark.py --output baseline.json
+    python benchmark.py --output current.json --compare baseline.json
+    python benchmark.py --only chatbot --users 32 --chat-latency 0.8
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import runpy
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from benchmark_fakes import FakeServices, install_config, listing_page, mongo_stand_in, use_mongo_client
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS = ["generator", "updater", "gatherer", "gatherer_batch", "chatbot"]
+# Direction of each reported metric, for --compare
+HIGHER_IS_BETTER = {"docs_per_second", "stories_per_minute", "requests_per_second"}
+LOWER_IS_BETTER = {"p50_seconds", "p95_seconds", "mean_seconds"}
+
+
+def run_script(name, *args, quiet=True):
+    """
+    Run one of the scripts as __main__ with the given command line arguments.
+    Returns:
+        float: Wall-clock seconds.
+    """
+    argv = sys.argv
+    sys.argv = [name, *args]
+    output = io.StringIO() if quiet else sys.stdout
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            runpy.run_path(os.path.join(HERE, name), run_name="__main__")
+    finally:
+        sys.argv = argv
+    return time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def bench_generator(collection, args, work_dir):
+    collection.delete_many({})
+    seconds = run_script("proofpoint-generator.py", "--count", str(args.docs), "--workers", str(args.workers),
+                         "--seed", "42", "--reference-date", "2024-01-01")
+    return {"docs": args.docs, "workers": args.workers, "seconds": round(seconds, 3),
+            "docs_per_second": round(args.docs / seconds, 1)}
+
+
+def bench_updater(collection, args, work_dir):
+    if collection.count_documents({}) == 0:
+        bench_generator(collection, args, work_dir)
+    collection.update_many({}, {"$unset": {"embeddings": ""}})
+    docs = collection.count_documents({})
+    seconds = run_script("proofpoint-updater.py", "--restart")
+    return {"docs": docs, "seconds": round(seconds, 3), "docs_per_second": round(docs / seconds, 1)}
+
+
+def bench_gatherer(collection, args, work_dir, *options):
+    listing = os.path.join(work_dir, "listing.html")
+    with open(listing, "w", encoding="utf-8") as file:
+        file.write(listing_page(args.stories))
+    existing = collection.distinct("_id")
+    seconds = run_script("proofpoint-gatherer.py", "--listing", listing, "--restart", *options)
+    # Leave the collection as the generator and updater produced it
+    written = collection.delete_many({"_id": {"$nin": existing}}).deleted_count
+    return {"stories": args.stories, "written": written, "seconds": round(seconds, 3),
+            "stories_per_minute": round(args.stories / seconds * 60, 1)}
+
+
+def bench_gatherer_batch(collection, args, work_dir):
+    return bench_gatherer(collection, args, work_dir, "--batch", "--batch-poll", str(args.batch_poll),
+                          "--batch-dir", os.path.join(work_dir, "batches"))
+
+
+def bench_chatbot(collection, args, work_dir):
+    if collection.count_documents({"embeddings.usecase_embedding": {"$exists": True}}) == 0:
+        bench_updater(collection, args, work_dir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        proofbot = runpy.run_path(os.path.join(HERE, "proofbot.py"), run_name="proofbot_benchmark")
+
+    questions = [f"How did customer {index} use MongoDB Atlas to reduce costs in {['retail', 'finance', 'gaming'][index % 3]}?"
+                 for index in range(args.questions)]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def user(offset):
+        for question in questions[offset::args.users]:
+            start = time.perf_counter()
+            try:
+                _, _, context = proofbot["retrieve_context"](question)
+                proofbot["make_rag_request"](question, context)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        threads = [threading.Thread(target=user, args=(offset,)) for offset in range(args.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    seconds = time.perf_counter() - start
+
+    result = {"users": args.users, "questions": len(latencies), "errors": len(errors), "seconds": round(seconds, 3),
+              "requests_per_second": round(len(latencies) / seconds, 2)}
+    if latencies:
+        result.update({"p50_seconds": round(percentile(latencies, 0.50), 4),
+                       "p95_seconds": round(percentile(latencies, 0.95), 4),
+                       "mean_seconds": round(statistics.mean(latencies), 4)})
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the change of every metric against a baseline results file.
+    Returns:
+        list[str]: Metrics that regressed by more than `tolerance` (a fraction).
+    """
+    regressions = []
+    for name, current in results["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        for metric, value in current.items():
+            if metric not in HIGHER_IS_BETTER | LOWER_IS_BETTER or not previous.get(metric):
+                continue
+            change = (value - previous[metric]) / previous[metric]
+            regressed = change < -tolerance if metric in HIGHER_IS_BETTER else change > tolerance
+            print(f"{name}.{metric}: {previous[metric]} -> {value} ({change:+.1%}){'  REGRESSION' if regressed else ''}")
+            if regressed:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the proof-points-rag pipelines against local stand-ins.")
+    parser.add_argument("--output", default="benchmark-results.json", help="Where to write the JSON results.")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS, help="Benchmarks to run.")
+    parser.add_argument("--docs", type=int, default=2000, help="Proof points to generate and embed.")
+    parser.add_argument("--workers", type=int, default=1, help="Generator processes.")
+    parser.add_argument("--stories", type=int, default=50, help="Customer stories to gather.")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent chatbot users.")
+    parser.add_argument("--questions", type=int, default=200, help="Chatbot questions in total.")
+    parser.add_argument("--dimension", type=int, default=384, help="Embedding dimension of the fake models.")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Seconds per fake embedding request.")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="Seconds per fake chat completion.")
+    parser.add_argument("--page-latency", type=float, default=0.05, help="Seconds per fake customer story page.")
+    parser.add_argument("--batch-latency", type=float, default=1.0, help="Seconds until a fake batch completes.")
+    parser.add_argument("--batch-poll", type=float, default=0.2, help="Seconds between batch status polls.")
+    parser.add_argument("--mongodb-uri", default=None, help="Use this MongoDB server instead of the in-memory stand-in.")
+    parser.add_argument("--compare", default=None, help="Results file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed regression as a fraction (default 10%%).")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="proofpoints-benchmark-")
+    with FakeServices(dimension=args.dimension, embed_latency=args.embed_latency, chat_latency=args.chat_latency,
+                      page_latency=args.page_latency, batch_latency=args.batch_latency) as services:
+        # The OpenAI SDK reads these when the scripts create their clients
+        os.environ["OPENAI_BASE_URL"] = services.url + "/v1"
+        os.environ["OPENAI_API_KEY"] = "benchmark"
+        install_config(
+            MONGODB_URI=args.mongodb_uri or "mongodb://localhost:27017",
+            MONGODB_DATABASE="proofpoints_benchmark",
+            MONGODB_COLLECTION="proofpoints",
+            NUM_PROOF_POINTS=args.docs,
+            HF_TOKEN="benchmark",
+            EMBEDDING_URL=services.url + "/embed",
+            EMBEDDING_MODEL="fake-embedding",
+            EMBEDDING_CACHE_PATH=os.path.join(work_dir, "embedding-cache.sqlite3"),
+            CUSTOMER_STORIES_BASE_URL=services.url,
+            RETRIEVAL_BACKEND="local",
+            # Measure the pipelines, not the client-side limiters or the answer cache
+            OPENAI_REQUESTS_PER_MINUTE=1_000_000,
+            OPENAI_TOKENS_PER_MINUTE=1_000_000_000,
+            EMBEDDING_REQUESTS_PER_MINUTE=1_000_000,
+            ANSWER_CACHE_THRESHOLD=2.0,
+            TIMING_LOG=os.path.join(work_dir, "timings.jsonl"),
+            JOURNAL_PATH=os.path.join(work_dir, "progress-journal.sqlite3"),
+            PAGE_CACHE_PATH=os.path.join(work_dir, "page-cache.sqlite3"),
+        )
+
+        if args.mongodb_uri:
+            from pymongo import MongoClient
+            mongo = contextlib.nullcontext(MongoClient(args.mongodb_uri))
+        else:
+            mongo = use_mongo_client(mongo_stand_in())
+        with mongo as client:
+            client.drop_database("proofpoints_benchmark")
+            collection = client["proofpoints_benchmark"]["proofpoints"]
+
+            results = {}
+            for name, bench in (("generator", bench_generator), ("updater", bench_updater),
+                                ("gatherer", bench_gatherer), ("gatherer_batch", bench_gatherer_batch),
+                                ("chatbot", bench_chatbot)):
+                if name not in args.only:
+                    continue
+                print(f"Running {name} benchmark...")
+                results[name] = bench(collection, args, work_dir)
+                print(f"  {results[name]}")
+            client.drop_database("proofpoints_benchmark")
+        fake_requests = dict(services.requests)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "mongodb": "server" if args.mongodb_uri else "in-memory stand-in",
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "mongodb_uri")},
+        "fake_requests": fake_requests,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
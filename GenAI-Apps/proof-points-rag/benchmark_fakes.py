@@ -0,0 +1,449 @@
+"""
+Summary:
+Local stand-ins for the external services of the proof-points-rag scripts, used by benchmark.py and the tests.
+
+- `FakeServices` is one threaded HTTP server that plays
+  - the HuggingFace feature-extraction endpoint (POST /embed) with deterministic vectors,
+  - the OpenAI embeddings and chat-completions API (POST /v1/embeddings, /v1/chat/completions,
+    streaming included) with configurable latency; extraction prompts get a proof point JSON back,
+    with null internal fields as for a public customer story,
+  - the OpenAI files and Batch API (POST /v1/files, GET /v1/files/<id>/content, POST /v1/batches,
+    GET /v1/batches/<id>), running a batch's chat completions `batch_latency` seconds after it is created,
+  - the customer story pages (GET /customers/<name>), with ETag revalidation.
+- `mongo_stand_in()` returns an in-memory MongoDB client (mongomock), and `use_mongo_client()`
+  makes the scripts' `MongoClient(...)` calls return it. Its unordered bulk writes report failing
+  operations in a `BulkWriteError` like a server does; `fail_write` makes chosen operations fail.
+- `legacy_proof_point()` and `change_event()` build the inputs of the less common paths: a document
+  with the flat `embeddings` array of earlier gatherer versions, and change stream events for replays.
+- `install_config()` provides the `config` module the scripts import, pointing at the fakes.
+
+Usage:
+    with FakeServices(chat_latency=0.3) as services:
+        install_config(MONGODB_URI="mongodb://localhost", EMBEDDING_URL=services.url + "/embed", ...)
+"""
+
+import email.parser
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import types
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "proofpoint-schema.json")
+
+
+def deterministic_vector(text, dimension):
+    """
+    Unit vector derived from the text only, so repeated runs embed identically.
+    """
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimension)]
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def sample_proof_point():
+    """
+    The example proof point of proofpoint-schema.json as plain JSON (ISODate values become strings).
+    """
+    from extraction_schema import load_example
+
+    def plain(value):
+        if isinstance(value, dict):
+            return value["$date"] if set(value) == {"$date"} else {key: plain(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [plain(item) for item in value]
+        return value
+
+    return plain(load_example(SCHEMA_PATH))
+
+
+def public_proof_point():
+    """
+    The sample proof point as extracted from a public customer story: the internal fields are null.
+    """
+    from extraction_schema import NULLABLE_FIELDS
+
+    document = sample_proof_point()
+    for path in ("champion.name", "champion.role", "champion.responsibilities", "account.owner",
+                 "account.date_signed", "account.sfdc_acc_link", "link_to_deck"):
+        assert path in NULLABLE_FIELDS, path
+        parent, _, key = path.rpartition(".")
+        (document[parent] if parent else document)[key] = None
+    return document
+
+
+def legacy_proof_point(dimension=1536):
+    """
+    The sample proof point as written by earlier gatherer versions, with the OpenAI vector as a flat `embeddings` array.
+    """
+    document = sample_proof_point()
+    document["embeddings"] = deterministic_vector(document["customer"]["company_name"], dimension)
+    return document
+
+
+_resume_tokens = itertools.count(1)
+
+
+def change_event(document, operation="update", document_id=None):
+    """
+    A change stream event (as returned with `full_document="updateLookup"`) for a document.
+    Args:
+        document (dict): The document after the change; ignored for deletes.
+        operation (str): "insert", "update", "replace" or "delete".
+        document_id: `_id` of the changed document; defaults to `document["_id"]`.
+    """
+    document_id = document["_id"] if document_id is None else document_id
+    event = {"_id": {"_data": f"{next(_resume_tokens):016x}"}, "operationType": operation,
+             "documentKey": {"_id": document_id}}
+    if operation != "delete":
+        event["fullDocument"] = document
+    return event
+
+
+def story_page(name):
+    """
+    A customer story page shaped like the mongodb.com ones.
+    """
+    paragraphs = "".join(f"<p>{name} paragraph {index}: MongoDB Atlas helped {name} scale its platform and reduce costs.</p>"
+                         for index in range(12))
+    return (f"<html><head><style>p {{}}</style></head><body><h1>{name} builds on MongoDB Atlas</h1>"
+            f"<h2>The Challenge</h2>{paragraphs}<h2>The Solution</h2>{paragraphs}"
+            f"<blockquote>We can innovate faster.<cite>CTO, {name}</cite></blockquote></body></html>")
+
+
+def listing_page(count):
+    """
+    A customer listing page with `count` customer containers, as read by proofpoint-gatherer.py.
+    """
+    containers = "".join(
+        '<div class="who-uses-mongodb__CustomerContainer-sc-1047abz-1 jERciZ">'
+        f'<a href="/customers/bench-{index}">story</a>'
+        f'<div class="relative"><img src="/logos/bench-{index}.png"/></div>'
+        f'<div class="fnt-18 dark-gray m-b-20"><span>Customer {index} scales with Atlas</span></div></div>'
+        for index in range(count))
+    return f"<html><body>{containers}</body></html>"
+
+
+class FakeServices:
+    """
+    Local HTTP server standing in for HuggingFace, OpenAI and the customer story site.
+    Args:
+        dimension (int): Embedding dimension.
+        embed_latency (float): Seconds added to every embedding request.
+        chat_latency (float): Seconds before a chat completion (or its first streamed token) is returned.
+        page_latency (float): Seconds added to every story page.
+        answer_words (int): Words in a chatbot answer; streamed in chunks of a few words.
+        batch_latency (float): Seconds from creating a batch until it is completed.
+        port (int): Port to listen on; 0 picks a free one.
+    """
+
+    def __init__(self, dimension=384, embed_latency=0.02, chat_latency=0.3, page_latency=0.05, answer_words=120,
+                 batch_latency=1.0, port=0):
+        self.dimension = dimension
+        self.embed_latency = embed_latency
+        self.chat_latency = chat_latency
+        self.page_latency = page_latency
+        self.answer_words = answer_words
+        self.batch_latency = batch_latency
+        self.requests = {"embed": 0, "openai_embeddings": 0, "chat": 0, "pages": 0, "batches": 0, "batch_requests": 0}
+        self.files = {}
+        self.batches = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._proof_point = json.dumps(public_proof_point())
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-services", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.requests[name] += amount
+
+    def _new_id(self, prefix):
+        with self._lock:
+            return f"{prefix}-fake-{next(self._ids)}"
+
+    def completion(self, body):
+        """
+        Answer and usage of a chat completion request.
+        """
+        messages = body.get("messages", [])
+        prompt_tokens = sum(len(message.get("content", "")) // 4 for message in messages)
+        # Extraction prompts (proofpoint-gatherer.py) ask for a json document
+        if "json document" in messages[0].get("content", ""):
+            answer = self._proof_point
+        else:
+            answer = " ".join(f"word{index}" for index in range(self.answer_words))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(answer) // 4,
+                 "total_tokens": prompt_tokens + len(answer) // 4}
+        return answer, usage
+
+    def add_file(self, content, filename, purpose):
+        file_id = self._new_id("file")
+        self.files[file_id] = {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                               "filename": filename, "purpose": purpose, "status": "processed", "content": content}
+        return {key: value for key, value in self.files[file_id].items() if key != "content"}
+
+    def create_batch(self, body):
+        self._count("batches")
+        lines = [json.loads(line) for line in self.files[body["input_file_id"]]["content"].decode("utf-8").splitlines() if line.strip()]
+        batch_id = self._new_id("batch")
+        batch = {"id": batch_id, "object": "batch", "endpoint": body["endpoint"], "input_file_id": body["input_file_id"],
+                 "completion_window": body["completion_window"], "status": "in_progress", "created_at": int(time.time()),
+                 "metadata": body.get("metadata"), "output_file_id": None, "error_file_id": None,
+                 "request_counts": {"total": len(lines), "completed": 0, "failed": 0}}
+        self.batches[batch_id] = batch
+
+        def run():
+            time.sleep(self.batch_latency)
+            results = []
+            for index, line in enumerate(lines):
+                answer, usage = self.completion(line["body"])
+                results.append(json.dumps({"id": f"batch_req_{index}", "custom_id": line["custom_id"], "error": None, "response": {
+                    "status_code": 200, "request_id": f"req_{index}", "body": {
+                        "id": f"chatcmpl-fake-{index}", "object": "chat.completion", "created": int(time.time()),
+                        "model": line["body"].get("model", "fake"), "usage": usage,
+                        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": answer}}]}}}))
+            self._count("batch_requests", len(lines))
+            output = self.add_file("\n".join(results).encode("utf-8"), f"{batch_id}_output.jsonl", "batch_output")
+            batch.update(status="completed", output_file_id=output["id"], completed_at=int(time.time()),
+                         request_counts={"total": len(lines), "completed": len(lines), "failed": 0})
+
+        threading.Thread(target=run, name=f"fake-{batch_id}", daemon=True).start()
+        return batch
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so pooled clients behave as they do against the real services
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json"):
+                data = body.encode("utf-8") if isinstance(body, str) else body
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self):
+                return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+            def do_GET(self):
+                if self.path.startswith("/v1/files/") and self.path.endswith("/content"):
+                    file = services.files.get(self.path.split("/")[3])
+                    if file is None:
+                        self._send(404, "{}")
+                    else:
+                        self._send(200, file["content"], "application/octet-stream")
+                elif self.path.startswith("/v1/batches/"):
+                    batch = services.batches.get(self.path.rsplit("/", 1)[-1])
+                    if batch is None:
+                        self._send(404, "{}")
+                    else:
+                        self._send(200, json.dumps(batch))
+                elif self.path.startswith("/customers/"):
+                    services._count("pages")
+                    time.sleep(services.page_latency)
+                    page = story_page(self.path.rsplit("/", 1)[-1])
+                    etag = '"' + hashlib.sha256(page.encode("utf-8")).hexdigest()[:16] + '"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(200)
+                    self.send_header("ETag", etag)
+                    data = page.encode("utf-8")
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                else:
+                    self._send(404, "{}")
+
+            def do_POST(self):
+                if self.path == "/v1/files":
+                    self._upload()
+                    return
+                body = self._body()
+                if self.path == "/v1/batches":
+                    self._send(200, json.dumps(services.create_batch(body)))
+                elif self.path == "/embed":
+                    services._count("embed")
+                    time.sleep(services.embed_latency)
+                    inputs = body["inputs"] if isinstance(body["inputs"], list) else [body["inputs"]]
+                    self._send(200, json.dumps([deterministic_vector(text, services.dimension) for text in inputs]))
+                elif self.path == "/v1/embeddings":
+                    services._count("openai_embeddings")
+                    time.sleep(services.embed_latency)
+                    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                    self._send(200, json.dumps({
+                        "object": "list",
+                        "model": body.get("model", "fake"),
+                        "data": [{"object": "embedding", "index": index,
+                                  "embedding": deterministic_vector(text, services.dimension)}
+                                 for index, text in enumerate(inputs)],
+                        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                    }))
+                elif self.path == "/v1/chat/completions":
+                    services._count("chat")
+                    self._chat(body)
+                else:
+                    self._send(404, "{}")
+
+            def _upload(self):
+                # multipart/form-data with a "purpose" field and a "file" part
+                data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                message = email.parser.BytesParser().parsebytes(
+                    f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + data)
+                fields = {part.get_param("name", header="Content-Disposition"): part for part in message.get_payload()}
+                file = fields["file"]
+                purpose = fields["purpose"].get_payload(decode=True).decode("utf-8")
+                self._send(200, json.dumps(services.add_file(file.get_payload(decode=True), file.get_filename(), purpose)))
+
+            def _chat(self, body):
+                answer, usage = services.completion(body)
+                completion = {"id": "chatcmpl-fake", "created": int(time.time()), "model": body.get("model", "fake")}
+                time.sleep(services.chat_latency)
+
+                if not body.get("stream"):
+                    self._send(200, json.dumps({
+                        **completion, "object": "chat.completion", "usage": usage,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": answer}}],
+                    }))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def event(payload):
+                    data = f"data: {payload}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+
+                words = answer.split(" ")
+                for start in range(0, len(words), 5):
+                    event(json.dumps({**completion, "object": "chat.completion.chunk", "choices": [
+                        {"index": 0, "delta": {"content": " ".join(words[start:start + 5]) + " "}, "finish_reason": None}]}))
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    event(json.dumps({**completion, "object": "chat.completion.chunk", "choices": [], "usage": usage}))
+                event("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+
+def mongo_stand_in(fail_write=None):
+    """
+    In-memory MongoDB client for runs without a database server (requires mongomock).
+    Args:
+        fail_write (callable): Called with every bulk write operation; operations it returns true for
+            fail with a document validation error. Can also be set later as `client.fail_write`.
+    """
+    import mongomock
+    import mongomock.collection
+    from pymongo import InsertOne, ReplaceOne, UpdateOne
+    from pymongo.errors import BulkWriteError, WriteError
+    from pymongo.results import BulkWriteResult
+
+    def bulk_write(collection, requests, ordered=True, **kwargs):
+        # mongomock's bulk_write does not understand the operations of current pymongo releases
+        result = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nUpserted": 0, "writeErrors": [], "upserted": []}
+        fail = getattr(collection.database.client, "fail_write", None)
+        for index, request in enumerate(requests):
+            try:
+                if fail is not None and fail(request):
+                    raise WriteError("Document failed validation", 121)
+                if isinstance(request, InsertOne):
+                    collection.insert_one(request._doc)
+                    result["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, ReplaceOne)):
+                    write = collection.update_one if isinstance(request, UpdateOne) else collection.replace_one
+                    update = write(request._filter, request._doc, upsert=request._upsert)
+                    result["nMatched"] += update.matched_count
+                    result["nModified"] += update.modified_count
+                    result["nUpserted"] += update.upserted_id is not None
+                else:
+                    raise NotImplementedError(f"{request.__class__.__name__} is not supported by the Mongo stand-in")
+            except WriteError as e:
+                # Like the server: an unordered batch writes the other operations, an ordered one stops here
+                result["writeErrors"].append({"index": index, "code": e.code, "errmsg": str(e), "op": request._doc})
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    project_by_spec = mongomock.collection._project_by_spec
+
+    def project_scalar_arrays(doc, spec, is_include, container):
+        # Projecting a field inside an array of scalars (a legacy flat `embeddings` array) returns
+        # the array without its scalars on a server; mongomock fails on it
+        if is_include:
+            doc = {key: [item for item in value if isinstance(item, (dict, list))]
+                   if isinstance(value, list) and isinstance(spec.get(key), dict) else value
+                   for key, value in doc.items()}
+        return project_by_spec(doc, spec, is_include, container)
+
+    mongomock.collection.Collection.bulk_write = bulk_write
+    if not hasattr(project_by_spec, "scalar_arrays"):
+        project_scalar_arrays.scalar_arrays = True
+        mongomock.collection._project_by_spec = project_scalar_arrays
+    client = mongomock.MongoClient()
+    client.fail_write = fail_write
+    return client
+
+
+@contextmanager
+def use_mongo_client(client):
+    """
+    Make `MongoClient(...)` in the scripts return `client` while the block runs.
+    """
+    import pymongo
+    import pymongo.mongo_client
+
+    original = pymongo.mongo_client.MongoClient
+    factory = lambda *args, **kwargs: client
+    pymongo.mongo_client.MongoClient = factory
+    pymongo.MongoClient = factory
+    try:
+        yield client
+    finally:
+        pymongo.mongo_client.MongoClient = original
+        pymongo.MongoClient = original
+
+
+def install_config(**values):
+    """
+    Register a `config` module whose `Config` class holds `values`, in place of the local config.py.
+    """
+    module = types.ModuleType("config")
+    module.Config = type("Config", (), values)
+    sys.modules["config"] = module
+    return module.Config
@@ -0,0 +1,161 @@
+"""
+Summary:
+Buffered writer that batches MongoDB write operations into unordered `bulk_write` calls.
+
+Operations are accumulated until the batch reaches its operation count, then flushed in one
+round-trip. Batches are bounded by count only: pymongo encodes the batch anyway and splits it into
+messages within the server's `maxMessageSizeBytes` and `maxWriteBatchSize`, so encoding every
+operation here just to measure it would double the encoding work. Each flush reports its latency. Partial failures (duplicate keys, validation errors, ...) do not abort the run,
+so one bad document does not stop a backfill of millions: every operation can carry a caller key
+(a story url, a document `_id`), and `flush()` returns the keys and errors of the operations that
+failed, so callers only record the others as written. If the bulk write fails as a whole (a network
+error), the operations stay queued for the next flush and the error is raised; after `max_retries`
+failed flushes in a row they are dropped and reported as failed, so an unreachable server does not
+grow the buffer without bound.
+
+Usage:
+    from bulk_writer import BulkWriter
+
+    writer = BulkWriter(collection)
+    for document in documents:
+        writer.insert_one(document, key=document["_id"])
+    failed = writer.flush()  # [(key, error message), ...]
+    print(writer.stats())
+"""
+
+import threading
+import time
+from pymongo import InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+class BulkWriter:
+    """
+    Accumulates write operations and flushes them as unordered bulk writes.
+    Args:
+        collection: Target pymongo collection.
+        max_ops (int): Maximum number of operations per batch.
+        max_retries (int): Failed flushes in a row after which the queued operations are dropped
+            and reported as failed instead of being kept for the next flush.
+        verbose (bool): Print latency and failures for each flushed batch.
+    """
+
+    def __init__(self, collection, max_ops=1000, max_retries=3, verbose=True):
+        self.collection = collection
+        self.max_ops = max_ops
+        self.max_retries = max_retries
+        self.verbose = verbose
+
+        self._ops = []
+        self._keys = []
+        self._failed_flushes = 0
+        # Failed operations of the batches flushed since the last flush() call
+        self._failures = []
+        self._lock = threading.Lock()
+        self._stats = {"batches": 0, "operations": 0, "inserted": 0, "matched": 0, "modified": 0,
+                       "upserted": 0, "failed": 0, "seconds": 0.0}
+
+    def insert_one(self, document: dict, key=None):
+        """
+        Queue an insert of a document.
+        """
+        self.add(InsertOne(document), key=key)
+
+    def update_one(self, filter: dict, update: dict, upsert: bool = False, key=None):
+        """
+        Queue an update of a single document.
+        """
+        self.add(UpdateOne(filter, update, upsert=upsert), key=key)
+
+    def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, key=None):
+        """
+        Queue a replacement of a single document; with `upsert`, an idempotent insert.
+        """
+        self.add(ReplaceOne(filter, replacement, upsert=upsert), key=key)
+
+    def add(self, operation, key=None):
+        """
+        Queue a pymongo write operation, flushing when the batch is full.
+        Args:
+            operation: InsertOne, UpdateOne, ReplaceOne, DeleteOne, ... instance.
+            key: Caller key reported by flush() if the operation fails.
+        """
+        with self._lock:
+            self._ops.append(operation)
+            self._keys.append(key)
+            if len(self._ops) >= self.max_ops:
+                self._flush_locked()
+
+    def flush(self) -> list:
+        """
+        Write all queued operations.
+        Returns:
+            list[tuple]: (key, error message) of every operation that failed since the previous
+                flush() call, including batches flushed automatically while queueing.
+        Raises:
+            PyMongoError: The bulk write failed as a whole; its operations stay queued, or are
+                reported as failed by the next flush() once `max_retries` flushes failed in a row.
+        """
+        with self._lock:
+            self._flush_locked()
+            failures, self._failures = self._failures, []
+            return failures
+
+    def stats(self) -> dict:
+        """
+        Return totals across all flushed batches.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _flush_locked(self):
+        if not self._ops:
+            return
+        ops, keys = self._ops, self._keys
+        self._ops, self._keys = [], []
+
+        start = time.perf_counter()
+        failed = 0
+        try:
+            result = self.collection.bulk_write(ops, ordered=False)
+            counts = result.bulk_api_result
+        except BulkWriteError as bwe:
+            # Unordered batches keep writing past individual failures; report them to the caller and carry on
+            counts = bwe.details
+            errors = counts.get("writeErrors", [])
+            failed = len(errors)
+            self._failures.extend((keys[error["index"]], error.get("errmsg")) for error in errors)
+            for error in errors[:3]:
+                print(f"Bulk write error at index {error.get('index')}: {error.get('errmsg')}")
+        except Exception as e:
+            self._failed_flushes += 1
+            if self._failed_flushes > self.max_retries:
+                # Give up on these operations rather than buffering without bound
+                print(f"Bulk write failed {self._failed_flushes} times in a row, dropping {len(ops)} operations: {e!r}")
+                self._failures.extend((key, repr(e)) for key in keys)
+                self._stats["failed"] += len(ops)
+                self._failed_flushes = 0
+            else:
+                # Nothing is known to be written; keep the operations for the next flush
+                self._ops, self._keys = ops + self._ops, keys + self._keys
+            raise
+        self._failed_flushes = 0
+        elapsed = time.perf_counter() - start
+
+        self._stats["batches"] += 1
+        self._stats["operations"] += len(ops)
+        self._stats["inserted"] += counts.get("nInserted", 0)
+        self._stats["matched"] += counts.get("nMatched", 0)
+        self._stats["modified"] += counts.get("nModified", 0)
+        self._stats["upserted"] += counts.get("nUpserted", 0)
+        self._stats["failed"] += failed
+        self._stats["seconds"] += elapsed
+
+        if self.verbose:
+            print(f"Bulk write: {len(ops)} operations in {elapsed * 1000:.0f} ms ({failed} failed)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
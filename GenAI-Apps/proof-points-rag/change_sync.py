@@ -0,0 +1,282 @@
+"""
+Summary:
+Keeps embeddings, local vector indexes and answer caches in step with the proof point collection
+by consuming MongoDB change events instead of rescanning.
+
+For every insert, update or replace the use case text is fingerprinted and only re-embedded when
+the fingerprint changed; documents with chunk embeddings (or every document, with `chunks`) are
+re-chunked and their chunks re-embedded the same way. The new vectors are pushed into the local
+retriever (the use case index, or the chunk index of a `ChunkRetriever`) and answers that used the
+document are dropped from the answer cache. Deletes remove the document from both. The resume
+token of the last processed event is persisted, so a restarted worker continues where it stopped.
+
+A failing event (an embedding or database error) is retried a few times with backoff, then logged
+and skipped, so one bad event does not stop the worker; `follow` also reopens the change stream
+after the last processed event when the stream itself fails, with growing delays and up to
+`max_reconnects` failures in a row. A resume token the server can no longer resume from (the oplog
+rolled past it) is not retried: the token is dropped, the stream is reopened at the current cluster
+time and every document is rescanned, which the fingerprints make cheap for unchanged documents.
+
+Events come from `watch_events` (a live change stream) or `replay_events` (a JSONL file of
+recorded change events in MongoDB Extended JSON), which stands in for the change stream in tests.
+"""
+
+import os
+import threading
+import time
+from bson import json_util
+from bson.binary import Binary, BinaryVectorDtype
+from pymongo.errors import OperationFailure
+from usecase_text import build_usecase_chunks, build_usecase_text, chunks_fingerprint, usecase_fingerprint
+
+OPERATIONS = ["insert", "update", "replace", "delete"]
+# InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost: resuming can never succeed
+RESUME_FAILED_CODES = {260, 280, 286}
+
+
+class ResumeTokenStore:
+    """
+    Persists the resume token of the last processed change event in a small JSON file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "r", encoding="utf-8") as file:
+            return json_util.loads(file.read())["resume_token"]
+
+    def save(self, token):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(json_util.dumps({"resume_token": token}))
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def watch_events(collection, resume_token=None, start_at=None):
+    """
+    Yield insert/update/replace/delete events from the collection's change stream, after the
+    resume token, or from the `start_at` cluster time when there is no token.
+    """
+    pipeline = [{"$match": {"operationType": {"$in": OPERATIONS}}}]
+    with collection.watch(pipeline, full_document="updateLookup", resume_after=resume_token,
+                          start_at_operation_time=None if resume_token else start_at) as stream:
+        for event in stream:
+            yield event
+
+
+def replay_events(path):
+    """
+    Yield recorded change events from a JSONL file (one Extended JSON event per line).
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json_util.loads(line)
+
+
+class ProofPointSync:
+    """
+    Applies change events to embeddings, a local retriever and an answer cache.
+    Args:
+        collection: Proof point collection the re-embedded vectors are written to.
+        embedding_client (EmbeddingClient): Client used to re-embed changed documents, or None to
+            only maintain the index and cache.
+        retriever (LocalRetriever | ChunkRetriever): Local retriever whose index (and documents) are kept current.
+        answer_cache (SemanticAnswerCache): Answer cache to invalidate.
+        token_store (ResumeTokenStore): Where the resume token is persisted, or None.
+        chunks (bool): Embed the chunks of every document; documents that already have chunk
+            embeddings are always kept current.
+        retries (int): Retries of a failing event before it is skipped.
+        retry_delay (float): Seconds before the first retry; doubled for every further one.
+    """
+
+    def __init__(self, collection, embedding_client=None, retriever=None, answer_cache=None, token_store=None,
+                 chunks=False, retries=3, retry_delay=1.0):
+        self.collection = collection
+        self.embedding_client = embedding_client
+        self.retriever = retriever
+        self.answer_cache = answer_cache
+        self.token_store = token_store
+        self.chunks = chunks
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.resume_token = None
+        self.stats = {"events": 0, "reembedded": 0, "rechunked": 0, "indexed": 0, "deleted": 0, "skipped": 0,
+                      "failed": 0, "reconnects": 0, "rescans": 0}
+
+    def run(self, events):
+        """
+        Process events until the source is exhausted (a replay) or closed (a change stream).
+        """
+        for event in events:
+            self.process(event)
+
+    def follow(self, resume_token=None, max_delay=300.0, max_reconnects=10):
+        """
+        Tail the collection's change stream until it is closed, reopening it after the last processed
+        event (with growing delays) whenever it fails. A token that cannot be resumed from is dropped
+        and the collection rescanned.
+        Raises:
+            Exception: The stream failed `max_reconnects` times in a row without delivering an event.
+        """
+        self.resume_token = resume_token
+        start_at = None
+        delay = self.retry_delay
+        failures = 0
+        while True:
+            try:
+                for event in watch_events(self.collection, self.resume_token, start_at):
+                    self.process(event)
+                    delay = self.retry_delay
+                    failures = 0
+                return
+            except Exception as e:
+                failures += 1
+                if failures > max_reconnects:
+                    print(f"Change stream failed {failures} times in a row; giving up")
+                    raise
+                if isinstance(e, OperationFailure) and e.code in RESUME_FAILED_CODES:
+                    # Retrying the same token fails the same way; start over from now and catch up by rescanning
+                    print(f"Change stream cannot resume ({e}); rescanning the collection")
+                    start_at = self._cluster_time()
+                    self.resume_token = None
+                    if self.token_store is not None:
+                        self.token_store.clear()
+                    self.rescan()
+                    continue
+                self.stats["reconnects"] += 1
+                print(f"Change stream failed ({e!r}); reopening in {delay:.0f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, max_delay)
+
+    def rescan(self):
+        """
+        Apply every document of the collection as if it had changed (after changes were missed).
+        """
+        self.stats["rescans"] += 1
+        for document in self.collection.find():
+            try:
+                self.handle({"operationType": "replace", "documentKey": {"_id": document["_id"]}, "fullDocument": document})
+            except Exception as e:
+                print(f"Skipping {document['_id']} in the rescan: {e!r}")
+                self.stats["failed"] += 1
+
+    def _cluster_time(self):
+        # Operation time of the server now, so the reopened stream also delivers changes made during the rescan
+        try:
+            return self.collection.database.command("ping").get("operationTime")
+        except Exception:
+            return None
+
+    def process(self, event):
+        """
+        Handle one event with bounded retries, then save its resume token; an event that keeps
+        failing is logged and skipped.
+        """
+        self.stats["events"] += 1
+        for attempt in range(self.retries + 1):
+            try:
+                self.handle(event)
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    print(f"Skipping change event for {event.get('documentKey')} after {attempt + 1} attempts: {e!r}")
+                    self.stats["failed"] += 1
+                else:
+                    time.sleep(self.retry_delay * 2 ** attempt)
+        self.resume_token = event["_id"]
+        if self.token_store is not None:
+            self.token_store.save(event["_id"])
+
+    def handle(self, event):
+        document_id = event["documentKey"]["_id"]
+
+        if event["operationType"] == "delete":
+            self._remove(document_id)
+            return
+
+        document = event.get("fullDocument")
+        if document is None:
+            # The document was deleted before the update could be looked up
+            self._remove(document_id)
+            return
+
+        if self.embedding_client is not None:
+            self._reembed(document_id, document)
+
+        if self.retriever is not None and self.retriever.upsert_document(document_id, document):
+            self.stats["indexed"] += 1
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate(document_id)
+
+    def _reembed(self, document_id, document):
+        # Re-embed the use case text and the chunks whose fingerprint changed, in one request and one update;
+        # our own embedding writes come back as events, and the fingerprints make them no-ops
+        embeddings = document.get("embeddings")
+        if not isinstance(embeddings, dict):
+            embeddings = {}
+        model_id = self.embedding_client.model_id
+        try:
+            text = build_usecase_text(document)
+            chunks = build_usecase_chunks(document) if self.chunks or "chunks" in embeddings else None
+        except (KeyError, TypeError, AttributeError):
+            print(f"Skipping {document_id}: no use case text to embed")
+            self.stats["skipped"] += 1
+            return
+
+        update = {}
+        texts = []
+        fingerprint = usecase_fingerprint(text, model_id)
+        if embeddings.get("usecase_fingerprint") != fingerprint:
+            texts.append(text)
+        if chunks is not None and embeddings.get("chunks_fingerprint") == chunks_fingerprint(chunks, model_id):
+            chunks = None
+        texts.extend(chunk_text for _, chunk_text in chunks or [])
+        if not texts:
+            return
+        vectors = iter(self.embedding_client.embed(texts))
+
+        if embeddings.get("usecase_fingerprint") != fingerprint:
+            update.update({"usecase_embedding": next(vectors), "usecase_fingerprint": fingerprint, "model": model_id})
+            self.stats["reembedded"] += 1
+        if chunks is not None:
+            update["chunks"] = [{"path": path, "embedding": Binary.from_vector(next(vectors), BinaryVectorDtype.FLOAT32)}
+                                for path, _ in chunks]
+            update["chunks_fingerprint"] = chunks_fingerprint(chunks, model_id)
+            self.stats["rechunked"] += 1
+        if isinstance(document.get("embeddings"), list):
+            # A flat array written by an earlier gatherer version; fields cannot be set inside it
+            self.collection.update_one({"_id": document_id}, {"$set": {
+                "embeddings": {"openai_embedding": document["embeddings"], **update}}})
+        else:
+            self.collection.update_one({"_id": document_id}, {"$set": {
+                f"embeddings.{key}": value for key, value in update.items()}})
+        document["embeddings"] = {**embeddings, **update}
+
+    def _remove(self, document_id):
+        if self.retriever is not None:
+            self.retriever.delete_document(document_id)
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate(document_id)
+        self.stats["deleted"] += 1
+
+
+def start_background_sync(collection, retriever=None, answer_cache=None):
+    """
+    Keep an in-process local (use case or chunk) retriever and answer cache current from a daemon
+    thread tailing the change stream. Re-embedding is left to proofpoint-sync.py; this only applies
+    its results. Failing events are skipped and a failed stream is reopened, so the thread keeps running.
+    Returns:
+        threading.Thread: The started thread.
+    """
+    sync = ProofPointSync(collection, retriever=retriever, answer_cache=answer_cache)
+    thread = threading.Thread(target=sync.follow, name="proofpoint-sync", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,199 @@
+"""
+Summary:
+Assembles the chatbot context from the retrieved proof points within a token budget.
+
+Every retrieved document is split into sections (overview, introduction, each challenge, solution
+and result, quotes, metrics). Sections are ranked by relevance to the question: the rank of their
+document, whether chunk retrieval matched them, and the overlap of their words with the question.
+Repeated paragraphs and quotes are dropped (a paragraph repeated exactly, or a passage of at least
+`MIN_CONTAINED_CHARS` characters contained in one already included), and the best sections are packed into the budget,
+trimming the last one at a sentence boundary. The selected sections are rendered compactly, grouped
+by document, instead of the Python repr of the whole `usecase` sub-document.
+
+Tokens are counted with the model's tokenizer only when the optional `tiktoken` package is installed
+(it is not a dependency of these scripts). Without it every count is the `estimate_tokens` heuristic
+of about 4 characters per token, so the budget is approximate: English prose usually comes out
+within about 10% of the real count, but leave headroom below the model's context limit.
+
+Usage:
+    from context_budget import build_context
+
+    context = build_context(question, documents, budget=2000, model="gpt-4-turbo-preview")
+"""
+
+import re
+from functools import lru_cache
+from rate_limiter import estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_WORD = re.compile(r"[a-z0-9]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# Words that carry no relevance signal when matching the question against sections
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its me of on or our "
+    "that the their they this to us was we what when where which who why will with you your".split()
+)
+# Shorter paragraphs ("Results", a one-line metric) are only dropped when repeated exactly
+MIN_CONTAINED_CHARS = 80
+
+
+@lru_cache(maxsize=8)
+def _encoding(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model=None):
+    """
+    Number of tokens of `text` for `model`, estimated when tiktoken is not installed.
+    """
+    if tiktoken is None or model is None:
+        return estimate_tokens(text)
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+
+def _terms(text):
+    return {word for word in _WORD.findall(text.lower()) if word not in STOPWORDS}
+
+
+def _normalized(text):
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def _repeats(normalized, seen):
+    # Whether a normalized paragraph repeats one already included, or is (or contains) a long passage of one
+    for other in seen:
+        if normalized == other:
+            return True
+        shorter, longer = (normalized, other) if len(normalized) <= len(other) else (other, normalized)
+        if len(shorter) >= MIN_CONTAINED_CHARS and shorter in longer:
+            return True
+    return False
+
+
+def document_sections(document):
+    """
+    Split a proof point into renderable sections.
+    Returns:
+        list[tuple]: (path, label, paragraphs) in document order; `path` matches the chunk paths of usecase_text.
+    """
+    usecase = document.get("usecase", {})
+    sections = []
+    if usecase.get("overview"):
+        sections.append(("usecase.overview", "Overview", [usecase["overview"]]))
+    introduction = usecase.get("introduction")
+    if isinstance(introduction, dict):
+        sections.append(("usecase.introduction", introduction.get("heading") or "Introduction",
+                         introduction.get("paragraphs", [])))
+    for section, label in (("challenges", "Challenge"), ("solutions", "Solution"), ("results", "Result")):
+        for index, item in enumerate(usecase.get(section) or []):
+            heading = item.get("heading", "")
+            sections.append((f"usecase.{section}.{index}", f"{label}: {heading}" if heading else label,
+                             item.get("paragraphs", [])))
+    for index, quote in enumerate(usecase.get("quotes") or []):
+        sections.append((f"usecase.quotes.{index}", "Quote",
+                         [f'"{quote.get("quote", "")}" - {quote.get("person", "")}, {quote.get("role", "")}']))
+    metrics = [f'{metric.get("kpi", "")}: {metric.get("result", "")}' for metric in usecase.get("metrics") or []]
+    if metrics:
+        sections.append(("usecase.metrics", "Metrics", ["; ".join(metrics)]))
+    return sections
+
+
+def _document_header(document):
+    customer = document.get("customer", {})
+    usecase = document.get("usecase", {})
+    details = ", ".join(value for value in (customer.get("company_name"), customer.get("industry"), usecase.get("type"))
+                        if value)
+    return f'# {usecase.get("title", "Proof point")}' + (f" ({details})" if details else "")
+
+
+def _trim(paragraphs, budget, model):
+    # Keep whole sentences from the start of the section while they fit
+    kept, used = [], 0
+    for paragraph in paragraphs:
+        sentences = []
+        for sentence in _SENTENCE_END.split(paragraph):
+            cost = count_tokens(sentence + " ", model)
+            if used + cost > budget:
+                break
+            sentences.append(sentence)
+            used += cost
+        if sentences:
+            kept.append(" ".join(sentences))
+        if len(sentences) < len(_SENTENCE_END.split(paragraph)):
+            break
+    return kept
+
+
+def build_context(question, documents, budget=2000, model=None, min_section_tokens=40):
+    """
+    Pack the most relevant sections of the retrieved documents into `budget` tokens.
+    Args:
+        question (str): The user's question.
+        documents (list[dict]): Retrieved proof points, best first; may carry `matched_sections` from chunk retrieval.
+        budget (int): Maximum tokens of the rendered context.
+        model (str): Chat model whose tokenizer counts the tokens.
+        min_section_tokens (int): Smallest trimmed section worth including when the budget runs out.
+    Returns:
+        str: Compact rendering of the selected sections, grouped by document.
+    """
+    question_terms = _terms(question)
+    candidates = []
+    for rank, document in enumerate(documents):
+        matched = document.get("matched_sections", [])
+        for order, (path, label, paragraphs) in enumerate(document_sections(document)):
+            terms = _terms(label + " " + " ".join(paragraphs))
+            overlap = len(question_terms & terms) / (len(question_terms) or 1)
+            score = 1.0 / (1 + rank) + overlap
+            if path in matched:
+                # Chunk retrieval matched this section; earlier matches ranked higher
+                score += 1.0 / (1 + matched.index(path))
+            candidates.append((score, rank, order, path, label, paragraphs))
+    candidates.sort(key=lambda candidate: (-candidate[0], candidate[1], candidate[2]))
+
+    seen = []
+    selected = {}
+    headers = {}
+    used = 0
+    for score, rank, order, path, label, paragraphs in candidates:
+        # Drop paragraphs (and quotes) already included from another section or document
+        unique = []
+        for paragraph in paragraphs:
+            normalized = _normalized(paragraph)
+            if normalized and not _repeats(normalized, seen):
+                unique.append(paragraph)
+        if not unique:
+            continue
+
+        header_cost = 0 if rank in headers else count_tokens(_document_header(documents[rank]) + "\n", model)
+        remaining = budget - used - header_cost
+        cost = count_tokens(f"## {label}\n" + "\n".join(unique) + "\n", model)
+        if cost > remaining:
+            if remaining < min_section_tokens:
+                continue
+            unique = _trim(unique, remaining - count_tokens(f"## {label}\n", model), model)
+            if not unique:
+                continue
+            cost = count_tokens(f"## {label}\n" + "\n".join(unique) + "\n", model)
+
+        if rank not in headers:
+            headers[rank] = _document_header(documents[rank])
+            used += header_cost
+        selected.setdefault(rank, []).append((order, label, unique))
+        seen.extend(_normalized(paragraph) for paragraph in unique)
+        used += cost
+
+    blocks = []
+    for rank in sorted(selected):
+        lines = [headers[rank]]
+        for _, label, paragraphs in sorted(selected[rank]):
+            lines.append(f"## {label}")
+            lines.extend(paragraphs)
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
@@ -0,0 +1,202 @@
+"""
+Summary:
+Persistent, content-addressed cache for text embeddings shared by the proof-points-rag scripts.
+
+Entries are keyed by a SHA-256 of the model id and the whitespace-normalized text, and the vectors
+are stored as float32 blobs in a local SQLite file. The cache is bounded by entry count and total
+vector bytes, evicting the least recently used entries first, and keeps hit/miss counters so reruns
+can report how many network calls were skipped.
+
+Usage:
+    from embedding_cache import get_embedding_cache
+
+    cache = get_embedding_cache()
+    vectors = cache.get_or_compute("text-embedding-3-small", texts, compute_fn)
+    print(cache.stats())
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from config import Config
+from metrics import CACHE_REQUESTS
+
+
+def normalize_text(text: str) -> str:
+    """
+    Collapse whitespace so formatting-only differences map to the same cache entry.
+    """
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def cache_key(model: str, text: str) -> bytes:
+    """
+    Content address of a (model id, text) pair.
+    """
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed embedding cache with LRU eviction.
+    Args:
+        path (str): Path of the SQLite file.
+        max_entries (int): Maximum number of cached vectors.
+        max_bytes (int): Maximum total size of the cached vectors in bytes.
+    """
+
+    def __init__(self, path, max_entries=100_000, max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key BLOB PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._entries, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+
+    def get_many(self, model: str, texts: list[str]) -> list:
+        """
+        Look up cached vectors.
+        Args:
+            model (str): Embedding model id.
+            texts (list[str]): Input texts.
+        Returns:
+            list: One vector per text, or None where the text is not cached.
+        """
+        keys = [cache_key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                found.update(rows.fetchall())
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+
+            vectors = []
+            for key in keys:
+                blob = found.get(key)
+                if blob is None:
+                    self.misses += 1
+                    vectors.append(None)
+                else:
+                    self.hits += 1
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    vectors.append(vector.tolist())
+        hits = len(vectors) - vectors.count(None)
+        CACHE_REQUESTS.inc(hits, cache="embedding", result="hit")
+        CACHE_REQUESTS.inc(len(vectors) - hits, cache="embedding", result="miss")
+        return vectors
+
+    def put_many(self, model: str, texts: list[str], vectors: list[list[float]]):
+        """
+        Store vectors for texts and evict least recently used entries beyond the bounds.
+        Args:
+            model (str): Embedding model id.
+            texts (list[str]): Input texts.
+            vectors (list[list[float]]): One vector per text.
+        """
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = array('f', vector).tobytes()
+            rows.append((cache_key(model, text), model, blob, len(blob), now))
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+            self._entries, self._bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+            self._evict()
+
+    def get_or_compute(self, model: str, texts: list[str], compute) -> list[list[float]]:
+        """
+        Return vectors for texts, calling compute only for the texts that are not cached.
+        Args:
+            model (str): Embedding model id.
+            texts (list[str]): Input texts.
+            compute (callable): Takes a list of texts and returns one vector per text.
+        Returns:
+            list[list[float]]: One vector per input text.
+        """
+        vectors = self.get_many(model, texts)
+        # Deduplicate misses so repeated texts in one call are embedded once
+        missing = {}
+        for index, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(normalize_text(texts[index]), []).append(index)
+        if missing:
+            missing_texts = [texts[indexes[0]] for indexes in missing.values()]
+            computed = compute(missing_texts)
+            self.put_many(model, missing_texts, computed)
+            for indexes, vector in zip(missing.values(), computed):
+                for index in indexes:
+                    vectors[index] = vector
+        return vectors
+
+    def stats(self) -> dict:
+        """
+        Return hit/miss/eviction counters and the current cache size.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": self._entries, "bytes": self._bytes}
+
+    def _evict(self):
+        # Drop least recently used entries until both bounds are satisfied
+        while self._entries > self.max_entries or self._bytes > self.max_bytes:
+            limit = max(self._entries - self.max_entries, 256)
+            rows = self._conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT ?", (limit,)).fetchall()
+            if not rows:
+                break
+            victims = []
+            for key, size in rows:
+                if self._entries <= self.max_entries and self._bytes <= self.max_bytes:
+                    break
+                victims.append((key,))
+                self._entries -= 1
+                self._bytes -= size
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+            self.evictions += len(victims)
+        self._conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    Return the process-wide embedding cache, opening it from Config on first use.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(
+                getattr(Config, "EMBEDDING_CACHE_PATH", "embedding-cache.sqlite3"),
+                max_entries=getattr(Config, "EMBEDDING_CACHE_MAX_ENTRIES", 100_000),
+                max_bytes=getattr(Config, "EMBEDDING_CACHE_MAX_BYTES", 512 * 1024 * 1024),
+            )
+        return _cache
@@ -0,0 +1,320 @@
+"""
+Summary:
+Shared client for the HuggingFace feature-extraction endpoint used by the proof-points-rag scripts.
+
+The client keeps one pooled HTTP session (keep-alive) for all requests and accepts lists of texts,
+which are sent in batches bounded by both the number of texts and an estimated token count.
+Single-text calls made concurrently from several threads are coalesced into one batch within a
+small time window, so a chat UI serving several users still makes one round-trip per window.
+Texts that were embedded before are served from the persistent embedding cache.
+`AsyncEmbeddingClient` does the same on an asyncio event loop with a pooled httpx client.
+
+Usage:
+    from embedding_client import generate_embedding, get_embedding_client
+
+    vector = generate_embedding("How does Wolt use Atlas?")
+    vectors = get_embedding_client().embed(["text one", "text two"])
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+from embedding_cache import get_embedding_cache
+from rate_limiter import RetryableError, RetryPolicy, estimate_tokens, get_rate_limiter, get_retry_policy, parse_retry_after
+
+
+def batch_texts(texts, max_batch_size, max_batch_tokens):
+    """
+    Split texts into batches bounded by count and estimated tokens.
+    """
+    batch, batch_tokens = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= max_batch_size or batch_tokens + tokens > max_batch_tokens):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def _parse_response(response, batch):
+    # Shared by the requests and httpx clients, whose responses expose the same attributes
+    if response.status_code == 200:
+        vectors = response.json()
+        if len(vectors) != len(batch):
+            raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+        return vectors
+
+    if response.status_code == 503 and "Model is currently loading" in response.text:
+        # The endpoint reports how long loading is expected to take
+        try:
+            estimated_time = response.json().get("estimated_time")
+        except ValueError:
+            estimated_time = None
+        raise RetryableError("Model is currently loading", retry_after=estimated_time)
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableError(f"Request failed with status code {response.status_code}",
+                             retry_after=parse_retry_after(response.headers))
+    raise ValueError(f"Request failed with status code {response.status_code}: {response.text}")
+
+
+class EmbeddingClient:
+    """
+    Batching, coalescing client for the HuggingFace feature-extraction endpoint.
+    Args:
+        url (str): Feature-extraction endpoint URL.
+        token (str): HuggingFace API token.
+        max_batch_size (int): Maximum number of texts sent in one request.
+        max_batch_tokens (int): Maximum estimated tokens sent in one request.
+        coalesce_window (float): Seconds to wait for more single-text calls before sending a batch.
+        pool_size (int): Number of pooled keep-alive connections.
+        limiter (RateLimiter): Optional client-side limiter for the endpoint.
+        retry_policy (RetryPolicy): Retry policy for rate limits, model loading and server errors.
+        cache (EmbeddingCache): Optional persistent cache consulted before calling the endpoint.
+        model_id (str): Model id used in cache keys; defaults to the endpoint URL.
+    """
+
+    def __init__(self, url, token, max_batch_size=32, max_batch_tokens=8192, coalesce_window=0.01,
+                 pool_size=10, limiter=None, retry_policy=None, cache=None, model_id=None):
+        self.url = url
+        self.cache = cache
+        self.model_id = model_id or url
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.coalesce_window = coalesce_window
+        self.limiter = limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+
+        # One session for the lifetime of the process so connections are reused
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+        # Pending single-text calls waiting to be coalesced into one batch
+        self._pending = []
+        self._cond = threading.Condition()
+        self._flusher = None
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """
+        Generate embeddings for a list of texts, preserving input order.
+        Args:
+            texts (list[str]): Input texts.
+        Returns:
+            list[list[float]]: One embedding per input text.
+        """
+        if self.cache is not None:
+            return self.cache.get_or_compute(self.model_id, texts, self._embed_uncached)
+        return self._embed_uncached(texts)
+
+    def embed_one(self, text: str) -> list[float]:
+        """
+        Generate an embedding for a single text, coalescing with concurrent callers.
+        Args:
+            text (str): Input text.
+        Returns:
+            list[float]: The generated embedding.
+        """
+        if self.cache is not None:
+            cached = self.cache.get_many(self.model_id, [text])[0]
+            if cached is not None:
+                return cached
+
+        future = Future()
+        with self._cond:
+            self._pending.append((text, future))
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="embedding-coalescer", daemon=True)
+                self._flusher.start()
+            self._cond.notify()
+        return future.result()
+
+    def _embed_uncached(self, texts):
+        vectors = []
+        for batch in self._batches(texts):
+            vectors.extend(self._post(batch))
+        return vectors
+
+    def _batches(self, texts):
+        return batch_texts(texts, self.max_batch_size, self.max_batch_tokens)
+
+    def _post(self, batch):
+        def attempt():
+            return _parse_response(self.session.post(self.url, json={"inputs": batch}), batch)
+
+        tokens = sum(estimate_tokens(text) for text in batch)
+        return self.retry_policy.call(attempt, limiter=self.limiter, tokens=tokens,
+                                      retry_on=(requests.ConnectionError, requests.Timeout))
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Give concurrent callers a short window to join this batch
+                deadline = time.monotonic() + self.coalesce_window
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                pending, self._pending = self._pending, []
+
+            texts = [text for text, _ in pending]
+            try:
+                vectors = self._embed_uncached(texts)
+                if self.cache is not None:
+                    self.cache.put_many(self.model_id, texts, vectors)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+            else:
+                for (_, future), vector in zip(pending, vectors):
+                    future.set_result(vector)
+
+
+class AsyncEmbeddingClient:
+    """
+    asyncio counterpart of `EmbeddingClient`: pooled httpx connections, batches sent concurrently,
+    and single-text calls from concurrent sessions coalesced within `coalesce_window`.
+    Takes the same arguments as `EmbeddingClient`.
+    """
+
+    def __init__(self, url, token, max_batch_size=32, max_batch_tokens=8192, coalesce_window=0.01,
+                 pool_size=10, limiter=None, retry_policy=None, cache=None, model_id=None):
+        self.url = url
+        self.cache = cache
+        self.model_id = model_id or url
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.coalesce_window = coalesce_window
+        self.limiter = limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.http = httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {token}"},
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=60.0,
+        )
+        self._pending = []
+        self._flush_task = None
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        """
+        Generate embeddings for a list of texts, preserving input order.
+        """
+        if self.cache is None:
+            return await self._embed_uncached(texts)
+        # The SQLite cache is synchronous; keep it off the event loop
+        vectors = await asyncio.to_thread(self.cache.get_many, self.model_id, texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            computed = dict(zip(missing, await self._embed_uncached(missing)))
+            await asyncio.to_thread(self.cache.put_many, self.model_id, missing, [computed[text] for text in missing])
+            vectors = [computed[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return vectors
+
+    async def embed_one(self, text: str) -> list[float]:
+        """
+        Generate an embedding for a single text, coalescing with concurrent callers.
+        """
+        if self.cache is not None:
+            cached = (await asyncio.to_thread(self.cache.get_many, self.model_id, [text]))[0]
+            if cached is not None:
+                return cached
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+        return await future
+
+    async def _flush(self):
+        # Give concurrent callers a short window to join this batch
+        await asyncio.sleep(self.coalesce_window)
+        pending, self._pending, self._flush_task = self._pending, [], None
+
+        texts = [text for text, _ in pending]
+        try:
+            vectors = await self._embed_uncached(texts)
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.put_many, self.model_id, texts, vectors)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), vector in zip(pending, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+    async def _embed_uncached(self, texts):
+        results = await asyncio.gather(*(self._post(batch) for batch in batch_texts(texts, self.max_batch_size, self.max_batch_tokens)))
+        return [vector for vectors in results for vector in vectors]
+
+    async def _post(self, batch):
+        async def attempt():
+            return _parse_response(await self.http.post(self.url, json={"inputs": batch}), batch)
+
+        tokens = sum(estimate_tokens(text) for text in batch)
+        return await self.retry_policy.call_async(attempt, limiter=self.limiter, tokens=tokens,
+                                                  retry_on=(httpx.TransportError,))
+
+
+def _client_settings():
+    return dict(
+        max_batch_size=getattr(Config, "EMBEDDING_BATCH_SIZE", 32),
+        max_batch_tokens=getattr(Config, "EMBEDDING_BATCH_TOKENS", 8192),
+        coalesce_window=getattr(Config, "EMBEDDING_COALESCE_WINDOW", 0.01),
+        pool_size=getattr(Config, "EMBEDDING_POOL_SIZE", 10),
+        limiter=get_rate_limiter("embedding"),
+        retry_policy=get_retry_policy(),
+        cache=get_embedding_cache(),
+        model_id=getattr(Config, "EMBEDDING_MODEL", None),
+    )
+
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def get_embedding_client() -> EmbeddingClient:
+    """
+    Return the process-wide embedding client, creating it from Config on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = EmbeddingClient(Config.EMBEDDING_URL, Config.HF_TOKEN, **_client_settings())
+        return _client
+
+
+def get_async_embedding_client() -> AsyncEmbeddingClient:
+    """
+    Return the process-wide asyncio embedding client, creating it from Config on first use.
+    """
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            _async_client = AsyncEmbeddingClient(Config.EMBEDDING_URL, Config.HF_TOKEN, **_client_settings())
+        return _async_client
+
+
+def generate_embedding(text: str) -> list[float]:
+    """
+    Generate embedding for the given text using the shared HuggingFace client.
+    Args:
+        text (str): Input text to generate embedding.
+    Returns:
+        list[float]: The generated embedding.
+    """
+    return get_embedding_client().embed_one(text)
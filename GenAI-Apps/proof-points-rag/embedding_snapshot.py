@@ -0,0 +1,141 @@
+"""
+Summary:
+Versioned, memory-mappable snapshot of the proof point use case embeddings.
+
+The export command streams `embeddings.usecase_embedding` and `_id` of every proof point embedded
+by the given model into one binary file. Query processes map the vector section read-only with `numpy.memmap`, so
+several `proofbot-webui.py` workers share one page-cached copy and start without reading the
+collection.
+
+File layout (little-endian):
+    header      magic b"PPSNAP\\0\\0", format version, dtype code, normalized flag, dimension,
+                count, vectors offset, ids offset, ids length, model id length, model id (UTF-8)
+    vectors     count x dimension float32, L2-normalized, starting on a 64-byte boundary
+    ids         BSON document {"ids": [...]} so ObjectIds keep their type
+
+Usage:
+    python embedding_snapshot.py export --output proofpoints.snapshot
+    python embedding_snapshot.py info proofpoints.snapshot
+"""
+
+import argparse
+import os
+import struct
+import bson
+import numpy as np
+from config import Config
+
+MAGIC = b"PPSNAP\0\0"
+VERSION = 1
+DTYPES = {1: np.float32}
+_HEADER = struct.Struct("<8sHBBIQQQQH")
+_ALIGNMENT = 64
+
+
+def _aligned(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def export_snapshot(collection, path, model_id):
+    """
+    Write every use case embedding produced by `model_id` to a snapshot file; embeddings of other
+    models (a partially re-embedded collection) are left out, so a snapshot never mixes models.
+    Args:
+        collection: Proof point collection.
+        path (str): Output file; written to a temporary file and renamed when complete.
+        model_id (str): Id of the model whose embeddings are exported (`embeddings.model`).
+    Returns:
+        int: Number of vectors written.
+    """
+    model = model_id.encode("utf-8")
+    vectors_offset = _aligned(_HEADER.size + len(model))
+    tmp_path = path + ".tmp"
+    ids = []
+    dimension = 0
+    with open(tmp_path, "wb") as file:
+        file.seek(vectors_offset)
+        cursor = collection.find({"embeddings.usecase_embedding": {"$exists": True}, "embeddings.model": model_id},
+                                 {"embeddings.usecase_embedding": 1}, batch_size=1000)
+        for document in cursor:
+            vector = np.asarray(document["embeddings"]["usecase_embedding"], dtype=np.float32)
+            if not dimension:
+                dimension = len(vector)
+            elif len(vector) != dimension:
+                print(f"Skipping {document['_id']}: dimension {len(vector)} != {dimension}")
+                continue
+            norm = np.linalg.norm(vector)
+            file.write((vector / norm if norm else vector).tobytes())
+            ids.append(document["_id"])
+
+        ids_blob = bson.encode({"ids": ids})
+        ids_offset = file.tell()
+        file.write(ids_blob)
+
+        file.seek(0)
+        file.write(_HEADER.pack(MAGIC, VERSION, 1, 1, dimension, len(ids), vectors_offset,
+                                ids_offset, len(ids_blob), len(model)))
+        file.write(model)
+    os.replace(tmp_path, path)
+    other_models = collection.count_documents({"embeddings.usecase_embedding": {"$exists": True},
+                                               "embeddings.model": {"$ne": model_id}})
+    if other_models:
+        print(f"Left out {other_models} embeddings of other models than {model_id}; run proofpoint-updater.py to re-embed them")
+    return len(ids)
+
+
+def load_snapshot(path, expected_model=None):
+    """
+    Map a snapshot file without copying the vectors.
+    Args:
+        path (str): Snapshot file.
+        expected_model (str): Reject the snapshot if it was produced by another model.
+    Returns:
+        tuple: (ids, read-only float32 matrix of L2-normalized vectors, header dict)
+    """
+    with open(path, "rb") as file:
+        fields = _HEADER.unpack(file.read(_HEADER.size))
+        magic, version, dtype_code, normalized, dimension, count, vectors_offset, ids_offset, ids_length, model_length = fields
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a proof point embedding snapshot")
+        if version != VERSION:
+            raise ValueError(f"Unsupported snapshot version {version} in {path}")
+        model_id = file.read(model_length).decode("utf-8")
+        file.seek(ids_offset)
+        ids = bson.decode(file.read(ids_length))["ids"]
+
+    if expected_model and model_id != expected_model:
+        raise ValueError(f"Snapshot {path} was built with {model_id}, expected {expected_model}")
+
+    header = {"version": version, "dimension": dimension, "count": count, "model_id": model_id,
+              "dtype": DTYPES[dtype_code].__name__, "normalized": bool(normalized)}
+    if count == 0:
+        return ids, np.zeros((0, dimension), dtype=DTYPES[dtype_code]), header
+    matrix = np.memmap(path, dtype=DTYPES[dtype_code], mode="r", offset=vectors_offset, shape=(count, dimension))
+    return ids, matrix, header
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or inspect proof point embedding snapshots.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write all use case embeddings to a snapshot file.")
+    export.add_argument("--output", default=getattr(Config, "LOCAL_INDEX_SNAPSHOT", None) or "proofpoints.snapshot")
+    export.add_argument("--model-id", default=getattr(Config, "EMBEDDING_MODEL", None) or Config.EMBEDDING_URL)
+    info = commands.add_parser("info", help="Print the header of a snapshot file.")
+    info.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        from pymongo.mongo_client import MongoClient
+        from pymongo.server_api import ServerApi
+
+        client = MongoClient(Config.MONGODB_URI, server_api=ServerApi('1'))
+        collection = client[Config.MONGODB_DATABASE][Config.MONGODB_COLLECTION]
+        count = export_snapshot(collection, args.output, args.model_id)
+        print(f"Wrote {count} embeddings to {args.output}")
+    else:
+        _, _, header = load_snapshot(args.path)
+        print(header)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Summary:
+OpenAI Batch API helpers for offline extraction backfills.
+
+Extraction requests are written as JSONL batch input files (one `{"custom_id", "method", "url",
+"body"}` line per request), split so a file stays within the Batch API limits of 50,000 requests
+and 200 MB. Each file is uploaded with purpose "batch" and submitted as a batch against
+/v1/chat/completions with a 24h completion window; batches are billed at a discount and run
+under a separate quota, so a backfill neither pays interactive prices nor starves the chatbot's
+rate limits. `wait_for_batches` polls until every batch reached a final status and
+`read_results` yields the answer (or error) of each request from the output and error files.
+
+Usage:
+    from extraction_batch import batch_line, submit_batches, wait_for_batches, read_results
+
+    ids = submit_batches(client, [batch_line(url, body) for url, body in requests], "batches")
+    for batch in wait_for_batches(client, ids).values():
+        for custom_id, content, error in read_results(client, batch):
+            ...
+"""
+
+import json
+import os
+import time
+
+ENDPOINT = "/v1/chat/completions"
+MAX_REQUESTS = 50_000
+MAX_FILE_BYTES = 190 * 1024 * 1024
+FINAL_STATUSES = frozenset(("completed", "failed", "expired", "cancelled"))
+
+
+def batch_line(custom_id, body, url=ENDPOINT):
+    """
+    One request of a batch input file.
+    Args:
+        custom_id (str): Id the result is returned under (unique within a batch).
+        body (dict): Request body, as it would be sent to `url`.
+    """
+    return json.dumps({"custom_id": custom_id, "method": "POST", "url": url, "body": body})
+
+
+def write_batch_files(lines, directory, max_requests=MAX_REQUESTS, max_bytes=MAX_FILE_BYTES):
+    """
+    Write request lines to as many JSONL files as the Batch API limits require.
+    Returns:
+        list[str]: Paths of the written files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    paths = []
+    file = None
+    requests = size = 0
+    try:
+        for line in lines:
+            data = (line + "\n").encode("utf-8")
+            if file is None or requests >= max_requests or size + len(data) > max_bytes:
+                if file is not None:
+                    file.close()
+                paths.append(os.path.join(directory, f"extraction-{stamp}-{len(paths) + 1}.jsonl"))
+                file = open(paths[-1], "wb")
+                requests = size = 0
+            file.write(data)
+            requests += 1
+            size += len(data)
+    finally:
+        if file is not None:
+            file.close()
+    return paths
+
+
+def submit_batches(client, lines, directory, completion_window="24h", metadata=None, max_requests=MAX_REQUESTS):
+    """
+    Write, upload and submit the request lines.
+    Returns:
+        list[str]: Ids of the submitted batches.
+    """
+    batch_ids = []
+    for path in write_batch_files(lines, directory, max_requests):
+        with open(path, "rb") as file:
+            uploaded = client.files.create(file=file, purpose="batch")
+        options = {"metadata": metadata} if metadata else {}
+        batch = client.batches.create(input_file_id=uploaded.id, endpoint=ENDPOINT,
+                                      completion_window=completion_window, **options)
+        print(f"Submitted batch {batch.id} ({path})")
+        batch_ids.append(batch.id)
+    return batch_ids
+
+
+def wait_for_batches(client, batch_ids, poll_interval=60.0, timeout=None):
+    """
+    Poll the batches until all of them reached a final status.
+    Args:
+        poll_interval (float): Seconds between polls.
+        timeout (float): Seconds to wait at most; None waits for the completion window.
+    Returns:
+        dict: Batch object per id.
+    Raises:
+        TimeoutError: Some batch is still running after `timeout` seconds.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    batches = {}
+    pending = list(batch_ids)
+    while True:
+        for batch_id in pending:
+            batches[batch_id] = client.batches.retrieve(batch_id)
+        pending = [batch_id for batch_id in pending if batches[batch_id].status not in FINAL_STATUSES]
+        for batch_id in batch_ids:
+            batch = batches[batch_id]
+            counts = batch.request_counts
+            progress = f" {counts.completed + counts.failed}/{counts.total}" if counts else ""
+            print(f"Batch {batch_id}: {batch.status}{progress}")
+        if not pending:
+            return batches
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(f"Batches still running: {', '.join(pending)}")
+        time.sleep(poll_interval)
+
+
+def read_results(client, batch):
+    """
+    Yield (custom_id, content, error) for every request of a finished batch; content is the answer
+    of the chat completion, or None with an error message. A completion without content (a refusal or
+    a content filter) is an error too. Requests without a result (an expired or cancelled batch) are
+    not yielded.
+    """
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                error = result.get("error") or (response.get("body") or {}).get("error") or response.get("status_code")
+                yield result["custom_id"], None, str(error)
+                continue
+            choices = (response.get("body") or {}).get("choices") or [{}]
+            message = choices[0].get("message") or {}
+            if not message.get("content"):
+                reason = message.get("refusal") or f"finish_reason {choices[0].get('finish_reason')}"
+                yield result["custom_id"], None, f"Completion has no content ({reason})"
+                continue
+            yield result["custom_id"], message["content"], None
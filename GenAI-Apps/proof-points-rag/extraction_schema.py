@@ -0,0 +1,307 @@
+"""
+Summary:
+Schema-enforced parsing of the proof points the gatherer extracts from customer stories.
+
+The JSON schema is derived from the example document in proofpoint-schema.json (read leniently: it
+uses ISODate(...) values and trailing commas) and compiled into a validator once. Every field is
+required and no other fields are allowed, which is also what OpenAI's strict structured outputs
+expect, so the same schema is sent as the `response_format` of the extraction request. The
+internal fields a public customer story cannot supply (champion, account owner and Salesforce link,
+deck link, ...) are declared nullable (`{"type": ["string", "null"]}`), so an extraction that
+returns null for them is valid instead of being re-asked and dropped.
+
+A completion is made valid as cheaply as possible:
+1. local repair: strip code fences and surrounding text, close a truncated document, coerce values
+   to the schema types ("8,186" -> 8186, "yes" -> true, a string -> [string]) and drop unknown fields;
+2. validation, reporting the invalid or missing fields by path (e.g. "customer.size", "usecase.metrics");
+3. a targeted re-ask for only those fields (see `field_request`), whose answer is merged back,
+   instead of repeating the whole multi-thousand-token extraction.
+
+Usage:
+    from extraction_schema import parse_extraction, invalid_fields, merge_fields
+
+    document = parse_extraction(completion_text)
+    errors = invalid_fields(document)
+"""
+
+import json
+import os
+import re
+from datetime import datetime
+from jsonschema import Draft202012Validator
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "proofpoint-schema.json")
+
+_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+_NUMBER = re.compile(r"-?\d[\d,]*(\.\d+)?")
+_TRUE = {"true", "yes", "y", "1"}
+_FALSE = {"false", "no", "n", "0"}
+_UNKNOWN = {"", "null", "none", "n/a", "unknown", "not specified", "not available"}
+
+# Leaves that are not published in customer stories
+NULLABLE_FIELDS = frozenset((
+    "customer.size", "customer.founded", "customer.headquarters",
+    "champion.name", "champion.role", "champion.responsibilities",
+    "account.deal_type", "account.date_signed", "account.owner", "account.sales_motion", "account.sfdc_acc_link",
+    "date_proof_point_created", "link_to_deck", "customer_validated",
+))
+
+
+def load_example(path=SCHEMA_PATH):
+    """
+    Read the example proof point; ISODate("...") values become Extended JSON {"$date": "..."}.
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        text = file.read()
+    text = re.sub(r'ISODate\(("[^"]*")\)', r'{"$date": \1}', text)
+    # The example is hand-edited and has trailing commas
+    text = re.sub(r",(\s*[\]}])", r"\1", text)
+    return json.loads(text)
+
+
+def _kind(schema):
+    # Type of a schema, without the "null" of a nullable leaf
+    kind = schema.get("type")
+    return next(item for item in kind if item != "null") if isinstance(kind, list) else kind
+
+
+def _nullable(schema):
+    return isinstance(schema.get("type"), list) and "null" in schema["type"]
+
+
+def build_schema(example, nullable=NULLABLE_FIELDS, path=""):
+    """
+    Strict JSON schema of a document shaped like `example`; the leaves at the `nullable` paths also accept null.
+    """
+    if isinstance(example, dict) and set(example) != {"$date"}:
+        properties = {key: build_schema(value, nullable, f"{path}.{key}" if path else key) for key, value in example.items()}
+        return {"type": "object", "properties": properties, "required": list(example), "additionalProperties": False}
+    schema = _leaf_schema(example)
+    if path in nullable:
+        schema["type"] = [schema["type"], "null"]
+    return schema
+
+
+def _leaf_schema(example):
+    # Schema of a value that is not a sub-document
+    if isinstance(example, dict):
+        return {"type": "string", "format": "date-time"}
+    if isinstance(example, list):
+        items = {}
+        for item in example:
+            # Merge the fields of all elements, so one sparse element does not narrow the schema
+            schema = build_schema(item, frozenset())
+            if items.get("type") == "object" and schema.get("type") == "object":
+                items["properties"] = {**schema["properties"], **items["properties"]}
+                items["required"] = list(items["properties"])
+            else:
+                items = items or schema
+        return {"type": "array", "items": items or {"type": "string"}}
+    if isinstance(example, bool):
+        return {"type": "boolean"}
+    if isinstance(example, int):
+        return {"type": "integer"}
+    if isinstance(example, float):
+        return {"type": "number"}
+    return {"type": "string"}
+
+
+def schema_template(schema):
+    """
+    Compact rendering of a schema for the prompt, e.g. {"size": integer, "about": [string]}.
+    """
+    kind = _kind(schema)
+    if kind == "object":
+        return "{" + ", ".join(f'"{key}": {schema_template(value)}' for key, value in schema["properties"].items()) + "}"
+    if kind == "array":
+        return f"[{schema_template(schema['items'])}]"
+    rendered = "ISO 8601 date-time string" if schema.get("format") == "date-time" else kind
+    return f"{rendered} or null" if _nullable(schema) else rendered
+
+
+PROOF_POINT_SCHEMA = build_schema(load_example())
+VALIDATOR = Draft202012Validator(PROOF_POINT_SCHEMA)
+
+
+def response_format(mode="json_object"):
+    """
+    `response_format` of the extraction request: "json_schema" (strict structured outputs, for
+    models that support them) or "json_object" (JSON mode).
+    """
+    if mode == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": "proof_point", "schema": PROOF_POINT_SCHEMA, "strict": True}}
+    return {"type": "json_object"}
+
+
+def _close_truncated(text):
+    # Close the strings, arrays and objects left open by a truncated completion, backing off to
+    # the last complete value when the cut is inside a key or value
+    stack = []
+    in_string = escaped = False
+    cuts = []
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            if stack:
+                cuts.append((index + 1, "".join(reversed(stack))))
+        elif char == ",":
+            cuts.append((index, "".join(reversed(stack))))
+
+    closers = "".join(reversed(stack))
+    candidates = [text + ('"' if in_string else "") + closers] + [text[:cut] + rest for cut, rest in reversed(cuts)]
+    for candidate in candidates[:200]:
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("Completion is not repairable JSON")
+
+
+def parse_json(text):
+    """
+    Parse the JSON object of a completion, repairing code fences, surrounding text and truncation.
+    Raises:
+        ValueError: No JSON object could be recovered.
+    """
+    text = _FENCE.sub("", text.strip())
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("Completion contains no JSON object")
+    end = text.rfind("}")
+    try:
+        value = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        value = _close_truncated(text[start:])
+    if not isinstance(value, dict):
+        raise ValueError("Completion is not a JSON object")
+    return value
+
+
+def parse_extraction(text):
+    """
+    Parse and repair an extraction completion and coerce it to the schema.
+    """
+    return coerce(parse_json(text), PROOF_POINT_SCHEMA)
+
+
+def coerce(value, schema):
+    """
+    Convert a value to the schema types where that is lossless or obvious; leave the rest to validation.
+    """
+    kind = _kind(schema)
+    if _nullable(schema) and (value is None or (isinstance(value, str) and value.strip().lower() in _UNKNOWN)):
+        return None
+    if kind == "object":
+        if not isinstance(value, dict):
+            return value
+        properties = schema["properties"]
+        return {key: coerce(item, properties[key]) for key, item in value.items() if key in properties}
+    if kind == "array":
+        if value is None:
+            return []
+        if not isinstance(value, list):
+            value = [value]
+        return [coerce(item, schema["items"]) for item in value]
+    if kind in ("integer", "number") and isinstance(value, str):
+        match = _NUMBER.search(value)
+        if match:
+            number = float(match.group(0).replace(",", ""))
+            return int(number) if kind == "integer" else number
+    if kind == "integer" and isinstance(value, float) and value.is_integer():
+        return int(value)
+    if kind == "boolean" and isinstance(value, str) and value.strip().lower() in _TRUE | _FALSE:
+        return value.strip().lower() in _TRUE
+    if kind == "string":
+        if isinstance(value, list) and all(isinstance(item, str) for item in value):
+            return " ".join(value)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+    return value
+
+
+def invalid_fields(document):
+    """
+    Validate a document against the schema.
+    Returns:
+        dict: Error message per invalid or missing field path (at most two levels deep, e.g.
+            "usecase.metrics"), empty when the document is valid.
+    """
+    errors = {}
+    for error in VALIDATOR.iter_errors(document):
+        path = [str(part) for part in error.absolute_path if not isinstance(part, int)]
+        if error.validator == "required":
+            missing = [key for key in error.validator_value if key not in error.instance]
+            for key in missing:
+                errors.setdefault(".".join((path + [key])[:2]), "missing")
+            continue
+        errors.setdefault(".".join(path[:2]) or "$", error.message[:200])
+    return errors
+
+
+def field_schema(path):
+    """
+    Schema of the field at a dotted path.
+    """
+    schema = PROOF_POINT_SCHEMA
+    for key in path.split("."):
+        schema = schema["properties"][key]
+    return schema
+
+
+def field_request(errors):
+    """
+    Prompt text asking for only the invalid fields: their paths, the problems and the expected shapes.
+    """
+    lines = [f'"{path}": {schema_template(field_schema(path))}  (problem: {message})' for path, message in errors.items()]
+    return ("The json document you extracted has invalid or missing fields. Return a json object whose keys are "
+            "exactly these field paths and whose values are the corrected values, extracted from the same html data:\n"
+            + "\n".join(lines))
+
+
+def merge_fields(document, fields):
+    """
+    Set the re-asked fields ({"customer.size": 8186, ...}) in the document, coerced to the schema.
+    """
+    for path, value in fields.items():
+        try:
+            schema = field_schema(path)
+        except KeyError:
+            continue
+        target = document
+        keys = path.split(".")
+        for key in keys[:-1]:
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            target = target[key]
+        target[keys[-1]] = coerce(value, schema)
+    return document
+
+
+def to_document(document, schema=PROOF_POINT_SCHEMA):
+    """
+    Convert the date-time strings of a validated proof point to datetimes for MongoDB.
+    """
+    kind = _kind(schema)
+    if kind == "object" and isinstance(document, dict):
+        return {key: to_document(value, schema["properties"][key]) if key in schema["properties"] else value
+                for key, value in document.items()}
+    if kind == "array" and isinstance(document, list):
+        return [to_document(item, schema["items"]) for item in document]
+    if schema.get("format") == "date-time" and isinstance(document, str):
+        try:
+            return datetime.fromisoformat(document.replace("Z", "+00:00"))
+        except ValueError:
+            return document
+    return document
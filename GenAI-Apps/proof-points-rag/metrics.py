@@ -0,0 +1,290 @@
+"""
+Summary:
+Lightweight latency instrumentation and Prometheus metrics for the RAG request path.
+
+- `span("embedding")` times a stage: the duration is observed in the `proofpoints_stage_seconds`
+  histogram and added to the timing record of the current request, if one is active.
+- Counters record retries, rate-limit waits, cache hits and misses, and OpenAI tokens used.
+- `start_request()` / `finish_request()` bracket one chatbot request and produce its timing record
+  (per-stage seconds, total, cache hit, tokens), which is appended to `Config.TIMING_LOG` as JSONL
+  or printed.
+- `start_metrics_server(port)` serves all metrics in the Prometheus text format on `/metrics`.
+
+The current request is tracked in a context variable, so records follow asyncio tasks and
+`asyncio.to_thread` calls, and concurrent requests on different threads do not mix.
+
+Usage:
+    from metrics import span, start_request, finish_request
+
+    record = start_request()
+    with span("vector_search"):
+        result = retriever.search(query_vector, k=3)
+    finish_request(record)
+"""
+
+import bisect
+import contextvars
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import Config
+
+# Seconds; covers cache hits (ms) up to slow completions and HF cold starts
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = {}
+_registry_lock = threading.Lock()
+_current_request = contextvars.ContextVar("proofpoints_request", default=None)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, key)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram:
+    """
+    Histogram with cumulative buckets, optionally split by labels.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [le])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def _get_or_create(cls, name, documentation, labelnames, **kwargs):
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = cls(name, documentation, labelnames, **kwargs)
+        return _registry[name]
+
+
+def counter(name, documentation, labelnames=()) -> Counter:
+    """
+    Return the process-wide counter `name`, creating it on first use.
+    """
+    return _get_or_create(Counter, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    """
+    Return the process-wide histogram `name`, creating it on first use.
+    """
+    return _get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+STAGE_SECONDS = histogram("proofpoints_stage_seconds", "Latency of each RAG stage.", ["stage"])
+REQUEST_SECONDS = histogram("proofpoints_request_seconds", "End-to-end latency of chatbot requests.")
+RETRIES = counter("proofpoints_retries_total", "Retried provider calls by error type.", ["reason"])
+RATE_LIMIT_WAIT = counter("proofpoints_rate_limit_wait_seconds_total", "Time spent waiting on client-side rate limiters.", ["limiter"])
+CACHE_REQUESTS = counter("proofpoints_cache_requests_total", "Cache lookups by cache and result.", ["cache", "result"])
+TOKENS = counter("proofpoints_openai_tokens_total", "OpenAI tokens used by kind.", ["kind"])
+
+
+def render() -> str:
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    with _registry_lock:
+        metrics = list(_registry.values())
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are frequent; keep them out of the console
+        pass
+
+
+def start_metrics_server(port, addr="0.0.0.0"):
+    """
+    Serve `/metrics` from a daemon thread.
+    Returns:
+        ThreadingHTTPServer: The running server.
+    """
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+class RequestRecord:
+    """
+    Timing record of one chatbot request.
+    """
+
+    def __init__(self, **fields):
+        self.id = uuid.uuid4().hex[:12]
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.fields = fields
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "request_id": self.id,
+            **self.fields,
+            "stages": {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+            "total": round(time.perf_counter() - self.started, 4),
+        }
+
+
+def current_request():
+    """
+    The timing record of the request being handled, or None.
+    """
+    return _current_request.get()
+
+
+def start_request(**fields) -> RequestRecord:
+    """
+    Begin a timing record for the current request (thread or asyncio task).
+    """
+    record = RequestRecord(**fields)
+    _current_request.set(record)
+    return record
+
+
+def count(field, amount=1):
+    """
+    Add to a counter field (e.g. retries) of the current request record, if any.
+    """
+    record = _current_request.get()
+    if record is not None:
+        record.fields[field] = record.fields.get(field, 0) + amount
+
+
+def finish_request(record, **fields) -> dict:
+    """
+    Close a timing record, observe its total latency and write it to `Config.TIMING_LOG` (or print it).
+    Returns:
+        dict: The timing record.
+    """
+    record.fields.update(fields)
+    result = record.to_dict()
+    REQUEST_SECONDS.observe(result["total"])
+    if _current_request.get() is record:
+        _current_request.set(None)
+
+    path = getattr(Config, "TIMING_LOG", None)
+    if path:
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(result) + "\n")
+    else:
+        print(f"Timing: {json.dumps(result)}")
+    return result
+
+
+def observe_stage(stage, seconds, record=None):
+    """
+    Record a stage duration measured by the caller (default record: the current request).
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    record = record or _current_request.get()
+    if record is not None:
+        record.add(stage, seconds)
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a stage of the RAG path.
+    """
+    # Taken on entry: a span inside a generator may be closed from another thread or task
+    record = _current_request.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, record)
+
+
+def record_tokens(usage, record=None):
+    """
+    Count the tokens of an OpenAI `usage` object and add them to `record` (default: the current request record).
+    """
+    if usage is None:
+        return
+    TOKENS.inc(usage.prompt_tokens, kind="prompt")
+    TOKENS.inc(usage.completion_tokens, kind="completion")
+    record = record or _current_request.get()
+    if record is not None:
+        record.fields["prompt_tokens"] = record.fields.get("prompt_tokens", 0) + usage.prompt_tokens
+        record.fields["completion_tokens"] = record.fields.get("completion_tokens", 0) + usage.completion_tokens
@@ -0,0 +1,153 @@
+"""
+Summary:
+Persistent HTTP cache for the customer story crawler with conditional revalidation.
+
+Pages are fetched through one pooled `requests.Session`, so keep-alive connections are reused
+across stories. Every 200 response is stored in a local SQLite file with its `ETag`,
+`Last-Modified` and a SHA-256 of the body, the body compressed with zlib. The next fetch of the
+page sends `If-None-Match` / `If-Modified-Since`; a 304 (or a 200 whose body hashes the same) is
+reported as unchanged and served from the cache, which lets the gatherer skip extraction, embedding
+and writing for stories that did not change.
+
+Usage:
+    from page_cache import get_page_cache
+
+    page = get_page_cache().fetch(url)
+    if page.changed:
+        ...
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+from metrics import CACHE_REQUESTS
+
+
+@dataclass
+class Page:
+    """
+    A fetched page.
+    Args:
+        url (str): Requested url.
+        text (str): Decoded body.
+        changed (bool): False when the cached copy was still current (304 or identical body).
+        status (int): HTTP status of the response (304 for revalidated pages).
+    """
+    url: str
+    text: str
+    changed: bool
+    status: int
+
+
+class PageCache:
+    """
+    SQLite-backed page cache with ETag / Last-Modified revalidation over a pooled session.
+    Args:
+        path (str): Path of the SQLite file.
+        pool_size (int): Keep-alive connections kept per host.
+        timeout (float): Seconds to wait for a response.
+    """
+
+    def __init__(self, path, pool_size=10, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._stats = {"fetched": 0, "not_modified": 0, "same_content": 0, "changed": 0,
+                       "bytes_downloaded": 0, "bytes_served_from_cache": 0}
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT NOT NULL,"
+            " encoding TEXT, body BLOB NOT NULL, fetched REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def _lookup(self, url):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT etag, last_modified, content_hash, encoding, body FROM pages WHERE url = ?", (url,)).fetchone()
+
+    def _store(self, url, response, content_hash):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, response.headers.get("ETag"), response.headers.get("Last-Modified"), content_hash,
+                 response.encoding, zlib.compress(response.content), time.time()))
+            self._conn.commit()
+
+    def _count(self, **amounts):
+        with self._lock:
+            for key, amount in amounts.items():
+                self._stats[key] += amount
+
+    def fetch(self, url) -> Page:
+        """
+        Fetch a page, revalidating the cached copy if there is one.
+        Raises:
+            Exception: The server answered with another status than 200 or 304.
+        """
+        cached = self._lookup(url)
+        headers = {}
+        if cached is not None:
+            etag, last_modified = cached[0], cached[1]
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        self._count(fetched=1, bytes_downloaded=len(response.content))
+        if response.status_code == 304 and cached is not None:
+            body = zlib.decompress(cached[4])
+            self._count(not_modified=1, bytes_served_from_cache=len(body))
+            CACHE_REQUESTS.inc(cache="page", result="hit")
+            return Page(url, body.decode(cached[3] or "utf-8", errors="replace"), False, 304)
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch HTML content from {url}")
+
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        changed = cached is None or cached[2] != content_hash
+        # Store even unchanged bodies: the validators may have changed
+        self._store(url, response, content_hash)
+        self._count(**({"changed": 1} if changed else {"same_content": 1}))
+        CACHE_REQUESTS.inc(cache="page", result="miss" if changed else "hit")
+        return Page(url, response.text, changed, 200)
+
+    def stats(self) -> dict:
+        """
+        Return request, revalidation and transfer counters.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> PageCache:
+    """
+    Return the process-wide page cache, opening it from Config on first use.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PageCache(
+                getattr(Config, "PAGE_CACHE_PATH", "page-cache.sqlite3"),
+                pool_size=getattr(Config, "PAGE_CACHE_POOL_SIZE", 10),
+                timeout=getattr(Config, "PAGE_CACHE_TIMEOUT", 30.0),
+            )
+        return _cache
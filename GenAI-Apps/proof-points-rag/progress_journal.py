@@ -0,0 +1,168 @@
+"""
+Summary:
+Durable progress journal that makes the gatherer and updater runs resumable.
+
+Every work item (a customer story URL, a proof point `_id`) has one row per job in a local SQLite
+file with the last stage it completed (fetched, extracted, embedded, written), an optional payload
+needed to resume from that stage (the fetched HTML, the extracted proof point JSON), and the stage
+and error of its last failure. Stage results are committed as soon as they complete, so a crash or
+a failed item never costs the completed stages again; above all, paid LLM extractions are not
+repeated. A job can also keep a scan checkpoint (e.g. the last `_id` of a full-collection pass).
+
+Usage:
+    from progress_journal import ProgressJournal
+
+    journal = ProgressJournal("progress-journal.sqlite3", "gatherer")
+    if not journal.is_done(url):
+        ...
+        journal.record(url, "extracted", {"proof_point_data": text})
+    print(journal.summary())
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from bson import json_util
+
+STAGES = ["fetched", "extracted", "embedded", "written"]
+
+
+class ProgressJournal:
+    """
+    SQLite-backed per-item stage journal for one job.
+    Args:
+        path (str): Path of the SQLite file (shared by all jobs).
+        job (str): Job name, e.g. "gatherer" or "updater".
+    """
+
+    def __init__(self, path, job):
+        self.path = path
+        self.job = job
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS progress ("
+            " job TEXT NOT NULL, key TEXT NOT NULL, stage TEXT, payload TEXT,"
+            " failed_stage TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL,"
+            " PRIMARY KEY (job, key))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS checkpoints (job TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+    def get(self, key):
+        """
+        Journal entry of an item.
+        Returns:
+            dict: stage, payload, failed_stage, error and attempts, or None if the item is unknown.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT stage, payload, failed_stage, error, attempts FROM progress WHERE job = ? AND key = ?",
+                (self.job, key)).fetchone()
+        if row is None:
+            return None
+        stage, payload, failed_stage, error, attempts = row
+        return {"stage": stage, "payload": json.loads(payload) if payload else {}, "failed_stage": failed_stage,
+                "error": error, "attempts": attempts}
+
+    def completed(self, key, stage) -> bool:
+        """
+        Whether the item has completed `stage` (or a later one).
+        """
+        entry = self.get(key)
+        return entry is not None and entry["stage"] is not None and STAGES.index(entry["stage"]) >= STAGES.index(stage)
+
+    def is_done(self, key) -> bool:
+        """
+        Whether the item went through every stage.
+        """
+        return self.completed(key, STAGES[-1])
+
+    def record(self, key, stage, payload=None):
+        """
+        Mark `stage` completed for an item and clear its last failure.
+        Args:
+            payload (dict): Data needed to resume after this stage; replaces the previous payload
+                when given, otherwise the previous payload is kept.
+        """
+        self.record_many([key], stage, payload)
+
+    def record_many(self, keys, stage, payload=None):
+        """
+        Mark `stage` completed for several items in one transaction.
+        """
+        encoded = json.dumps(payload) if payload is not None else None
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO progress (job, key, stage, payload, updated) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (job, key) DO UPDATE SET stage = excluded.stage,"
+                " payload = COALESCE(excluded.payload, progress.payload),"
+                " failed_stage = NULL, error = NULL, updated = excluded.updated",
+                [(self.job, key, stage, encoded, now) for key in keys])
+            self._conn.commit()
+
+    def fail(self, key, stage, error):
+        """
+        Record that `stage` failed for an item; completed stages and their payload are kept.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO progress (job, key, failed_stage, error, attempts, updated) VALUES (?, ?, ?, ?, 1, ?)"
+                " ON CONFLICT (job, key) DO UPDATE SET failed_stage = excluded.failed_stage,"
+                " error = excluded.error, attempts = progress.attempts + 1, updated = excluded.updated",
+                (self.job, key, stage, str(error)[:1000], time.time()))
+            self._conn.commit()
+
+    def forget(self, keys):
+        """
+        Remove the entries of items, e.g. the failure rows of items that have since succeeded.
+        """
+        with self._lock:
+            self._conn.executemany("DELETE FROM progress WHERE job = ? AND key = ?", [(self.job, key) for key in keys])
+            self._conn.commit()
+
+    def checkpoint(self):
+        """
+        The saved scan checkpoint of the job, or None.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM checkpoints WHERE job = ?", (self.job,)).fetchone()
+        return json_util.loads(row[0])["value"] if row else None
+
+    def set_checkpoint(self, value):
+        """
+        Save the scan checkpoint of the job (any BSON value, e.g. an ObjectId); None clears it.
+        """
+        with self._lock:
+            if value is None:
+                self._conn.execute("DELETE FROM checkpoints WHERE job = ?", (self.job,))
+            else:
+                self._conn.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?)",
+                                   (self.job, json_util.dumps({"value": value})))
+            self._conn.commit()
+
+    def reset(self):
+        """
+        Forget all progress of the job.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM progress WHERE job = ?", (self.job,))
+            self._conn.execute("DELETE FROM checkpoints WHERE job = ?", (self.job,))
+            self._conn.commit()
+
+    def summary(self) -> dict:
+        """
+        Number of items per last completed stage, and of items whose last attempt failed.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT COALESCE(stage, 'new'), COUNT(*), COUNT(failed_stage) FROM progress WHERE job = ? GROUP BY 1",
+                (self.job,)).fetchall()
+        summary = {stage: count for stage, count, _ in rows}
+        summary["failed"] = sum(failed for _, _, failed in rows)
+        return summary
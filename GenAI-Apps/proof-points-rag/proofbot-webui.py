@@ -7,159 +7,342 @@ The main steps include:
 1. Retrieving a user question.
 2. Obtaining context from MongoDB based on the user question.
 3. Generating an embedding for the user question using an external service.
-4. Using MongoDB's vector search to find relevant context documents.
-5. Filtering the retrieved document and forming a string representation.
+4. Using MongoDB's vector search (or an in-process index) to find relevant context documents.
+5. Packing the most relevant sections of the retrieved documents into a token budget.
 6. Making a RAG request to GPT-3.5-turbo, incorporating user question and context.
-7. Handling rate limit errors with exponential backoff.
-8. Displaying the generated answer usign a web ui built with gradio
+7. Handling rate limit errors with a shared rate limiter and jittered, capped backoff.
+8. Displaying the generated answer usign a web ui built with gradio, streamed as it is generated
+
+By default the UI is served by the asyncio request path (`gradio_interface_async`): AsyncOpenAI, an httpx
+embedding client and the async pymongo driver share pooled connections on one event loop, so many sessions
+are in flight at once, with `Config.WEBUI_CONCURRENCY` of them admitted by the Gradio queue.
+
+Every stage (embedding, vector search, context, completion, first token) is timed; the timings,
+retries, rate-limit waits, cache hits and tokens are served as Prometheus metrics on
+`Config.METRICS_PORT` and logged as one timing record per request (see metrics.py).
 """
 
-import gradio as gr
+import asyncio
 import time
-import requests
-from openai import OpenAI, OpenAIError, RateLimitError
+import gradio as gr
+import httpx
+from openai import (APIConnectionError, APITimeoutError, AsyncOpenAI, DefaultAsyncHttpxClient, InternalServerError, OpenAI,
+                    OpenAIError, RateLimitError)
+from pymongo import AsyncMongoClient
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 from config import Config
+from context_budget import build_context
+from answer_cache import get_answer_cache
+from metrics import current_request, finish_request, observe_stage, record_tokens, span, start_metrics_server, start_request
+from embedding_client import generate_embedding, get_async_embedding_client
+from change_sync import start_background_sync
+from retrieval import ChunkRetriever, LocalRetriever, get_retriever
+from rate_limiter import estimate_tokens, get_rate_limiter, get_retry_policy
 
-# Initialize OpenAI client
-client = OpenAI()
-
-# HuggingFace API configuraiton
-hf_token = Config.HF_TOKEN
-embedding_url = Config.EMBEDDING_URL
+# Initialize OpenAI client; retries are handled by the shared retry policy
+client = OpenAI(max_retries=0)
+openai_limiter = get_rate_limiter("openai")
+retry_policy = get_retry_policy()
+retryable_errors = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+chat_model = "gpt-4-turbo-preview"
 
 # MongoDB client setup
 uri = Config.MONGODB_URI
 db_name = Config.MONGODB_DATABASE
 coll_name = Config.MONGODB_COLLECTION
 
+# Stream answers token by token instead of waiting for the full completion
+stream_responses = getattr(Config, "STREAM_RESPONSES", True)
+# Serve the UI from the asyncio request path, and how many sessions the Gradio queue runs at once
+async_webui = getattr(Config, "ASYNC_WEBUI", True)
+webui_concurrency = getattr(Config, "WEBUI_CONCURRENCY", 32)
+
+# Async clients for the asyncio request path, pooled to match the queue concurrency
+async_client = AsyncOpenAI(max_retries=0, http_client=DefaultAsyncHttpxClient(
+    limits=httpx.Limits(max_connections=webui_concurrency, max_keepalive_connections=webui_concurrency)))
+async_mongo_client = AsyncMongoClient(uri, server_api=ServerApi('1'), maxPoolSize=webui_concurrency)
+async_collection = async_mongo_client[db_name][coll_name]
+async_embedding_client = get_async_embedding_client()
+
 # Create MongoDB client and connect to the server
 mongo_client = MongoClient(uri, server_api=ServerApi('1'))
 db = mongo_client[db_name]
 collection = db[coll_name]
+retriever = get_retriever(collection)
+# Number of proof points retrieved as context per question
+top_k = getattr(Config, "RETRIEVAL_TOP_K", 3)
+# Prompt tokens spent on retrieved context
+context_token_budget = getattr(Config, "CONTEXT_TOKEN_BUDGET", 2000)
 
-def generate_embedding(text: str) -> list[float]:
-    # Generate embedding for the question using the HuggingFace API.
-    # Parameters:
-    #    - text: The input text for which embedding is generated.
-    # Returns:
-    #    - List[float]: The generated embedding.
-    
-    # API throttling config 
-    max_retries = 5
-    retry_delay = 5  # seconds
-
-    for retry in range(max_retries): # API Retry Mechanism
-        response = requests.post(
-            embedding_url,
-            headers={"Authorization": f"Bearer {hf_token}"},
-            json={"inputs": text}
-        )
-
-        if response.status_code == 200:
-            return response.json()
+# Reuse answers for semantically similar questions over the same proof points
+answer_cache = get_answer_cache()
 
-        if response.status_code == 503 and "Model is currently loading" in response.text:
-            print(f"Model loading, retrying in {retry_delay} seconds... (Retry {retry + 1}/{max_retries})")
-            time.sleep(retry_delay)
-        else:
-            raise ValueError(f"Request failed with status code {response.status_code}: {response.text}")
+# Apply proof point changes to the local index and the answer cache while the UI is running
+if getattr(Config, "SYNC_CHANGES", False):
+    start_background_sync(collection, retriever if isinstance(retriever, (LocalRetriever, ChunkRetriever)) else None, answer_cache)
 
-    raise ValueError("Exceeded maximum number of retries. Model did not become available.")
-
-def get_context_from_mongodb(question):
+def retrieve_context(question):
     # Retrieve context from MongoDB based on the vector representation of thee user's question.
     # Parameters:
     #    - question: The user's question.
     # Returns:
-    #    - str: String representation of relevant fields from the retrieved document.
+    #    - list[float]: The question embedding.
+    #    - list: Ids of the retrieved documents.
+    #    - str: String representation of relevant fields from the retrieved documents.
     
-    query_vector = generate_embedding(question)
-
-    # MongoDB vector search aggregation pipeline
-    pipeline = [
-        {
-            "$vectorSearch": {
-                "queryVector": query_vector,
-                "path": "embeddings.usecase_embedding",
-                "numCandidates": 10,
-                "limit": 1,
-                "index": "usecase_vector_index",
-            }
-        }
-    ]
+    with span("embedding"):
+        query_vector = generate_embedding(question)
 
-    # Execute the aggregation pipeline
-    results = collection.aggregate(pipeline)
-    # Extract the result from the aggregation response
-    result = list(results)
-
-    if result:
-        document = result[0]
-        excluded_fields = []
-        # Get all fields from the document, excluding specified ones
-        filtered_fields = {key: value for key, value in document.get("usecase", {}).items() if key not in excluded_fields}
-        # Convert the fields to a string
-        result_string = "\n".join([f"{key}: {value}" for key, value in filtered_fields.items()])
-        return result_string
-    else:
-        return ""
+    # Search through the configured backend (Atlas $vectorSearch, the local index or hybrid chunk retrieval)
+    with span("vector_search"):
+        result = retriever.search(query_vector, k=top_k, query_text=question)
 
-def make_rag_request(user_question, context, retry_count=0, temp=0.5, tokens=1000):
+    # Pack the most relevant sections of the retrieved proof points into the prompt token budget
+    with span("context"):
+        result_string = build_context(question, result, budget=context_token_budget, model=chat_model)
+    return query_vector, [document["_id"] for document in result], result_string
+
+def get_context_from_mongodb(question):
+    # Retrieve the context string for the user's question (see retrieve_context).
+    return retrieve_context(question)[2]
+
+def build_conversation(user_question, context):
+    # Formulate the conversation with user's question and context
+    return [  
+        {"role": "system", "content": "You are an experienced MongoDB sales executive, skilled in identifiying pains associated with using other databases and explaining how the MongoDB Database and MongoDB Atlas can address those pains and drive business value."},
+        {"role": "assistant", "content": context},
+        {"role": "user", "content": user_question + " Write the response from MongoDB's perspective and make it concise and suitable for C level audiences with headings, paragraphs, newlines and bullet points where it makes sense."}
+    ]
+
+def make_rag_request(user_question, context, temp=0.5, tokens=1000):
     # Make a RAG request to GPT-3.5-turbo with user's question and context.
     # Parameters:
     #    - user_question: The user's question.
     #    - context: Context document data from MongoDB.
-    #    - retry_count: Number of retry attempts (used for exponential backoff).
     # Returns:
     #    - str: Generated answer from GPT-3.5-turbo.
     
-    # Formulate the conversation with user's question and context
-    conversation = [  
-        {"role": "system", "content": "You are an experienced MongoDB sales executive, skilled in identifiying pains associated with using other databases and explaining how the MongoDB Database and MongoDB Atlas can address those pains and drive business value."},
-        {"role": "assistant", "content": context},
-        {"role": "user", "content": user_question + " Write the response from MongoDB's perspective and make it concise and suitable for C level audiences with headings, paragraphs, newlines and bullet points where it makes sense."}
-    ]
+    conversation = build_conversation(user_question, context)
 
     try:
-        completion = client.chat.completions.create(
-            # model="gpt-3.5-turbo",
-            model="gpt-4-turbo-preview",
-            messages=conversation,
-            # temperature=temp,
-            # max_tokens=tokens
-        )
+        # Wait for the shared rate limiter and retry rate limits / transient errors with jittered backoff
+        with span("completion"):
+            completion = retry_policy.call(
+                lambda: client.chat.completions.create(
+                    # model="gpt-3.5-turbo",
+                    model=chat_model,
+                    messages=conversation,
+                    # temperature=temp,
+                    # max_tokens=tokens
+                ),
+                limiter=openai_limiter,
+                tokens=sum(estimate_tokens(message["content"]) for message in conversation) + tokens,
+                retry_on=retryable_errors,
+            )
+        record_tokens(completion.usage)
         # Extract the generated answer from the response
         answer = completion.choices[0].message
         return answer
 
-    except RateLimitError as rle:
-        # Exponential backoff before retrying
-        retry_count += 1
-        delay = 2 ** retry_count
-        print(f"Rate Limit Exceeded. Retrying in {delay} seconds...")
-        time.sleep(delay)
-        return make_rag_request(user_question, context, retry_count)
-
     except OpenAIError as e:
         print(f"OpenAI Error: {e}")
         return "An error occurred."
 
+def stream_rag_request(user_question, context, tokens=1000):
+    # Make a streaming RAG request with user's question and context.
+    # Parameters:
+    #    - user_question: The user's question.
+    #    - context: Context document data from MongoDB.
+    # Yields:
+    #    - str: The answer generated so far, growing as tokens arrive.
+
+    conversation = build_conversation(user_question, context)
+    # Kept here: the generator may be resumed from other worker threads
+    record = current_request()
+
+    try:
+        with span("completion"):
+            start = time.perf_counter()
+            # Only opening the stream is retried; once tokens flow they are passed straight through
+            stream = retry_policy.call(
+                lambda: client.chat.completions.create(
+                    model=chat_model,
+                    messages=conversation,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ),
+                limiter=openai_limiter,
+                tokens=sum(estimate_tokens(message["content"]) for message in conversation) + tokens,
+                retry_on=retryable_errors,
+            )
+            answer = ""
+            for chunk in stream:
+                # The last chunk carries the token usage and no choices
+                record_tokens(chunk.usage, record)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not answer:
+                        observe_stage("first_token", time.perf_counter() - start, record)
+                    answer += chunk.choices[0].delta.content
+                    yield answer
+
+    except OpenAIError as e:
+        print(f"OpenAI Error: {e}")
+        yield "An error occurred."
+
 
 def gradio_interface(message, history):
     if message:
-        context = get_context_from_mongodb(message)
-        answer_object = make_rag_request(message, context)
-        # Access the content attribute of ChatCompletionMessage
-        answer_content = answer_object.content
-        # Render HTML tags
-        return answer_content
+        # Timing record of this request, logged when the answer is complete
+        record = start_request(question_chars=len(message))
+        try:
+            query_vector, context_ids, context = retrieve_context(message)
+            # Reuse a cached answer for a similar question over the same proof points
+            cached_answer = answer_cache.lookup(query_vector, context_ids, context)
+            record.fields["cache_hit"] = cached_answer is not None
+            if cached_answer is not None:
+                yield cached_answer
+                return
+            if stream_responses:
+                # Send partial answers to the browser as soon as the first tokens arrive
+                answer_content = None
+                for answer_content in stream_rag_request(message, context):
+                    yield answer_content
+                if answer_content and answer_content != "An error occurred.":
+                    answer_cache.store(query_vector, context_ids, context, answer_content)
+                return
+            answer_object = make_rag_request(message, context)
+            # Access the content attribute of ChatCompletionMessage
+            answer_content = answer_object.content
+            answer_cache.store(query_vector, context_ids, context, answer_content)
+            # Render HTML tags
+            yield answer_content
+            return
+        finally:
+            finish_request(record)
     
-    return ""
+    yield ""
+
+async def retrieve_context_async(question):
+    # Async version of retrieve_context; the database and embedding round-trips do not block the event loop.
+    async def embed():
+        with span("embedding"):
+            return await async_embedding_client.embed_one(question)
+
+    async def text_search():
+        with span("text_search"):
+            return await retriever.atext_search(async_collection, question)
+
+    if isinstance(retriever, ChunkRetriever):
+        # The text ranking only needs the question, so it runs while the question is embedded
+        query_vector, text_ranking = await asyncio.gather(embed(), text_search())
+        with span("vector_search"):
+            result = await retriever.asearch(async_collection, query_vector, k=top_k, query_text=question,
+                                             text_ranking=text_ranking)
+    else:
+        query_vector = await embed()
+        with span("vector_search"):
+            result = await retriever.asearch(async_collection, query_vector, k=top_k, query_text=question)
+
+    # Token counting is CPU work; keep it off the event loop
+    with span("context"):
+        result_string = await asyncio.to_thread(build_context, question, result, context_token_budget, chat_model)
+    return query_vector, [document["_id"] for document in result], result_string
+
+async def make_rag_request_async(user_question, context, tokens=1000):
+    # Async version of make_rag_request.
+    conversation = build_conversation(user_question, context)
+
+    try:
+        with span("completion"):
+            completion = await retry_policy.call_async(
+                lambda: async_client.chat.completions.create(
+                    model=chat_model,
+                    messages=conversation,
+                ),
+                limiter=openai_limiter,
+                tokens=sum(estimate_tokens(message["content"]) for message in conversation) + tokens,
+                retry_on=retryable_errors,
+            )
+        record_tokens(completion.usage)
+        return completion.choices[0].message.content
+
+    except OpenAIError as e:
+        print(f"OpenAI Error: {e}")
+        return "An error occurred."
+
+async def stream_rag_request_async(user_question, context, tokens=1000):
+    # Async version of stream_rag_request.
+    conversation = build_conversation(user_question, context)
+    record = current_request()
+
+    try:
+        with span("completion"):
+            start = time.perf_counter()
+            # Only opening the stream is retried; once tokens flow they are passed straight through
+            stream = await retry_policy.call_async(
+                lambda: async_client.chat.completions.create(
+                    model=chat_model,
+                    messages=conversation,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ),
+                limiter=openai_limiter,
+                tokens=sum(estimate_tokens(message["content"]) for message in conversation) + tokens,
+                retry_on=retryable_errors,
+            )
+            answer = ""
+            async for chunk in stream:
+                # The last chunk carries the token usage and no choices
+                record_tokens(chunk.usage, record)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not answer:
+                        observe_stage("first_token", time.perf_counter() - start, record)
+                    answer += chunk.choices[0].delta.content
+                    yield answer
+
+    except OpenAIError as e:
+        print(f"OpenAI Error: {e}")
+        yield "An error occurred."
+
+async def gradio_interface_async(message, history):
+    if message:
+        # Timing record of this request, logged when the answer is complete
+        record = start_request(question_chars=len(message))
+        try:
+            query_vector, context_ids, context = await retrieve_context_async(message)
+            # Reuse a cached answer for a similar question over the same proof points
+            cached_answer = answer_cache.lookup(query_vector, context_ids, context)
+            record.fields["cache_hit"] = cached_answer is not None
+            if cached_answer is not None:
+                yield cached_answer
+                return
+            if stream_responses:
+                # Send partial answers to the browser as soon as the first tokens arrive
+                answer_content = None
+                async for answer_content in stream_rag_request_async(message, context):
+                    yield answer_content
+                if answer_content and answer_content != "An error occurred.":
+                    answer_cache.store(query_vector, context_ids, context, answer_content)
+                return
+            answer_content = await make_rag_request_async(message, context)
+            if answer_content != "An error occurred.":
+                answer_cache.store(query_vector, context_ids, context, answer_content)
+            yield answer_content
+            return
+        finally:
+            finish_request(record)
+
+    yield ""
 
 def main_with_gradio():
-    gr.ChatInterface(gradio_interface).launch()
+    # Prometheus metrics for the RAG stages, retries, rate-limit waits, caches and tokens
+    metrics_port = getattr(Config, "METRICS_PORT", 9100)
+    if metrics_port:
+        start_metrics_server(metrics_port)
+        print(f"Serving metrics on http://0.0.0.0:{metrics_port}/metrics")
+    interface = gr.ChatInterface(gradio_interface_async if async_webui else gradio_interface)
+    interface.queue(default_concurrency_limit=webui_concurrency).launch()
 
 if __name__ == "__main__":
     main_with_gradio()
@@ -7,25 +7,42 @@ The main steps include:
 1. Retrieving a user question.
 2. Obtaining context from MongoDB based on the user question.
 3. Generating an embedding for the user question using an external service.
-4. Using MongoDB's vector search to find relevant context documents.
-5. Filtering the retrieved document and forming a string representation.
+4. Using MongoDB's vector search (or an in-process index) to find relevant context documents.
+5. Packing the most relevant sections of the retrieved documents into a token budget.
 6. Making a RAG request to GPT-3.5-turbo, incorporating user question and context.
-7. Handling rate limit errors with exponential backoff.
+7. Handling rate limit errors with a shared rate limiter and jittered, capped backoff.
 8. Displaying the generated answer.
+
+`--batch FILE` (or `--batch -` for stdin) answers a JSONL file of questions instead of prompting:
+questions are embedded in batches, searched and answered concurrently under the shared rate
+limiter, and the answers are written as JSONL in input order with the retrieved ids and
+per-stage timings. A line that is not a question record, a batch whose embedding request fails and
+a question that fails to be answered each get an output record with an `error` field instead of an
+answer, and the run carries on.
 """
+import argparse
+import json
+import sys
 import time
-import requests
-from openai import OpenAI, OpenAIError, RateLimitError
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from openai import APIConnectionError, APITimeoutError, InternalServerError, OpenAI, OpenAIError, RateLimitError
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 from config import Config
+from context_budget import build_context
+from answer_cache import get_answer_cache
+from metrics import record_tokens, span
+from embedding_client import generate_embedding, get_embedding_client
+from retrieval import get_retriever
+from rate_limiter import estimate_tokens, get_rate_limiter, get_retry_policy
 
-# Initialize OpenAI client
-client = OpenAI()
-
-# HuggingFace API configuraiton
-hf_token = Config.HF_TOKEN
-embedding_url = Config.EMBEDDING_URL
+# Initialize OpenAI client; retries are handled by the shared retry policy
+client = OpenAI(max_retries=0)
+openai_limiter = get_rate_limiter("openai")
+retry_policy = get_retry_policy()
+retryable_errors = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+chat_model = "gpt-3.5-turbo"
 
 # MongoDB client setup
 uri = Config.MONGODB_URI
@@ -36,80 +53,52 @@ coll_name = Config.MONGODB_COLLECTION
 mongo_client = MongoClient(uri, server_api=ServerApi('1'))
 db = mongo_client[db_name]
 collection = db[coll_name]
+retriever = get_retriever(collection)
+# Number of proof points retrieved as context per question
+top_k = getattr(Config, "RETRIEVAL_TOP_K", 3)
+# Prompt tokens spent on retrieved context
+context_token_budget = getattr(Config, "CONTEXT_TOKEN_BUDGET", 2000)
 
-def generate_embedding(text: str) -> list[float]:
-    # Generate embedding for the question using the HuggingFace API.
-    # Parameters:
-    #    - text: The input text for which embedding is generated.
-    # Returns:
-    #    - List[float]: The generated embedding.
-    
-    # API throttling config 
-    max_retries = 5
-    retry_delay = 5  # seconds
-
-    for retry in range(max_retries): # API Retry Mechanism
-        response = requests.post(
-            embedding_url,
-            headers={"Authorization": f"Bearer {hf_token}"},
-            json={"inputs": text}
-        )
-
-        if response.status_code == 200:
-            return response.json()
-
-        if response.status_code == 503 and "Model is currently loading" in response.text:
-            print(f"Model loading, retrying in {retry_delay} seconds... (Retry {retry + 1}/{max_retries})")
-            time.sleep(retry_delay)
-        else:
-            raise ValueError(f"Request failed with status code {response.status_code}: {response.text}")
-
-    raise ValueError("Exceeded maximum number of retries. Model did not become available.")
+# Reuse answers for semantically similar questions over the same proof points
+answer_cache = get_answer_cache()
 
-def get_context_from_mongodb(question):
+def retrieve_context(question):
     # Retrieve context from MongoDB based on the vector representation of thee user's question.
     # Parameters:
     #    - question: The user's question.
     # Returns:
-    #    - str: String representation of relevant fields from the retrieved document.
+    #    - list[float]: The question embedding.
+    #    - list: Ids of the retrieved documents.
+    #    - str: String representation of relevant fields from the retrieved documents.
     
-    query_vector = generate_embedding(question)
-
-    # MongoDB vector search aggregation pipeline
-    pipeline = [
-        {
-            "$vectorSearch": {
-                "queryVector": query_vector,
-                "path": "embeddings.usecase_embedding",
-                "numCandidates": 10,
-                "limit": 1,
-                "index": "usecase_vector_index",
-            }
-        }
-    ]
+    with span("embedding"):
+        query_vector = generate_embedding(question)
+    return (query_vector, *search_context(question, query_vector))
+
+def search_context(question, query_vector):
+    # Retrieve context for a question that is already embedded.
+    # Returns:
+    #    - list: Ids of the retrieved documents.
+    #    - str: String representation of relevant fields from the retrieved documents.
+
+    # Search through the configured backend (Atlas $vectorSearch, the local index or hybrid chunk retrieval)
+    with span("vector_search"):
+        result = retriever.search(query_vector, k=top_k, query_text=question)
+
+    # Pack the most relevant sections of the retrieved proof points into the prompt token budget
+    with span("context"):
+        result_string = build_context(question, result, budget=context_token_budget, model=chat_model)
+    return [document["_id"] for document in result], result_string
+
+def get_context_from_mongodb(question):
+    # Retrieve the context string for the user's question (see retrieve_context).
+    return retrieve_context(question)[2]
 
-    # Execute the aggregation pipeline
-    results = collection.aggregate(pipeline)
-    # Extract the result from the aggregation response
-    result = list(results)
-
-    if result:
-        document = result[0]
-        excluded_fields = []
-        # Get all fields from the document, excluding specified ones
-        filtered_fields = {key: value for key, value in document.get("usecase", {}).items() if key not in excluded_fields}
-        # Convert the fields to a string
-        result_string = "\n".join([f"{key}: {value}" for key, value in filtered_fields.items()])
-        return result_string
-    else:
-        return ""
-
-def make_rag_request(user_question, context, retry_count=0, temp=0.5, tokens=1000):
+def make_rag_request(user_question, context, temp=0.5, tokens=1000):
     # Make a RAG request to GPT-3.5-turbo with user's question and context.
     # Parameters:
     #    - user_question: The user's question.
     #    - context: Context document data from MongoDB.
-    #    - retry_count: Number of retry attempts (used for exponential backoff).
     # Returns:
     #    - str: Generated answer from GPT-3.5-turbo.
     
@@ -121,43 +110,183 @@ def make_rag_request(user_question, context, retry_count=0, temp=0.5, tokens=100
     ]
 
     try:
-        completion = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=conversation,
-            # temperature=temp,
-            # max_tokens=tokens
-        )
+        # Wait for the shared rate limiter and retry rate limits / transient errors with jittered backoff
+        with span("completion"):
+            completion = retry_policy.call(
+                lambda: client.chat.completions.create(
+                    model=chat_model,
+                    messages=conversation,
+                    # temperature=temp,
+                    # max_tokens=tokens
+                ),
+                limiter=openai_limiter,
+                tokens=sum(estimate_tokens(message["content"]) for message in conversation) + tokens,
+                retry_on=retryable_errors,
+            )
+        record_tokens(completion.usage)
         # Extract the generated answer from the response
         answer = completion.choices[0].message
         return answer
 
-    except RateLimitError as rle:
-        # Exponential backoff before retrying
-        retry_count += 1
-        delay = 2 ** retry_count
-        print(f"Rate Limit Exceeded. Retrying in {delay} seconds...")
-        time.sleep(delay)
-        return make_rag_request(user_question, context, retry_count)
-
     except OpenAIError as e:
         print(f"OpenAI Error: {e}")
         return "An error occurred."
 
+def read_questions(source):
+    # Yield {"id", "question"} records from JSONL lines; a line may also be a bare JSON string.
+    # A line that is not a question yields {"id": line number, "error": ...} instead.
+    for line_number, line in enumerate(source, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield {"id": line_number, "error": f"Invalid JSON: {e}"}
+            continue
+        if isinstance(record, str):
+            record = {"question": record}
+        if not isinstance(record, dict) or not isinstance(record.get("question"), str):
+            yield {"id": line_number, "error": 'Expected a JSON string or an object with a "question" string'}
+            continue
+        record.setdefault("id", line_number)
+        yield record
+
+def answer_record(record, query_vector, embed_seconds):
+    # Search, build the context and answer one already embedded question.
+    # Returns the output record, with per-stage timings in seconds.
+    timings = {"embed_batch": round(embed_seconds, 4)}
+    output = {"id": record["id"], "question": record["question"]}
+    try:
+        start = time.perf_counter()
+        context_ids, context = search_context(record["question"], query_vector)
+        timings["search"] = round(time.perf_counter() - start, 4)
+        output["context_ids"] = [str(document_id) for document_id in context_ids]
+
+        start = time.perf_counter()
+        answer_content = answer_cache.lookup(query_vector, context_ids, context)
+        output["cached"] = answer_content is not None
+        if answer_content is None:
+            answer_object = make_rag_request(record["question"], context)
+            # make_rag_request returns an error string instead of a message when OpenAI fails
+            answer_content = getattr(answer_object, "content", answer_object)
+            if answer_object is not answer_content:
+                answer_cache.store(query_vector, context_ids, context, answer_content)
+        timings["answer"] = round(time.perf_counter() - start, 4)
+        output["answer"] = answer_content
+    except Exception as e:
+        output["error"] = f"{e.__class__.__name__}: {e}"
+    output["timings"] = timings
+    return output
+
+def answer_batch(source, destination, batch_size=32, concurrency=16):
+    # Answer every question of a JSONL source and write JSONL answers in input order.
+    # Parameters:
+    #    - source / destination: Text streams.
+    #    - batch_size: Questions embedded per request.
+    #    - concurrency: Questions searched and answered at the same time; the rate limiter paces the completions.
+    embedding_client = get_embedding_client()
+    # Bound the answers in flight so memory stays flat on large evaluation sets
+    pending = deque()
+    answered = read = 0
+    started = time.perf_counter()
+
+    def write_oldest():
+        destination.write(json.dumps(pending.popleft().result(), ensure_ascii=False) + "\n")
+        destination.flush()
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        batch = []
+        for record in read_questions(source):
+            read += 1
+            batch.append(record)
+            if len(batch) < batch_size:
+                continue
+            answered += _submit_batch(batch, embedding_client, executor, pending)
+            batch = []
+            # Stream finished answers as soon as everything before them is written
+            while pending and (pending[0].done() or len(pending) > 4 * concurrency):
+                write_oldest()
+        if batch:
+            answered += _submit_batch(batch, embedding_client, executor, pending)
+        while pending:
+            write_oldest()
+
+    elapsed = time.perf_counter() - started
+    print(f"Answered {answered} of {read} questions in {elapsed:.1f} seconds ({read - answered} could not be embedded or read), "
+          f"{openai_limiter.waited:.1f} seconds waiting on the rate limiter, {retry_policy.retries} retries.",
+          file=sys.stderr)
+
+def _finished(output):
+    # A future that is already done, so error records keep their place among the pending answers
+    future = Future()
+    future.set_result(output)
+    return future
+
+def _submit_batch(batch, embedding_client, executor, pending):
+    # Embed a batch of questions in one request, then fan out the searches and completions.
+    # Unreadable lines and the questions of a batch that fails to embed get error records.
+    # Returns the number of questions submitted for answering.
+    questions = [record["question"] for record in batch if "error" not in record]
+    start = time.perf_counter()
+    vectors, error = iter(()), None
+    if questions:
+        try:
+            vectors = iter(embedding_client.embed(questions))
+        except Exception as e:
+            print(f"Embedding failed for a batch of {len(questions)} questions: {e}", file=sys.stderr)
+            error = f"{e.__class__.__name__}: {e}"
+    embed_seconds = time.perf_counter() - start
+    submitted = 0
+    for record in batch:
+        if "error" in record:
+            pending.append(_finished(record))
+        elif error is not None:
+            pending.append(_finished({"id": record["id"], "question": record["question"], "error": error,
+                                      "timings": {"embed_batch": round(embed_seconds, 4)}}))
+        else:
+            pending.append(executor.submit(answer_record, record, next(vectors), embed_seconds))
+            submitted += 1
+    return submitted
+
 def main():
     # Main function to execute the workflow:
     # 1. Prompt user for a question.
     # 2. Get context from MongoDB based on a vector representation of the the user's question.
     # 3. Make a RAG request to GPT-3.5-turbo.
     # 4. Display the generated answer.
+    parser = argparse.ArgumentParser(description="Answer questions about proof points.")
+    parser.add_argument("--batch", help="JSONL file of questions to answer, or - for stdin.")
+    parser.add_argument("--output", help="JSONL file for the answers (default: stdout).")
+    parser.add_argument("--batch-size", type=int, default=getattr(Config, "EMBEDDING_BATCH_SIZE", 32),
+                        help="Questions embedded per request.")
+    parser.add_argument("--concurrency", type=int, default=getattr(Config, "BATCH_QA_CONCURRENCY", 16),
+                        help="Questions searched and answered at the same time.")
+    args = parser.parse_args()
+
+    if args.batch:
+        source = sys.stdin if args.batch == "-" else open(args.batch, "r", encoding="utf-8")
+        destination = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            answer_batch(source, destination, batch_size=args.batch_size, concurrency=args.concurrency)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if destination is not sys.stdout:
+                destination.close()
+        return
 
     # Prompt the user for a question and store it in a string variable
     user_question = input("Enter your question: ")
     # Get context from MongoDB
-    context = get_context_from_mongodb(user_question)
-    # Make RAG request
-    answer_object = make_rag_request(user_question, context)
-    # Access the content attribute of ChatCompletionMessage
-    answer_content = answer_object.content
+    query_vector, context_ids, context = retrieve_context(user_question)
+    # Reuse a cached answer for a similar question over the same proof points
+    answer_content = answer_cache.lookup(query_vector, context_ids, context)
+    if answer_content is None:
+        # Make RAG request
+        answer_object = make_rag_request(user_question, context)
+        # Access the content attribute of ChatCompletionMessage
+        answer_content = answer_object.content
+        answer_cache.store(query_vector, context_ids, context, answer_content)
 
     # Print the generated answer
     print(f"Answer: {answer_content}")
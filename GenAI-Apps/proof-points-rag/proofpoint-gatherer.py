@@ -1,182 +1,374 @@
-import re
-import time
-import requests
+import argparse
+import asyncio
 import json
-from bs4 import BeautifulSoup
-from openai import OpenAI, OpenAIError, RateLimitError
+from openai import APIConnectionError, APITimeoutError, InternalServerError, OpenAI, OpenAIError, RateLimitError
 from datetime import datetime, timedelta
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 from config import Config
+from async_pipeline import Stage, run_pipeline
+from bulk_writer import BulkWriter
+from html_content import extract_content
+from progress_journal import ProgressJournal
+from embedding_cache import get_embedding_cache
+from extraction_batch import batch_line, read_results, submit_batches, wait_for_batches
+from extraction_schema import (PROOF_POINT_SCHEMA, field_request, invalid_fields, merge_fields, parse_extraction, parse_json,
+                               response_format, schema_template, to_document)
+from page_cache import get_page_cache
+from story_discovery import discover_stories
+from rate_limiter import estimate_tokens, get_rate_limiter, get_retry_policy
 
 # Use configuration constants
 uri = Config.MONGODB_URI
 db_name = Config.MONGODB_DATABASE
 coll_name = Config.MONGODB_COLLECTION
+# Site the customer story links are relative to
+base_url = getattr(Config, "CUSTOMER_STORIES_BASE_URL", "https://www.mongodb.com")
 
 # Create a new MongoDB client and connect to the server
 client = MongoClient(uri, server_api=ServerApi('1'))
 db = client[db_name]
 collection = db[coll_name]
 
-# Initialize OpenAI client
-client = OpenAI()
+# Initialize OpenAI client; retries are handled by the shared retry policy
+client = OpenAI(max_retries=0)
+openai_limiter = get_rate_limiter("openai")
+retry_policy = get_retry_policy()
+retryable_errors = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+extraction_model = getattr(Config, "EXTRACTION_MODEL", "gpt-4-turbo-preview")
+# "json_schema" (strict structured outputs) needs a model that supports them; JSON mode works with gpt-4-turbo
+extraction_format = response_format(getattr(Config, "EXTRACTION_RESPONSE_FORMAT", "json_object"))
+# Follow-up requests for fields that are still invalid after local repair
+max_reasks = getattr(Config, "EXTRACTION_MAX_REASKS", 1)
+embedding_cache = get_embedding_cache()
+# Persistent page cache over a pooled session
+page_cache = get_page_cache()
+# Progress of every story across runs, opened in main()
+journal = None
 
 def get_embedding(text, model="text-embedding-3-small"):
    text = text.replace("\n", " ")
-   return client.embeddings.create(input = [text], model=model).data[0].embedding
-
-def clean_text(text):
-    cleaned_text = re.sub(r'\n|\s+', ' ', text.strip())
-    cleaned_text = re.sub(r'\s+', ' ', cleaned_text)
-    return cleaned_text
-
-def extract_customer_info(div):
-    link = div.find('a', href=True)
-    customer_story_url = link.get('href') if link else None
-
-    relative_div = div.find('div', class_='relative')
-    customer_logo_url = relative_div.find('img')['src'] if relative_div and relative_div.find('img') else None
-
-    overview_span = div.find('div', class_='fnt-18 dark-gray m-b-20').find('span')
-    customer_story_overview = clean_text(overview_span.get_text(strip=True)) if overview_span else None
-
-    customer_info = {
-        "customer_story_url": customer_story_url,
-        "customer_logo_url": customer_logo_url,
-        "customer_story_overview": customer_story_overview
-    }
-
-    return customer_info
-
-def get_customer_stories(file_path):
-    customer_info_array = []
-
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-
-        soup = BeautifulSoup(content, 'html.parser')
-
-        target_divs = soup.find_all('div', class_='who-uses-mongodb__CustomerContainer-sc-1047abz-1 jERciZ')
-
-        for div in target_divs:
-            customer_info = extract_customer_info(div)
-            customer_info_array.append(customer_info)
+   # Only texts missing from the persistent cache are sent to OpenAI
+   return embedding_cache.get_or_compute(
+      model, [text],
+      lambda texts: [item.embedding for item in retry_policy.call(
+         lambda: client.embeddings.create(input=texts, model=model),
+         limiter=openai_limiter, tokens=sum(estimate_tokens(t) for t in texts), retry_on=retryable_errors).data])[0]
+
+def get_customer_stories(source, max_pages=50):
+    # Lazily discover the customer stories of a listing page, paginated listing url or sitemap;
+    # the pipeline starts on the first stories while the rest of the listing is still being read
+    return discover_stories(source, base_url, max_pages=max_pages, session=page_cache.session)
+
+def extraction_messages(customer_story_html, desired_schema):
+    return [
+        {"role": "system", "content": "You are a sales and marketing expert, skilled in building customer success stories. You will take html data from a user about a customer success story, then extract and use all the data to create a data rich json document aligned to the data model provided. Please make the 'challenges', 'solutions' and 'results' paragraph arrays detailed. Please only return the json document without code tag wrappers and no other comments or statements"},
+        {"role": "assistant", "content": "This is the data model: " + desired_schema},
+        {"role": "user", "content": "This is the html data:" + customer_story_html}
+    ]
 
-        return customer_info_array
+def make_rag_request(customer_story_html, desired_schema):
+    return request_completion(extraction_messages(customer_story_html, desired_schema), 4096)
 
-    except FileNotFoundError:
-        print(f"File not found: {file_path}")
+def extraction_body(customer_story_html):
+    # Request body of an extraction, as sent in a Batch API input file
+    return {"model": extraction_model, "messages": extraction_messages(customer_story_html, desired_schema),
+            "response_format": extraction_format}
 
-def make_rag_request(customer_story_html, desired_schema, retry_count=0):
+def make_field_request(customer_story_html, errors):
+    # Ask again for only the invalid or missing fields of an extraction
     conversation = [
-        {"role": "system", "content": "You are a sales and marketing expert, skilled in building customer success stories. You will take html data from a user about a customer success story, then extract and use all the data to create a data rich json document aligned to the data model provided. Please make the 'challenges', 'solutions' and 'results' paragraph arrays detailed. Please only return the json document without code tag wrappers and no other comments or statements"},
-        {"role": "assistant", "content": "This is the data model: " + desired_schema},
-        {"role": "user", "content": "This is the html data:" + customer_story_html}
+        {"role": "system", "content": "You are a sales and marketing expert, skilled in building customer success stories. You will take html data from a user about a customer success story and return the requested fields as a json object, without code tag wrappers and no other comments or statements"},
+        {"role": "user", "content": "This is the html data:" + customer_story_html},
+        {"role": "user", "content": field_request(errors)}
     ]
+    return request_completion(conversation, 1024)
 
+def request_completion(conversation, max_output_tokens):
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=conversation
+        # Wait for the shared rate limiter and retry rate limits / transient errors with jittered backoff
+        completion = retry_policy.call(
+            lambda: client.chat.completions.create(
+                model=extraction_model,
+                messages=conversation,
+                # JSON mode, or strict structured outputs with the proof point schema
+                response_format=extraction_format
+            ),
+            limiter=openai_limiter,
+            tokens=sum(estimate_tokens(message["content"]) for message in conversation) + max_output_tokens,
+            retry_on=retryable_errors,
         )
         answer = completion.choices[0].message
         return answer
 
-    except RateLimitError as rle:
-        retry_count += 1
-        delay = 2 ** retry_count
-        print(f"Rate Limit Exceeded. Retrying in {delay} seconds...")
-        time.sleep(delay)
-        return make_rag_request(customer_story_html, desired_schema, retry_count)
-
     except OpenAIError as e:
         print(f"OpenAI Error: {e}")
         return "An error occurred."
 
-def get_html_content(url, allowed_tags=None):
-    # Check if 'https://www.mongodb.com' is missing and append it
-    if not url.startswith('https://www.mongodb.com'):
-        url = 'https://www.mongodb.com' + url
-
-    response = requests.get(url)
-    if response.status_code == 200:
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Remove <img>, <svg>, and <style> tags and their inner content
-        for tag in soup.find_all(['img', 'svg', 'style']):
-            tag.decompose()
-
-        # Remove <span> tags with empty inner content
-        for span in soup.find_all('span'):
-            if not span.get_text(strip=True):
-                span.decompose()
-
-        if allowed_tags:
-            allowed_tags = set(allowed_tags)
-            text_content = ""
-            for tag in soup.find_all():
-                if tag.name in allowed_tags:
-                    text_content += str(tag) + ' '
-
-            return text_content.strip()
-        else:
-            return response.text.strip()
+def extract_proof_point(customer_story_html):
+    # Extract a schema-valid proof point: repair the completion locally, then re-ask only for the fields still invalid
+    answer_object = make_rag_request(customer_story_html, desired_schema)
+    if isinstance(answer_object, str):
+        raise ValueError(f"Extraction failed: {answer_object}")
+    return repair_proof_point(customer_story_html, parse_extraction(answer_object.content))
+
+def repair_proof_point(customer_story_html, proof_point):
+    # Re-ask only for the fields of a locally repaired extraction that are still invalid
+    errors = invalid_fields(proof_point)
+    for _ in range(max_reasks):
+        if not errors:
+            break
+        print(f"Re-asking {len(errors)} invalid fields: {', '.join(errors)}")
+        answer_object = make_field_request(customer_story_html, errors)
+        if isinstance(answer_object, str):
+            break
+        merge_fields(proof_point, parse_json(answer_object.content))
+        errors = invalid_fields(proof_point)
+    if errors:
+        raise ValueError(f"Extraction does not match the schema: {errors}")
+    return proof_point
+
+def page_content(page, allowed_tags=None):
+    if allowed_tags:
+        # One pass over the page: deduplicated blocks of the main article region as minimal markup
+        content, stats = extract_content(page.text, allowed_tags)
+        print(f"Extracted {page.url}: {stats['input_chars']} -> {stats['output_chars']} characters "
+              f"({stats['blocks']} blocks, {stats['duplicates']} duplicates dropped)")
+        return content
     else:
-        raise Exception(f"Failed to fetch HTML content from {url}")\
-
-
-def main():
-    html_file_path = "test.html" # A web page with a list of customer story page urls with overviews and links to the logo image
-    customer_info_array = get_customer_stories(html_file_path)
-
-    desired_schema = '''
-    {'customer': {'company_name': string, 'logo_url': string, 'website_url': string, 'size': integer, 'about': array of string sentences, 'founded': integer, 'industry': string, 'specialties': array of strings, 'headquarters': string, 'tech_stack': array of string sentences},
-    'usecase': {'type': string, 'title': string, 'overview': string, 'introduction': {'heading': string, 'paragraphs': array of string sentences},
-    'challenges': [{'heading': string, 'paragraphs': array of string sentences}],
-    'solutions': [{'heading': string, 'paragraphs': array of string sentences}, {'heading': string, 'paragraphs': array of string sentences}],
-    'results': [{'heading': string, 'paragraphs': array of string sentences}],
-    'quotes': [{'person': string, 'role': string, 'company': string, 'quote': string}, {'person': string, 'role': string, 'company': string, 'quote': string}],
-    'metrics': [{'kpi': string, 'result': string}, {'kpi': string, 'result': string}, {'kpi': string, 'result': string}, {'kpi': string, 'result': string}]},
-    'champion': {'name': string, 'role': string, 'responsibilities': string},
-    'region': {'country': string, 'city': string, 'continent': string},
-    'account': {'mongodb_products': array of string sentences, 'mongodb_services': array of string sentences, 'deal_type': string, 'date_signed': ISODate, 'acc_owner': string,
-    'sales_motion': string, 'value_drivers': array of string sentences, 'why_do_anything': array of string sentences, 'why_now': array of string sentences, 'why_mongodb': array of string sentences, 'sfdc_acc_link': string},
-    'date_proof_point_created': ISODate, 'link_to_deck': string, 'link_to_web': string, 'customer_validated': boolean}
-    '''
-
-    for customer_info in customer_info_array:
-        customer_story_url = customer_info.get("customer_story_url")
-        customer_logo_url = customer_info.get("customer_logo_url")
-        customer_story_overview = customer_info.get("customer_story_overview")
-
-        # Specify the allowed tags
-        allowed_tags = ['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'strong', 'b', 'em', 'span', 'blockquote', 'cite']
-
-        # Fetch HTML content including customer_logo_url and customer_story_overview
-        customer_story_html = get_html_content(customer_story_url, allowed_tags)
-        customer_story_html += f"<p>customer_logo_url='{customer_logo_url}' and customer_story_overview='{customer_story_overview}'</p>"
+        return page.text.strip()
 
+def get_html_content(url, allowed_tags=None):
+    # Check if the base url is missing and append it
+    if not url.startswith(base_url):
+        url = base_url + url
+
+    # Pooled keep-alive session; cached pages are revalidated with ETag / If-Modified-Since
+    return page_content(page_cache.fetch(url), allowed_tags)
+
+
+# Data model the LLM extracts each customer story into, derived from proofpoint-schema.json
+desired_schema = schema_template(PROOF_POINT_SCHEMA)
+
+# Specify the allowed tags
+allowed_tags = ['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'strong', 'b', 'em', 'span', 'blockquote', 'cite']
+
+def story_url(url):
+    # Absolute story url; also the key of the story in the progress journal and in the collection
+    return url if url.startswith(base_url) else base_url + url
+
+def fetch_story(customer_info):
+    url = story_url(customer_info.get("customer_story_url"))
+    entry = journal.get(url)
+    if journal.is_done(url):
+        # Only reached with --refresh: re-extract the story only if its page changed
+        page = page_cache.fetch(url)
+        if not page.changed:
+            return None
+        print(f"Page changed: {url}")
+        entry = None
+    else:
+        page = None
+
+    if entry and "proof_point_data" in entry["payload"]:
+        # Extracted in an earlier run; never pay for the same extraction twice
+        return {**customer_info, "url": url, "proof_point_data": entry["payload"]["proof_point_data"]}
+    if entry and "html" in entry["payload"]:
+        return {**customer_info, "url": url, "html": entry["payload"]["html"]}
+
+    # Fetch HTML content including customer_logo_url and customer_story_overview
+    customer_story_html = page_content(page or page_cache.fetch(url), allowed_tags)
+    customer_story_html += f"<p>customer_logo_url='{customer_info.get('customer_logo_url')}' and customer_story_overview='{customer_info.get('customer_story_overview')}'</p>"
+    journal.record(url, "fetched", {"html": customer_story_html})
+    return {**customer_info, "url": url, "html": customer_story_html}
+
+def extract_story(story):
+    if "proof_point_data" not in story:
         # Make RAG request
-        answer_object = make_rag_request(customer_story_html, desired_schema)
-        proof_point_data = answer_object.content
-        result_embeddings = get_embedding(proof_point_data)
-
-        # Parse the JSON-formatted string into a dictionary
-        proof_point_data_dict = json.loads(proof_point_data)
-
+        story["proof_point_data"] = json.dumps(extract_proof_point(story["html"]))
+    # Parse the JSON-formatted string into a dictionary
+    story["proof_point_data_dict"] = json.loads(story["proof_point_data"])
+    # Only schema-valid extractions are kept; the fetched html is no longer needed
+    journal.record(story["url"], "extracted", {"proof_point_data": story["proof_point_data"]})
+    return story
+
+def embed_story(story):
+    # Embeddings are not journaled: a rerun reads them from the embedding cache
+    story["embeddings"] = get_embedding(story["proof_point_data"])
+    journal.record(story["url"], "embedded")
+    return story
+
+def build_stages(writer, written, fetch_concurrency=8, extract_concurrency=4, embed_concurrency=4):
+    """
+    Build the fetch -> extract -> embed -> write pipeline stages, each with its own concurrency limit.
+    Urls of the stories queued on the writer are appended to `written`.
+    """
+    def write_story(story):
         proof_point = {
-            **proof_point_data_dict,
-            "embeddings": result_embeddings
+            **to_document(story["proof_point_data_dict"]),
+            "link_to_web": story["url"],
+            # A sub-document, so the updater can add the use case embedding and fingerprints next to it
+            "embeddings": {"openai_embedding": story["embeddings"]}
         }
-        
-        # Insert document into MongoDB collection
-        collection.insert_one(proof_point)
+        # Queue an upsert keyed by the story url, so a rerun replaces the document instead of duplicating it
+        writer.replace_one({"link_to_web": story["url"]}, proof_point, upsert=True, key=story["url"])
+        written.append(story["url"])
+        print(f"Customer Story URL: {story['url']}")
+
+    return [
+        Stage("fetch", fetch_story, concurrency=fetch_concurrency),
+        Stage("extract", extract_story, concurrency=extract_concurrency),
+        Stage("embed", embed_story, concurrency=embed_concurrency),
+        Stage("write", write_story, concurrency=1),
+    ]
+
+def record_failures(stages):
+    for stage in stages:
+        for story, error in stage.errors:
+            url = story.get("url") or story.get("customer_story_url")
+            if url:
+                journal.fail(story_url(url), stage.name, repr(error))
+
+def prepare_batch(stories, fetch_concurrency=8):
+    """
+    Fetch the pending stories and return the Batch API request lines of the ones not extracted yet.
+    """
+    lines = []
+    queued = set()
+
+    def queue_story(story):
+        # Extractions journaled by an earlier run are not requested again; the url is the custom_id, so it must be unique
+        if "proof_point_data" not in story and story["url"] not in queued:
+            queued.add(story["url"])
+            lines.append(batch_line(story["url"], extraction_body(story["html"])))
+
+    stages = [Stage("fetch", fetch_story, concurrency=fetch_concurrency), Stage("queue", queue_story, concurrency=1)]
+    stats = asyncio.run(run_pipeline(stories, stages))
+    record_failures(stages)
+    return lines, stats
+
+def ingest_batch_results(batch_client, batches):
+    """
+    Validate the extractions of finished batches and journal them; invalid fields get the same targeted re-ask as interactive extractions.
+    """
+    counts = {"extracted": 0, "repaired": 0, "failed": 0}
+    for batch in batches.values():
+        for url, content, error in read_results(batch_client, batch):
+            try:
+                if error or content is None:
+                    raise ValueError(f"Batch request failed: {error or 'no content'}")
+                proof_point = parse_extraction(content)
+                if invalid_fields(proof_point):
+                    counts["repaired"] += 1
+                    entry = journal.get(url)
+                    proof_point = repair_proof_point(entry["payload"].get("html", "") if entry else "", proof_point)
+            except ValueError as e:
+                # The fetched html stays journaled, so the next run requests the story again
+                journal.fail(url, "extract", repr(e))
+                counts["failed"] += 1
+                continue
+            journal.record(url, "extracted", {"proof_point_data": json.dumps(proof_point)})
+            counts["extracted"] += 1
+    return counts
 
-        print(f"Customer Story URL: {customer_story_url}")
-        print("-" * 100)
+def main():
+    parser = argparse.ArgumentParser(description="Extract proof points from MongoDB customer stories.")
+    parser.add_argument("--listing", default="test.html",
+                        help="A web page (path or url) with a list of customer story page urls with overviews and links to the logo image, or a sitemap (.xml).")
+    parser.add_argument("--max-pages", type=int, default=getattr(Config, "DISCOVERY_MAX_PAGES", 50),
+                        help="Maximum number of paginated listing pages to follow.")
+    parser.add_argument("--fetch-concurrency", type=int, default=getattr(Config, "GATHERER_FETCH_CONCURRENCY", 8))
+    parser.add_argument("--extract-concurrency", type=int, default=getattr(Config, "GATHERER_EXTRACT_CONCURRENCY", 4))
+    parser.add_argument("--embed-concurrency", type=int, default=getattr(Config, "GATHERER_EMBED_CONCURRENCY", 4))
+    parser.add_argument("--journal", default=getattr(Config, "JOURNAL_PATH", "progress-journal.sqlite3"),
+                        help="SQLite file recording the progress of every story, so reruns resume where they stopped.")
+    parser.add_argument("--restart", action="store_true", help="Forget the recorded progress and process every story.")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Revalidate written stories and re-extract the ones whose page changed.")
+    parser.add_argument("--batch", action="store_true",
+                        help="Extract through the OpenAI Batch API: submit all extractions, wait for the batches, then embed and write.")
+    parser.add_argument("--batch-dir", default=getattr(Config, "BATCH_DIR", "batches"),
+                        help="Directory the batch input files are written to.")
+    parser.add_argument("--batch-poll", type=float, default=getattr(Config, "BATCH_POLL_SECONDS", 60.0),
+                        help="Seconds between batch status polls.")
+    parser.add_argument("--batch-size", type=int, default=getattr(Config, "BATCH_MAX_REQUESTS", 50000),
+                        help="Maximum number of requests per batch.")
+    args = parser.parse_args()
+
+    global journal
+    journal = ProgressJournal(args.journal, "gatherer")
+    if args.restart:
+        journal.reset()
+
+    counts = {"discovered": 0, "already_written": 0, "without_url": 0, "duplicates": 0}
+
+    def pending_stories(counts, refresh=False):
+        # Skip stories written by an earlier run; failed and interrupted ones resume at their failed stage
+        seen = set()
+        for info in get_customer_stories(args.listing, args.max_pages):
+            counts["discovered"] += 1
+            if not info.get("customer_story_url"):
+                counts["without_url"] += 1
+                continue
+            # Listings link the same story by relative and absolute url; compare the normalized ones
+            url = story_url(info["customer_story_url"])
+            if url in seen:
+                counts["duplicates"] += 1
+                continue
+            seen.add(url)
+            if not refresh and journal.is_done(url):
+                counts["already_written"] += 1
+                continue
+            yield info
+
+    if args.batch:
+        # Submitted batches are kept as a checkpoint, so an interrupted run resumes polling instead of resubmitting
+        batch_journal = ProgressJournal(args.journal, "gatherer-batch")
+        if args.restart:
+            batch_journal.reset()
+        # Few calls, so the client's own retries are enough; the interactive rate limiter is not used
+        batch_client = OpenAI()
+        # Discover once: the same stories are batched, then embedded and written
+        discovered = list(pending_stories(counts, args.refresh))
+        batch_ids = batch_journal.checkpoint()
+        if batch_ids:
+            print(f"Resuming {len(batch_ids)} submitted batches")
+        else:
+            lines, fetch_stats = prepare_batch(discovered, args.fetch_concurrency)
+            print(f"Fetch: {fetch_stats}")
+            print(f"Queued {len(lines)} extractions")
+            batch_ids = submit_batches(batch_client, lines, args.batch_dir, max_requests=args.batch_size,
+                                       metadata={"job": "proofpoint-gatherer"})
+            batch_journal.set_checkpoint(batch_ids or None)
+        if batch_ids:
+            batches = wait_for_batches(batch_client, batch_ids, args.batch_poll)
+            print(f"Batch results: {ingest_batch_results(batch_client, batches)}")
+            batch_journal.set_checkpoint(None)
+        # Embed and write only the extracted stories; failed extractions are left for the next run
+        stories = [info for info in discovered if journal.completed(story_url(info["customer_story_url"]), "extracted")]
+    else:
+        stories = pending_stories(counts, args.refresh)
+
+    collection.create_index("link_to_web")
+    # Buffer upserts and send them to MongoDB as bulk writes
+    writer = BulkWriter(collection, max_ops=getattr(Config, "BULK_WRITE_MAX_OPS", 1000))
+    written = []
+    stages = build_stages(writer, written, args.fetch_concurrency, args.extract_concurrency, args.embed_concurrency)
+    stats = asyncio.run(run_pipeline(stories, stages))
+
+    failures = writer.flush()
+    # Only mark stories written once their upserts reached MongoDB; failed upserts are retried by the next run
+    failed = {url for url, _ in failures}
+    journal.record_many([url for url in written if url not in failed], "written")
+    for url, error in failures:
+        journal.fail(url, "write", error)
+    record_failures(stages)
+    print("-" * 100)
+    print(f"Discovery: {counts}")
+    print(f"Pipeline: {stats}")
+    print(f"Bulk writes: {writer.stats()}")
+    print(f"Progress: {journal.summary()}")
+    print(f"Page cache: {page_cache.stats()}")
 
 if __name__ == "__main__":
     main()
-
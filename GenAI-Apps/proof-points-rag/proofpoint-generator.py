@@ -1,14 +1,16 @@
 # Import necessary libraries
+import argparse
+import multiprocessing
 import random
-import time
-import requests
 import re
+import sys
 from datetime import datetime, timedelta
 from faker import Faker
 from geonamescache import GeonamesCache
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 from config import Config
+from bulk_writer import BulkWriter
 
 # Author: Peter Smith
 # Summary:
@@ -18,31 +20,26 @@ from config import Config
 
 # Library Initialization:
 # - `Faker` is used to generate fake data, including company names, addresses, and various other details.
-# - `GeonamesCache` is used to obtain geographical data for selecting random cities, countries, and continents.
-# - `requests` is used for making HTTP requests to the Hugging Face API to generate text embeddings.
+# - `GeonamesCache` is used once at startup to resolve the tech cities to their countries and continents.
 # - `MongoClient` and related classes from `pymongo` are used for connecting to MongoDB Atlas and interacting with the database.
 
-# Hugging Face API and MongoDB Connection Details:
-# - `hf_token` and `embedding_url` store access details for the Hugging Face API, specifically the sentence-transformers pipeline.
-# - `uri`, `client`, `db`, and `collection` store MongoDB Atlas connection details and references to the target database and collection.
+# MongoDB Connection Details:
+# - `uri`, `db_name` and `coll_name` store MongoDB Atlas connection details for the target database and collection.
+# - Use case embeddings are not generated here; run `proofpoint-updater.py` afterwards to embed the new documents.
+
+# Parallel Generation:
+# - `--workers N` generates chunks of documents in N processes, each with its own Faker and the location table
+#   resolved once by the main process (passed through the pool initializer, so spawned workers do not rebuild it),
+#   while the main process inserts the chunks in bulk. Each chunk is seeded from `--seed` and its index,
+#   so a run is reproducible for a given seed, count and chunk size.
 
 # Use configuration constants
 uri = Config.MONGODB_URI
 db_name = Config.MONGODB_DATABASE
 coll_name = Config.MONGODB_COLLECTION
-hf_token = Config.HF_TOKEN
-embedding_url = Config.EMBEDDING_URL
-num_proof_points = Config.NUM_PROOF_POINTS
 
-# Initialize Faker for generating fake data
+# Initialize Faker for generating fake data (one instance per process, reseeded per chunk)
 fake = Faker()
-# Initialize GeoNamesCache
-gc = GeonamesCache()
-
-# Create a new MongoDB client and connect to the server
-client = MongoClient(uri, server_api=ServerApi('1'))
-db = client[db_name]
-collection = db[coll_name]
 
 # List of the top 50 tech cities
 tech_cities = [
@@ -106,37 +103,6 @@ tech_types = [
     "C#", ".NET", "Snowflake", "BigQuery", "Tableau", "PowerBI", "Active Directory", "MySQL", "DynamoDB", "DocumentDB", "CosmosDB"
 ]
 
-def generate_embedding(text: str) -> list[float]:
-    """
-    Generate embedding for the given text using the Hugging Face API.
-    Args:
-        text (str): Input text to generate embedding.
-    Returns:
-        list[float]: List of embeddings.
-    """
-    # Maximum number of retries and delay between retries
-    max_retries = 5
-    retry_delay = 5  # seconds
-
-    for retry in range(max_retries):
-        # Send a request to the Hugging Face API
-        response = requests.post(
-            embedding_url,
-            headers={"Authorization": f"Bearer {hf_token}"},
-            json={"inputs": text})
-        # Check the response status code
-        if response.status_code == 200:
-            return response.json()
-        # If the model is still loading, retry after delay
-        if response.status_code == 503 and "Model is currently loading" in response.text:
-            print(f"Model loading, retrying in {retry_delay} seconds... (Retry {retry + 1}/{max_retries})")
-            time.sleep(retry_delay)
-        else:
-            # Raise an error for other status codes
-            raise ValueError(f"Request failed with status code {response.status_code}: {response.text}")
-    # If maximum retries reached without success, raise an error
-    raise ValueError(f"Exceeded maximum number of retries. Model did not become available.")
-
 def generate_challenge():
     """
     Generate a random challenge dictionary.
@@ -183,38 +149,68 @@ def generate_metric():
         "result": fake.random_int(min=1, max=100),
     }
 
+def build_location_table(city_names):
+    """
+    Resolve each city to its (city, country, continent) names once using GeoNamesCache.
+    Args:
+        city_names (list[str]): City names; duplicates are kept so they keep their sampling weight.
+    Returns:
+        list[tuple]: City, country, and continent for every city that could be resolved.
+    """
+    gc = GeonamesCache()
+    countries = gc.get_countries()
+    continents = gc.get_continents()
+    resolved = {}
+    unresolved = []
+    for city_name in dict.fromkeys(city_names):
+        city_info_list = gc.get_cities_by_name(city_name)
+        # Check if city information is available
+        if not city_info_list:
+            unresolved.append(city_name)
+            continue
+        # Get the information of the first matching city
+        city_info_value = next(iter(city_info_list[0].values()))
+        # Get country and continent information using the country code
+        country_info = countries.get(city_info_value.get('countrycode'))
+        if not country_info:
+            unresolved.append(city_name)
+            continue
+        continent = continents[country_info['continentcode']]
+        resolved[city_name] = (city_info_value['name'], country_info['name'], continent['name'])
+
+    if unresolved:
+        print(f"Could not resolve tech cities, they will not be used: {', '.join(unresolved)}")
+    return [resolved[city_name] for city_name in city_names if city_name in resolved]
+
+# Tech cities resolved once by main() and handed to every worker, so sampling a location is a single index pick
+location_table = []
+
+def set_location_table(table):
+    """
+    Install the resolved location table in this process (the pool initializer of the workers).
+    """
+    global location_table
+    location_table = table
+
 def get_random_location():
     """
-    Get a random city, country, and continent using GeoNamesCache.
+    Get a random city, country, and continent from the precomputed location table.
     Returns:
         tuple: City, country, and continent.
     """
-    # Check if the list of tech cities is not empty
-    if not tech_cities:
-        return None, None, None
-    # Select a random city from the list
-    city_name = random.choice(tech_cities)
-    city_info_list = gc.get_cities_by_name(city_name)
-    # Check if city information is available
-    if not city_info_list:
+    # Check if any tech city could be resolved
+    if not location_table:
         return None, None, None
-    # Get the information of the selected city
-    city_info = city_info_list[0]
-    city_info_key, city_info_value = next(iter(city_info.items()))
-    # Extract country code from city information
-    country_code = city_info_value.get('countrycode')
-    # Return None if country code is not available
-    if not country_code:
-        return None, None, None
-    # Get country and continent information using country code
-    country_info = gc.get_countries()[country_code]
-    continent_code = country_info['continentcode']
-    continent = gc.get_continents()[continent_code]
-    # Return city name, country name, and continent name
-    return city_info_value['name'], country_info['name'], continent['name']
-
-# Generate random proof point data
-for _ in range(num_proof_points):
+    return random.choice(location_table)
+
+def generate_proof_point(now):
+    """
+    Generate one random proof point document.
+    Args:
+        now (datetime): Reference date that founding, signing and creation dates are relative to.
+    Returns:
+        dict: Proof point document.
+    """
     company_products = random.sample(products_list, k=random.randint(3, 6))
     company_services = random.sample(services_list, k=random.randint(1, 2))
     company_value_drivers = random.sample(value_drivers, k=random.randint(1, 3))
@@ -229,7 +225,7 @@ for _ in range(num_proof_points):
         "size": random.choice([random.randint(1, 100), random.randint(100, 1000), random.randint(1000, 5000),
                                random.randint(5000, 10000), random.randint(10000, 50000)]),
         "about": [fake.paragraph() for _ in range(random.randint(1, 2))],
-        "founded": datetime.now().year - random.randint(1, 50),
+        "founded": now.year - random.randint(1, 50),
         "industry": random.choice(industry_types),
         "specialties": [fake.word() for _ in range(random.randint(3, 6))],
         "headquarters": f"{city}, {country}",
@@ -265,7 +261,7 @@ for _ in range(num_proof_points):
     max_days_ago = 365 * 3
     if max_days_ago < min_days_ago:
         max_days_ago = min_days_ago
-    date_signed = datetime.now() - timedelta(days=random.randint(min_days_ago, max_days_ago))
+    date_signed = now - timedelta(days=random.randint(min_days_ago, max_days_ago))
 
     # Generate random account data
     account_data = {
@@ -291,32 +287,83 @@ for _ in range(num_proof_points):
         "customer_validated": fake.boolean(chance_of_getting_true=90),
     }
 
-    # Concatenate all text to be encoded for use case embedding
-    usecase_concatenated_text = ''
-    usecase_concatenated_text += 'Industry: ' + company_data["industry"] + '; '
-    usecase_concatenated_text += 'Type: ' + usecase_data["type"] + '; Title: ' + usecase_data["title"] + '; Overview:  ' + usecase_data["overview"] + '; '
-    usecase_concatenated_text += 'Introduction: ' + usecase_data["introduction"]["heading"] + ' ' + ' '.join(usecase_data["introduction"]["paragraphs"]) + '; '
-    # Add challenges to the concatenated text
-    for challenge in usecase_data.get("challenges", []):
-        usecase_concatenated_text += 'The Challenge: ' + challenge["heading"] + ' ' + ' '.join(challenge["paragraphs"]) + '; '
-    # Add solutions to the concatenated text
-    for solution in usecase_data.get("solutions", []):
-        usecase_concatenated_text += 'The Solution: ' + solution["heading"] + ' ' + ' '.join(solution["paragraphs"]) + ' '
-    # Generate embedding for the concatenated text
-    embeddings_data = {
-        "usecase_embedding": generate_embedding(usecase_concatenated_text)
-    }
-    # Create the final proof point document
-    proof_point = {
+    # Create the final proof point document; embeddings are added by proofpoint-updater
+    return {
         "customer": company_data,
         "usecase": usecase_data,
         "champion": champion_data,
         "region": region_data,
         "account": account_data,
-        # "embeddings": embeddings_data,
         **proof_point_data
     }
-    # Insert document into MongoDB collection
-    collection.insert_one(proof_point)
-# Print a message indicating the completion of proof points generation and insertion
-print("Proof points generated and inserted into MongoDB collection.")
\ No newline at end of file
+
+def generate_chunk(task):
+    """
+    Generate a chunk of proof points. Runs in a worker process when --workers is greater than 1.
+    Args:
+        task (tuple): Run seed, chunk index, number of documents and reference date.
+    Returns:
+        list[dict]: Proof point documents.
+    """
+    seed, chunk_index, count, now = task
+    # Reseed this process's Faker and random generators so every chunk is reproducible
+    # regardless of which worker generates it
+    chunk_seed = f"{seed}-{chunk_index}"
+    fake.seed_instance(chunk_seed)
+    random.seed(chunk_seed)
+    return [generate_proof_point(now) for _ in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic proof points and insert them into MongoDB.")
+    parser.add_argument("--count", type=int, default=Config.NUM_PROOF_POINTS, help="Number of proof points to generate.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of generator processes.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible runs (random if omitted).")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Proof points generated per task.")
+    parser.add_argument("--reference-date", default=None,
+                        help="YYYY-MM-DD date the generated dates are relative to (defaults to today).")
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.SystemRandom().randrange(2 ** 32)
+    if args.reference_date:
+        now = datetime.strptime(args.reference_date, "%Y-%m-%d")
+    else:
+        now = datetime.combine(datetime.now().date(), datetime.min.time())
+    print(f"Generating {args.count} proof points with seed {seed} and {args.workers} worker(s)")
+
+    tasks = []
+    for chunk_index, start in enumerate(range(0, args.count, args.chunk_size)):
+        tasks.append((seed, chunk_index, min(args.chunk_size, args.count - start), now))
+
+    # Resolve the locations once here; workers receive the table instead of rebuilding it on import
+    table = build_location_table(tech_cities)
+    set_location_table(table)
+
+    # Start the workers before connecting to MongoDB so no client is shared across a fork
+    pool = multiprocessing.Pool(args.workers, initializer=set_location_table, initargs=(table,)) if args.workers > 1 else None
+    chunks = pool.imap(generate_chunk, tasks) if pool else map(generate_chunk, tasks)
+
+    # Create a new MongoDB client and connect to the server
+    client = MongoClient(uri, server_api=ServerApi('1'))
+    collection = client[db_name][coll_name]
+
+    # A single writer buffers the generated chunks and sends them to MongoDB as bulk writes
+    writer = BulkWriter(collection, max_ops=getattr(Config, "BULK_WRITE_MAX_OPS", 1000))
+    try:
+        for chunk in chunks:
+            for proof_point in chunk:
+                writer.insert_one(proof_point)
+        failures = writer.flush()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    print(f"Bulk writes: {writer.stats()}")
+    if failures:
+        print(f"{len(failures)} of {args.count} proof points could not be inserted, e.g.: {failures[0][1]}")
+        sys.exit(1)
+    # Print a message indicating the completion of proof points generation and insertion
+    print("Proof points generated and inserted into MongoDB collection.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Import necessary libraries
+import argparse
+from pymongo.mongo_client import MongoClient
+from pymongo.server_api import ServerApi
+from config import Config
+from change_sync import ProofPointSync, ResumeTokenStore, replay_events
+from embedding_client import get_embedding_client
+
+# Author: Peter Smith
+# Summary:
+# This script is a long-running worker that tails the MongoDB change stream of the proof point collection.
+# Documents inserted or changed by proofpoint-gatherer, proofpoint-generator, proofpoint-updater or by hand
+# are re-embedded as soon as their use case text changes, instead of waiting for a full rescan.
+# Documents with chunk embeddings (or every document, with `--chunks`) also get their chunks re-embedded.
+# The resume token of the last processed event is saved to `--resume-token-file`, so a restarted
+# worker continues where it stopped; a failing event is retried and then skipped, a failed change
+# stream is reopened (the worker exits after 10 failures in a row), and a token the server can no longer
+# resume from is dropped and the collection rescanned. `--replay FILE` processes recorded change events from a JSONL file instead of the
+# live change stream, without touching the saved resume token.
+
+# Use configuration constants
+uri = Config.MONGODB_URI
+db_name = Config.MONGODB_DATABASE
+coll_name = Config.MONGODB_COLLECTION
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed proof points as they change.")
+    parser.add_argument("--resume-token-file", default=getattr(Config, "SYNC_RESUME_TOKEN_FILE", "proofpoint-sync.token"))
+    parser.add_argument("--replay", default=None, help="JSONL file of recorded change events to process instead of the change stream.")
+    parser.add_argument("--chunks", action="store_true", default=getattr(Config, "EMBED_CHUNKS", False),
+                        help="Also embed the chunks of documents that have none yet.")
+    args = parser.parse_args()
+
+    # Create a new MongoDB client and connect to the server
+    client = MongoClient(uri, server_api=ServerApi('1'))
+    collection = client[db_name][coll_name]
+
+    # Replayed events are not from the live stream, so their ids must not become its resume token
+    token_store = None if args.replay else ResumeTokenStore(args.resume_token_file)
+    sync = ProofPointSync(collection, embedding_client=get_embedding_client(), token_store=token_store,
+                          chunks=args.chunks, retries=getattr(Config, "SYNC_EVENT_RETRIES", 3))
+
+    try:
+        if args.replay:
+            sync.run(replay_events(args.replay))
+        else:
+            resume_token = token_store.load()
+            print("Resuming change stream from saved token" if resume_token else "Starting change stream from now")
+            sync.follow(resume_token)
+    except KeyboardInterrupt:
+        pass
+    print(f"Change sync stopped: {sync.stats}")
+
+if __name__ == "__main__":
+    main()
@@ -1,104 +1,211 @@
 # Import necessary libraries
-import random
-import time
-import requests
-import re
-from datetime import datetime, timedelta
-from faker import Faker
-from geonamescache import GeonamesCache
+import argparse
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 from config import Config
+from bulk_writer import BulkWriter
+from progress_journal import ProgressJournal
+from embedding_client import get_embedding_client
+from bson.binary import Binary, BinaryVectorDtype
+from usecase_text import (CHUNK_TEXT_PROJECTION, USECASE_TEXT_PROJECTION, build_usecase_chunks, build_usecase_text,
+                          chunks_fingerprint, stale_chunks_filter, stale_embedding_filter, usecase_fingerprint)
 
 # Author: Peter Smith
 # Summary:
-# This script generates and inserts synthetic proof point data into a MongoDB collection.
-# Proof points represent success stories of MongoDB Atlas adoption by companies, including
-# details about the company, use cases, challenges, solutions, metrics, and other relevant information.
+# This script generates use case embeddings for the proof points in a MongoDB collection.
+# Each embedding is stored with a fingerprint of the embedded text and the model id. A regular run only selects
+# documents without a fingerprint or embedded by another model, so reruns only embed new documents (and all of
+# them after a model change). It does not notice use case text edited in place: run with `--verify`, which
+# compares the fingerprint of every document, after editing content (or keep proofpoint-sync.py running).
+# With `Config.EMBED_CHUNKS` (or `--chunks`) every section (introduction, challenges, solutions, results,
+# quotes, metrics) is also embedded as its own chunk and stored in the compact `embeddings.chunks` sub-array
+# of {path, embedding} entries, with float32 BSON vectors, for chunk retrieval in the chatbots.
+# Failures are journaled per document `_id`: a batch that fails to embed or a document whose update fails is
+# recorded and the run continues (the document stays stale, so the next run retries it), and a `--verify` pass
+# checkpoints the last written `_id`, so an interrupted pass resumes instead of restarting. Successful documents
+# are not journaled: the stale-document query already skips them.
 
 # Library Initialization:
-# - `Faker` is used to generate fake data, including company names, addresses, and various other details.
-# - `GeonamesCache` is used to obtain geographical data for selecting random cities, countries, and continents.
-# - `requests` is used for making HTTP requests to the Hugging Face API to generate text embeddings.
+# - `embedding_client` is the shared, batching client for the Hugging Face API used to generate text embeddings.
 # - `MongoClient` and related classes from `pymongo` are used for connecting to MongoDB Atlas and interacting with the database.
 
 # Hugging Face API and MongoDB Connection Details:
-# - `hf_token` and `embedding_url` store access details for the Hugging Face API, specifically the sentence-transformers pipeline.
+# - `Config.HF_TOKEN` and `Config.EMBEDDING_URL` store access details for the Hugging Face API, specifically the sentence-transformers pipeline.
 # - `uri`, `client`, `db`, and `collection` store MongoDB Atlas connection details and references to the target database and collection.
 
 # Use configuration constants
 uri = Config.MONGODB_URI
 db_name = Config.MONGODB_DATABASE
 coll_name = Config.MONGODB_COLLECTION
-hf_token = Config.HF_TOKEN
-embedding_url = Config.EMBEDDING_URL
-num_proof_points = Config.NUM_PROOF_POINTS
-
-# Initialize Faker for generating fake data
-fake = Faker()
-# Initialize GeoNamesCache
-gc = GeonamesCache()
 
 # Create a new MongoDB client and connect to the server
 client = MongoClient(uri, server_api=ServerApi('1'))
 db = client[db_name]
 collection = db[coll_name]
 
-def generate_embedding(text: str) -> list[float]:
+# Number of documents embedded per request to the Hugging Face API
+batch_size = getattr(Config, "EMBEDDING_BATCH_SIZE", 32)
+embedding_client = get_embedding_client()
+model_id = embedding_client.model_id
+
+def update_batch(batch, writer):
     """
-    Generate embedding for the given text using the Hugging Face API.
+    Generate the embeddings for a batch of documents in as few requests as possible and queue the document updates.
     Args:
-        text (str): Input text to generate embedding.
+        batch (list[tuple]): Document id, use case text (None if up to date), chunks (None if up to date or disabled)
+            and the flat `embeddings` array of a legacy gatherer document (None otherwise).
+        writer (BulkWriter): Buffered writer the updates are queued on.
+    """
+    texts = []
+    for _, text, chunks, _ in batch:
+        if text is not None:
+            texts.append(text)
+        texts.extend(chunk_text for _, chunk_text in chunks or [])
+    vectors = iter(embedding_client.embed(texts))
+
+    for document_id, text, chunks, legacy in batch:
+        update = {}
+        if text is not None:
+            # Update the document with the generated embedding and the fingerprint of the embedded text
+            update["embeddings.usecase_embedding"] = next(vectors)
+            update["embeddings.usecase_fingerprint"] = usecase_fingerprint(text, model_id)
+            update["embeddings.model"] = model_id
+        if chunks is not None:
+            update["embeddings.chunks"] = [
+                {"path": path, "embedding": Binary.from_vector(next(vectors), BinaryVectorDtype.FLOAT32)}
+                for path, _ in chunks
+            ]
+            update["embeddings.chunks_fingerprint"] = chunks_fingerprint(chunks, model_id)
+        if legacy is not None:
+            # Turn the flat array into a sub-document; fields cannot be set inside an array
+            update = {"embeddings": {"openai_embedding": legacy,
+                                     **{path.split(".", 1)[1]: value for path, value in update.items()}}}
+        writer.update_one({"_id": document_id}, {"$set": update}, key=str(document_id))
+
+def process_batch(batch, writer, journal):
+    """
+    Embed and queue a batch, recording a failure for its documents instead of aborting the run.
+    Returns:
+        list[str]: Keys of the documents queued on the writer.
+    """
+    keys = [str(document_id) for document_id, _, _, _ in batch]
+    try:
+        update_batch(batch, writer)
+    except Exception as e:
+        print(f"Embedding failed for a batch of {len(batch)} documents: {e}")
+        for key in keys:
+            journal.fail(key, "embedded", repr(e))
+        return []
+    return keys
+
+def flush_writes(writer, queued, journal):
+    """
+    Flush the queued updates, journal the failed ones and clear the failures of earlier runs for the rest.
     Returns:
-        list[float]: List of embeddings.
+        int: Number of documents updated.
     """
-    # Maximum number of retries and delay between retries
-    max_retries = 5
-    retry_delay = 5  # seconds
-
-    for retry in range(max_retries):
-        # Send a request to the Hugging Face API
-        response = requests.post(
-            embedding_url,
-            headers={"Authorization": f"Bearer {hf_token}"},
-            json={"inputs": text})
-        # Check the response status code
-        if response.status_code == 200:
-            return response.json()
-        # If the model is still loading, retry after delay
-        if response.status_code == 503 and "Model is currently loading" in response.text:
-            print(f"Model loading, retrying in {retry_delay} seconds... (Retry {retry + 1}/{max_retries})")
-            time.sleep(retry_delay)
-        else:
-            # Raise an error for other status codes
-            raise ValueError(f"Request failed with status code {response.status_code}: {response.text}")
-    # If maximum retries reached without success, raise an error
-    raise ValueError(f"Exceeded maximum number of retries. Model did not become available.")
-
-# Iterate through each document in the collection
-for document in collection.find():
-    # Concatenate all text to be encoded for use case embedding
-    usecase_concatenated_text = ''
-    usecase_concatenated_text += 'Industry: ' + document["customer"]["industry"] + '; '
-    usecase_concatenated_text += 'Type: ' + document["usecase"]["type"] + '; Title: ' + document["usecase"]["title"] + '; Overview:  ' + document["usecase"]["overview"] + '; '
-    usecase_concatenated_text += 'Introduction: ' + document["usecase"]["introduction"]["heading"] + ' ' + ' '.join(document["usecase"]["introduction"]["paragraphs"]) + '; '
-    # Add challenges to the concatenated text
-    for challenge in document["usecase"].get("challenges", []):
-        usecase_concatenated_text += 'The Challenge: ' + challenge["heading"] + ' ' + ' '.join(challenge["paragraphs"]) + '; '
-    # Add solutions to the concatenated text
-    for solution in document["usecase"].get("solutions", []):
-        usecase_concatenated_text += 'The Solution: ' + solution["heading"] + ' ' + ' '.join(solution["paragraphs"]) + ' '
-    
-    # Generate embedding for the concatenated text
-    embeddings_data = {
-        "usecase_embedding": generate_embedding(usecase_concatenated_text)
-    }
-    
-    # Update the document with the generated embeddings
-    collection.update_one(
-        {"_id": document["_id"]},
-        {"$set": {"embeddings": embeddings_data}}
-    )
-
-# Print a message indicating the completion of updating documents with embeddings
-print("Embeddings generated and updated for all documents in the MongoDB collection.")
+    failures = writer.flush()
+    for key, error in failures:
+        journal.fail(key, "written", error)
+    failed = {key for key, _ in failures}
+    succeeded = [key for key in queued if key not in failed]
+    journal.forget(succeeded)
+    return len(succeeded)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate use case embeddings for new proof points and for proof points embedded by another model. "
+                    "Proof points whose text was edited in place are only re-embedded with --verify.")
+    parser.add_argument("--verify", action="store_true",
+                        help="Scan every document and compare fingerprints; required to re-embed use case text "
+                             "edited in place (unless proofpoint-sync.py is running).")
+    parser.add_argument("--chunks", action="store_true", default=getattr(Config, "EMBED_CHUNKS", False),
+                        help="Also embed every section as a chunk for chunk retrieval.")
+    parser.add_argument("--journal", default=getattr(Config, "JOURNAL_PATH", "progress-journal.sqlite3"),
+                        help="SQLite file recording per-document failures and the --verify checkpoint.")
+    parser.add_argument("--restart", action="store_true", help="Forget the recorded progress and checkpoint.")
+    args = parser.parse_args()
+
+    journal = ProgressJournal(args.journal, "updater")
+    if args.restart:
+        journal.reset()
+    # Documents are flushed and the checkpoint advanced every this many scanned documents
+    checkpoint_every = getattr(Config, "JOURNAL_CHECKPOINT_EVERY", 1000)
+
+    # Keep the stale-document query index-backed so small nightly runs do not scan the collection
+    collection.create_index("embeddings.usecase_fingerprint")
+    collection.create_index("embeddings.model")
+
+    if args.chunks:
+        collection.create_index("embeddings.chunks_fingerprint")
+    stale_filter = stale_chunks_filter if args.chunks else stale_embedding_filter
+    query = {} if args.verify else stale_filter(model_id)
+    # Stale-filter runs resume by themselves (written documents are no longer stale); a full
+    # --verify pass resumes after the last checkpointed _id
+    resume_after = journal.checkpoint() if args.verify else None
+    if resume_after is not None:
+        print(f"Resuming verification after _id {resume_after}")
+        query = {"_id": {"$gt": resume_after}}
+    scanned = updated = 0
+    batch = []
+    queued = []
+    last_id = None
+    writer = BulkWriter(collection, max_ops=getattr(Config, "BULK_WRITE_MAX_OPS", 1000))
+    # Only fetch the fields that feed the concatenated text
+    cursor = collection.find(query, CHUNK_TEXT_PROJECTION if args.chunks else USECASE_TEXT_PROJECTION)
+    if args.verify:
+        cursor = cursor.sort("_id", 1)
+    for document in cursor:
+        scanned += 1
+        if scanned % checkpoint_every == 0:
+            # Everything scanned before this document is embedded or up to date once the batch and writer are flushed
+            if batch:
+                queued += process_batch(batch, writer, journal)
+                batch = []
+            updated += flush_writes(writer, queued, journal)
+            queued = []
+            if args.verify:
+                journal.set_checkpoint(last_id)
+        last_id = document["_id"]
+        usecase_concatenated_text = build_usecase_text(document)
+        stored = document.get("embeddings")
+        legacy = None
+        if not isinstance(stored, dict):
+            # Earlier gatherer versions stored the OpenAI vector as a flat `embeddings` array (which
+            # the projection returns empty); keep it under `openai_embedding`
+            if isinstance(stored, list):
+                legacy = collection.find_one({"_id": document["_id"]}, {"embeddings": 1})["embeddings"]
+            stored = {}
+
+        # Skip embeddings whose stored fingerprint already matches the text and model
+        if stored.get("usecase_fingerprint") == usecase_fingerprint(usecase_concatenated_text, model_id):
+            usecase_concatenated_text = None
+        chunks = build_usecase_chunks(document) if args.chunks else None
+        if chunks is not None and stored.get("chunks_fingerprint") == chunks_fingerprint(chunks, model_id):
+            chunks = None
+        if usecase_concatenated_text is None and chunks is None:
+            continue
+
+        # Queue the texts and embed them together with the rest of the batch
+        batch.append((document["_id"], usecase_concatenated_text, chunks, legacy))
+        if len(batch) >= batch_size:
+            queued += process_batch(batch, writer, journal)
+            batch = []
+
+    if batch:
+        queued += process_batch(batch, writer, journal)
+    updated += flush_writes(writer, queued, journal)
+    # The pass completed; the next --verify starts from the beginning
+    journal.set_checkpoint(None)
+
+    # Print a message indicating the completion of updating documents with embeddings
+    print(f"Embeddings generated and updated for {updated} of {scanned} scanned documents in the MongoDB collection.")
+    if not args.verify:
+        print("Only new documents and documents of other models were checked; run with --verify after editing use case text.")
+    if embedding_client.cache is not None:
+        print(f"Embedding cache: {embedding_client.cache.stats()}")
+    print(f"Bulk writes: {writer.stats()}")
+    print(f"Progress: {journal.summary()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Summary:
+Client-side rate limiting and retry policy shared by the OpenAI and HuggingFace call sites.
+
+- `TokenBucket` meters a quantity per minute (requests or tokens). Callers reserve capacity up
+  front and sleep for the returned wait, so concurrent callers are served in order without polling.
+- `RateLimiter` combines a requests/min and a tokens/min bucket, and can be paused for everyone
+  when the server answers with `Retry-After` or rate-limit reset headers.
+- `RetryPolicy` retries a call iteratively with capped, jittered exponential backoff, and draws
+  every retry from a shared per-minute retry budget so a struggling provider is not hammered.
+  `RateLimiter.acquire_async` and `RetryPolicy.call_async` are the asyncio counterparts.
+
+Usage:
+    from rate_limiter import get_rate_limiter, get_retry_policy
+
+    completion = get_retry_policy().call(
+        lambda: client.chat.completions.create(model=model, messages=conversation),
+        limiter=get_rate_limiter("openai"), tokens=2000, retry_on=(RateLimitError,))
+"""
+
+import asyncio
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from config import Config
+from metrics import RATE_LIMIT_WAIT, RETRIES, count
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate used to meter tokens/min and bound batch sizes (roughly 4 characters per token).
+    """
+    return len(text) // 4 + 1
+
+
+class RetryableError(Exception):
+    """
+    Raised by a call wrapped in `RetryPolicy.call` to request a retry.
+    Args:
+        message (str): Error description.
+        retry_after (float): Seconds the server asked us to wait, if known.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+    Args:
+        rate_per_minute (float): Refill rate.
+        capacity (float): Maximum burst; defaults to one minute's worth.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount=1) -> float:
+        """
+        Take `amount` tokens, going into debt if needed.
+        Returns:
+            float: Seconds the caller must wait before using the reservation.
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def try_take(self, amount=1) -> bool:
+        """
+        Take `amount` tokens only if they are available now.
+        """
+        with self._lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return True
+            return False
+
+
+class RateLimiter:
+    """
+    Requests/min and tokens/min limits for one provider, shared by every thread in the process.
+    Args:
+        requests_per_minute (float): Request limit.
+        tokens_per_minute (float): Token limit, or None to only limit requests.
+        name (str): Provider name used in metrics.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute=None, name="default"):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def _reserve(self, tokens):
+        wait = self.requests.reserve(1)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        with self._lock:
+            wait = max(wait, self._paused_until - time.monotonic(), 0.0)
+            self.waited += wait
+        if wait > 0:
+            RATE_LIMIT_WAIT.inc(wait, limiter=self.name)
+            count("rate_limit_wait_seconds", round(wait, 4))
+        return wait
+
+    def acquire(self, tokens=1) -> float:
+        """
+        Block until a request using `tokens` tokens may be sent.
+        Returns:
+            float: Seconds spent waiting.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1) -> float:
+        """
+        Like `acquire`, but waits without blocking the event loop.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        """
+        Hold back every caller for `seconds`, e.g. when the server sent Retry-After.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def _parse_duration(value: str):
+    # OpenAI reset headers look like "1s", "6m0s", "20ms" or "1h2m3.5s"
+    total = 0.0
+    matched = False
+    for amount, unit in re.findall(r'([\d.]+)(ms|h|m|s)', value):
+        matched = True
+        total += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total if matched else None
+
+
+def parse_retry_after(headers) -> float:
+    """
+    Read how long the server asked us to wait from response headers.
+    Args:
+        headers (Mapping): Response headers.
+    Returns:
+        float: Seconds to wait, or None if the headers do not say.
+    """
+    headers = {key.lower(): value for key, value in headers.items()}
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if "retry-after" in headers:
+        value = headers["retry-after"]
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            try:
+                return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    # Rate-limit reset headers for whichever limit is exhausted
+    resets = []
+    for kind in ("requests", "tokens"):
+        if headers.get(f"x-ratelimit-remaining-{kind}") == "0" and f"x-ratelimit-reset-{kind}" in headers:
+            reset = _parse_duration(headers[f"x-ratelimit-reset-{kind}"])
+            if reset is not None:
+                resets.append(reset)
+    return max(resets) if resets else None
+
+
+def retry_after_seconds(error):
+    """
+    Server-requested wait for an exception, from a `retry_after` attribute or its response headers.
+    """
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return retry_after
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers is not None:
+        return parse_retry_after(headers)
+    return None
+
+
+class RetryPolicy:
+    """
+    Iterative retries with capped, jittered exponential backoff and a shared retry budget.
+    Args:
+        max_attempts (int): Attempts per call, including the first.
+        base_delay (float): Backoff for the first retry in seconds.
+        max_delay (float): Upper bound for any single backoff in seconds.
+        retry_budget_per_minute (float): Retries allowed per minute across all calls.
+    """
+
+    def __init__(self, max_attempts=6, base_delay=1.0, max_delay=60.0, retry_budget_per_minute=60):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._budget = TokenBucket(retry_budget_per_minute)
+        self.retries = 0
+
+    def backoff(self, attempt) -> float:
+        """
+        Full-jitter backoff for the given zero-based attempt.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, func, limiter=None, tokens=1, retry_on=(RetryableError,)):
+        """
+        Call `func`, waiting on the limiter before every attempt and retrying the `retry_on` errors.
+        Args:
+            func (callable): Zero-argument function making the request.
+            limiter (RateLimiter): Limiter of the provider being called.
+            tokens (int): Estimated tokens the request consumes.
+            retry_on (tuple): Exception types that are worth retrying.
+        Returns:
+            The return value of `func`.
+        """
+        retry_on = tuple(retry_on) + (RetryableError,)
+        for attempt in range(self.max_attempts):
+            if limiter is not None:
+                limiter.acquire(tokens)
+            try:
+                return func()
+            except retry_on as e:
+                delay = self._retry_delay(e, attempt, limiter)
+            if delay:
+                time.sleep(delay)
+
+    async def call_async(self, func, limiter=None, tokens=1, retry_on=(RetryableError,)):
+        """
+        Like `call`, for a zero-argument function returning an awaitable; waits without blocking the event loop.
+        """
+        retry_on = tuple(retry_on) + (RetryableError,)
+        for attempt in range(self.max_attempts):
+            if limiter is not None:
+                await limiter.acquire_async(tokens)
+            try:
+                return await func()
+            except retry_on as e:
+                delay = self._retry_delay(e, attempt, limiter)
+            if delay:
+                await asyncio.sleep(delay)
+
+    def _retry_delay(self, error, attempt, limiter):
+        # Decide whether to retry `error`; re-raises it when out of attempts or budget.
+        # Returns the seconds the caller should sleep (0 when the limiter was paused instead).
+        if attempt + 1 >= self.max_attempts:
+            raise error
+        if not self._budget.try_take():
+            print("Retry budget exhausted, giving up.")
+            raise error
+        self.retries += 1
+        RETRIES.inc(reason=error.__class__.__name__)
+        count("retries")
+
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            # The server told us when to come back; hold back every caller, with a little jitter
+            delay = min(retry_after, self.max_delay) * random.uniform(1.0, 1.1)
+            print(f"{error.__class__.__name__}: retrying in {delay:.1f} seconds... (Retry {attempt + 1}/{self.max_attempts - 1})")
+            if limiter is not None:
+                limiter.pause(delay)
+                return 0.0
+            return delay
+        delay = self.backoff(attempt)
+        print(f"{error.__class__.__name__}: retrying in {delay:.1f} seconds... (Retry {attempt + 1}/{self.max_attempts - 1})")
+        return delay
+
+
+# Conservative defaults, in line with the 500 requests/min default: OpenAI's first usage tier for
+# the chat models. The HuggingFace endpoint publishes no token limit, so its limiter only meters requests
+DEFAULT_TOKENS_PER_MINUTE = {"openai": 30_000}
+
+_limiters = {}
+_retry_policy = None
+_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str) -> RateLimiter:
+    """
+    Return the process-wide limiter for a provider ("openai" or "embedding"), configured from Config;
+    `<NAME>_TOKENS_PER_MINUTE` defaults to `DEFAULT_TOKENS_PER_MINUTE`, and None or 0 disables the token limit.
+    """
+    with _lock:
+        if name not in _limiters:
+            prefix = name.upper()
+            tokens_per_minute = getattr(Config, f"{prefix}_TOKENS_PER_MINUTE", DEFAULT_TOKENS_PER_MINUTE.get(name))
+            if not tokens_per_minute:
+                print(f"Rate limiter {name}: tokens/min limiting is disabled (set Config.{prefix}_TOKENS_PER_MINUTE to enable it)")
+            _limiters[name] = RateLimiter(
+                getattr(Config, f"{prefix}_REQUESTS_PER_MINUTE", 500),
+                tokens_per_minute,
+                name=name,
+            )
+        return _limiters[name]
+
+
+def get_retry_policy() -> RetryPolicy:
+    """
+    Return the process-wide retry policy, configured from Config.
+    """
+    global _retry_policy
+    with _lock:
+        if _retry_policy is None:
+            _retry_policy = RetryPolicy(
+                max_attempts=getattr(Config, "RETRY_MAX_ATTEMPTS", 6),
+                max_delay=getattr(Config, "RETRY_MAX_DELAY", 60.0),
+                retry_budget_per_minute=getattr(Config, "RETRY_BUDGET_PER_MINUTE", 60),
+            )
+        return _retry_policy
@@ -0,0 +1,378 @@
+"""
+Summary:
+Pluggable retrieval backends for the proof point chatbots.
+
+- `AtlasRetriever` runs Atlas `$vectorSearch` on `usecase_vector_index` (the original behaviour).
+- `LocalRetriever` answers the vector search in-process from a `LocalVectorIndex` loaded from
+  `embeddings.usecase_embedding`, then fetches the matching documents by `_id`. It can also be
+  given the documents up front to retrieve without any database at all. With
+  `Config.LOCAL_INDEX_SNAPSHOT` set, the index is memory-mapped from an embedding snapshot.
+
+Both return the retrieved proof point documents, best first, with a `score` field on the same
+scale as Atlas cosine scores. `Config.RETRIEVAL_BACKEND` selects the backend ("atlas" or "local").
+
+With `Config.RETRIEVAL_MODE = "chunks"`, `ChunkRetriever` searches the per-section chunk embeddings
+(`embeddings.chunks`, written by `proofpoint-updater.py --chunks`) in-process, collapses chunk hits
+to documents and merges them with an Atlas Search text (BM25) ranking by reciprocal-rank fusion.
+Its `score` is the fused RRF score, and `matched_sections` lists the paths of the matching chunks.
+
+Every retriever also has `asearch`, which takes a pymongo `AsyncCollection` and awaits the
+database round-trips instead of blocking, for the asyncio request path of `proofbot-webui.py`.
+
+Usage:
+    from retrieval import get_retriever
+
+    retriever = get_retriever(collection)
+    documents = retriever.search(query_vector, k=3, query_text=question)
+"""
+
+import asyncio
+import threading
+from pymongo.errors import OperationFailure
+from config import Config
+
+EMBEDDING_PATH = "embeddings.usecase_embedding"
+CHUNKS_PATH = "embeddings.chunks"
+
+
+class AtlasRetriever:
+    """
+    Vector search through Atlas `$vectorSearch`.
+    Args:
+        collection: Proof point collection.
+        index (str): Atlas Vector Search index name.
+        num_candidates (int): Candidates considered per result by the ANN search.
+    """
+
+    def __init__(self, collection, index="usecase_vector_index", num_candidates=10):
+        self.collection = collection
+        self.index = index
+        self.num_candidates = num_candidates
+
+    def search(self, query_vector, k=1, query_text=None):
+        return list(self.collection.aggregate(self._pipeline(query_vector, k)))
+
+    async def asearch(self, collection, query_vector, k=1, query_text=None):
+        cursor = await collection.aggregate(self._pipeline(query_vector, k))
+        return await cursor.to_list()
+
+    def _pipeline(self, query_vector, k):
+        # MongoDB vector search aggregation pipeline
+        return [
+            {
+                "$vectorSearch": {
+                    "queryVector": query_vector,
+                    "path": EMBEDDING_PATH,
+                    "numCandidates": max(self.num_candidates, k),
+                    "limit": k,
+                    "index": self.index,
+                }
+            },
+            {"$addFields": {"score": {"$meta": "vectorSearchScore"}}},
+        ]
+
+
+class LocalRetriever:
+    """
+    Vector search against an in-process index.
+    Args:
+        collection: Proof point collection used to fetch the matching documents, or None.
+        index (LocalVectorIndex): Index over the use case embeddings.
+        documents (dict): Optional `_id` -> document map served instead of the collection.
+    """
+
+    def __init__(self, collection, index, documents=None):
+        self.collection = collection
+        self.index = index
+        self.documents = documents
+
+    @classmethod
+    def from_collection(cls, collection, mode="exact", n_probe=8, keep_documents=False):
+        """
+        Load every use case embedding from the collection into a contiguous float32 index.
+        Args:
+            collection: Proof point collection.
+            mode (str): "exact" or "ivf".
+            n_probe (int): IVF lists scored per query.
+            keep_documents (bool): Also keep the documents in memory so queries make no round-trip.
+        """
+        # NumPy is only needed for the local backend
+        from vector_index import LocalVectorIndex
+
+        projection = None if keep_documents else {EMBEDDING_PATH: 1}
+        ids, vectors, documents = [], [], {}
+        for document in collection.find({EMBEDDING_PATH: {"$exists": True}}, projection):
+            ids.append(document["_id"])
+            vectors.append(document["embeddings"]["usecase_embedding"])
+            if keep_documents:
+                documents[document["_id"]] = document
+        index = LocalVectorIndex(ids, vectors, mode=mode, n_probe=n_probe)
+        return cls(collection, index, documents if keep_documents else None)
+
+    @classmethod
+    def from_snapshot(cls, collection, path, mode="exact", n_probe=8, expected_model=None):
+        """
+        Memory-map the vectors of an embedding snapshot (see embedding_snapshot.py) into an index.
+        Args:
+            collection: Proof point collection used to fetch the matching documents.
+            path (str): Snapshot file.
+            mode (str): "exact" or "ivf".
+            n_probe (int): IVF lists scored per query.
+            expected_model (str): Reject snapshots produced by another embedding model.
+        """
+        from embedding_snapshot import load_snapshot
+        from vector_index import LocalVectorIndex
+
+        ids, matrix, _ = load_snapshot(path, expected_model)
+        return cls(collection, LocalVectorIndex(ids, matrix, mode=mode, n_probe=n_probe, normalized=True))
+
+    def search(self, query_vector, k=1, query_text=None):
+        hits = self.index.search(query_vector, k)
+        if self.documents is not None:
+            found = self.documents
+        else:
+            found = {document["_id"]: document
+                     for document in self.collection.find({"_id": {"$in": [document_id for document_id, _ in hits]}})}
+        return self._ranked(hits, found)
+
+    def upsert_document(self, document_id, document):
+        """
+        Apply an inserted or changed document (with its embeddings) to the index and kept documents.
+        Returns:
+            bool: Whether the document has a use case embedding and was indexed.
+        """
+        embeddings = document.get("embeddings")
+        vector = embeddings.get("usecase_embedding") if isinstance(embeddings, dict) else None
+        if not vector:
+            return False
+        self.index.upsert(document_id, vector)
+        if self.documents is not None:
+            self.documents[document_id] = document
+        return True
+
+    def delete_document(self, document_id):
+        """
+        Remove a deleted document from the index and kept documents.
+        """
+        self.index.delete(document_id)
+        if self.documents is not None:
+            self.documents.pop(document_id, None)
+
+    async def asearch(self, collection, query_vector, k=1, query_text=None):
+        # The index search is NumPy work that releases the GIL; run it off the event loop
+        hits = await asyncio.to_thread(self.index.search, query_vector, k)
+        if self.documents is not None:
+            found = self.documents
+        else:
+            cursor = collection.find({"_id": {"$in": [document_id for document_id, _ in hits]}})
+            found = {document["_id"]: document for document in await cursor.to_list()}
+        return self._ranked(hits, found)
+
+    @staticmethod
+    def _ranked(hits, found):
+        # Keep the ranking of the index and report the score like Atlas does
+        return [{**found[document_id], "score": score} for document_id, score in hits if document_id in found]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Merge several rankings of ids: every id scores the sum of 1 / (k + rank) over the rankings it appears in.
+    Args:
+        rankings (list[list]): Rankings of ids, best first.
+        k (int): Damping constant; larger values flatten the contribution of the top ranks.
+    Returns:
+        list[tuple]: (id, fused score) pairs, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+
+def _chunk_vector(embedding):
+    # Chunk embeddings are stored as float32 BSON vectors; older documents may hold plain arrays
+    if isinstance(embedding, list):
+        return embedding
+    return embedding.as_vector().data
+
+
+class ChunkRetriever:
+    """
+    Hybrid retrieval over per-section chunk embeddings and Atlas Search text relevance.
+    Args:
+        collection: Proof point collection.
+        index (LocalVectorIndex): Index over the chunk embeddings; ids are (document id, chunk number, path).
+        text_index (str): Atlas Search index used for the text ranking, or None for vector-only retrieval.
+        candidates (int): Chunks and text hits considered before fusion.
+        rrf_k (int): Reciprocal-rank fusion constant.
+    """
+
+    def __init__(self, collection, index, text_index="usecase_text_index", candidates=50, rrf_k=60):
+        self.collection = collection
+        self.index = index
+        self.text_index = text_index
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        # Chunk ids per document, to replace or remove all chunks of a changed document
+        self._chunk_ids = {}
+        for chunk_id in index.ids():
+            self._chunk_ids.setdefault(chunk_id[0], []).append(chunk_id)
+        self._chunks_lock = threading.Lock()
+
+    @classmethod
+    def from_collection(cls, collection, mode="exact", n_probe=8, **kwargs):
+        """
+        Load every chunk embedding from the collection into a contiguous float32 index.
+        """
+        # NumPy is only needed for the local backend
+        from vector_index import LocalVectorIndex
+
+        ids, vectors = [], []
+        for document in collection.find({CHUNKS_PATH: {"$exists": True}}, {CHUNKS_PATH: 1}):
+            for number, chunk in enumerate(document["embeddings"]["chunks"]):
+                ids.append((document["_id"], number, chunk["path"]))
+                vectors.append(_chunk_vector(chunk["embedding"]))
+        return cls(collection, LocalVectorIndex(ids, vectors, mode=mode, n_probe=n_probe), **kwargs)
+
+    def upsert_document(self, document_id, document):
+        """
+        Replace the chunk vectors of an inserted or changed document with its `embeddings.chunks`.
+        Returns:
+            bool: Whether the document has chunk embeddings and was indexed.
+        """
+        embeddings = document.get("embeddings")
+        chunks = (embeddings.get("chunks") if isinstance(embeddings, dict) else None) or []
+        ids = [(document_id, number, chunk["path"]) for number, chunk in enumerate(chunks)]
+        with self._chunks_lock:
+            # A shorter document leaves chunk rows behind that must go
+            for chunk_id in set(self._chunk_ids.get(document_id, [])) - set(ids):
+                self.index.delete(chunk_id)
+            for chunk_id, chunk in zip(ids, chunks):
+                self.index.upsert(chunk_id, _chunk_vector(chunk["embedding"]))
+            if ids:
+                self._chunk_ids[document_id] = ids
+            else:
+                self._chunk_ids.pop(document_id, None)
+        return bool(ids)
+
+    def delete_document(self, document_id):
+        """
+        Remove all chunks of a deleted document.
+        """
+        with self._chunks_lock:
+            for chunk_id in self._chunk_ids.pop(document_id, []):
+                self.index.delete(chunk_id)
+
+    def text_search(self, query_text):
+        """
+        Rank documents by Atlas Search (BM25) relevance of their use case text.
+        Returns:
+            list: Document ids, best first; empty if no text index is available.
+        """
+        if not self.text_index or not query_text:
+            return []
+        try:
+            return [document["_id"] for document in self.collection.aggregate(self._text_pipeline(query_text))]
+        except OperationFailure as e:
+            self._disable_text_search(e)
+            return []
+
+    async def atext_search(self, collection, query_text):
+        """
+        Like `text_search`, on a pymongo `AsyncCollection`.
+        """
+        if not self.text_index or not query_text:
+            return []
+        try:
+            cursor = await collection.aggregate(self._text_pipeline(query_text))
+            return [document["_id"] for document in await cursor.to_list()]
+        except OperationFailure as e:
+            self._disable_text_search(e)
+            return []
+
+    def _text_pipeline(self, query_text):
+        return [
+            {"$search": {"index": self.text_index, "text": {"query": query_text, "path": {"wildcard": "usecase.*"}}}},
+            {"$limit": self.candidates},
+            {"$project": {"_id": 1}},
+        ]
+
+    def _disable_text_search(self, error):
+        # No Atlas Search here (e.g. a local deployment): fall back to vector-only retrieval
+        print(f"Text search unavailable, using vector ranking only: {error}")
+        self.text_index = None
+
+    def search(self, query_vector, k=1, query_text=None):
+        vector_ranking, matched_sections = self._vector_ranking(self.index.search(query_vector, self.candidates))
+        fused = reciprocal_rank_fusion([vector_ranking, self.text_search(query_text)], self.rrf_k)[:k]
+        found = {document["_id"]: document
+                 for document in self.collection.find({"_id": {"$in": [document_id for document_id, _ in fused]}},
+                                                      {CHUNKS_PATH: 0})}
+        return self._ranked(fused, found, matched_sections)
+
+    async def asearch(self, collection, query_vector, k=1, query_text=None, text_ranking=None):
+        """
+        Async search; pass `text_ranking` when the text search already ran (e.g. while the question was embedded).
+        """
+        # The chunk search and the text search are independent, so they run concurrently
+        hits, text_ranking = await asyncio.gather(
+            asyncio.to_thread(self.index.search, query_vector, self.candidates),
+            self.atext_search(collection, query_text) if text_ranking is None else asyncio.sleep(0, text_ranking),
+        )
+        vector_ranking, matched_sections = self._vector_ranking(hits)
+        fused = reciprocal_rank_fusion([vector_ranking, text_ranking], self.rrf_k)[:k]
+        cursor = collection.find({"_id": {"$in": [document_id for document_id, _ in fused]}}, {CHUNKS_PATH: 0})
+        found = {document["_id"]: document for document in await cursor.to_list()}
+        return self._ranked(fused, found, matched_sections)
+
+    @staticmethod
+    def _vector_ranking(hits):
+        # Collapse chunk hits to a document ranking by each document's best chunk
+        vector_ranking, matched_sections = [], {}
+        for (document_id, _, path), _ in hits:
+            if document_id not in matched_sections:
+                vector_ranking.append(document_id)
+                matched_sections[document_id] = []
+            if path not in matched_sections[document_id]:
+                matched_sections[document_id].append(path)
+        return vector_ranking, matched_sections
+
+    @staticmethod
+    def _ranked(fused, found, matched_sections):
+        return [{**found[document_id], "score": score, "matched_sections": matched_sections.get(document_id, [])}
+                for document_id, score in fused if document_id in found]
+
+
+def get_retriever(collection):
+    """
+    Create the retrieval backend selected by `Config.RETRIEVAL_MODE` and `Config.RETRIEVAL_BACKEND`.
+    """
+    if getattr(Config, "RETRIEVAL_MODE", "document") == "chunks":
+        return ChunkRetriever.from_collection(
+            collection,
+            mode=getattr(Config, "LOCAL_INDEX_MODE", "exact"),
+            n_probe=getattr(Config, "LOCAL_INDEX_PROBES", 8),
+            text_index=getattr(Config, "TEXT_SEARCH_INDEX", "usecase_text_index"),
+        )
+    backend = getattr(Config, "RETRIEVAL_BACKEND", "atlas")
+    snapshot = getattr(Config, "LOCAL_INDEX_SNAPSHOT", None)
+    if backend == "local" and snapshot:
+        # Start from the shared, page-cached snapshot instead of reading the collection
+        return LocalRetriever.from_snapshot(
+            collection,
+            snapshot,
+            mode=getattr(Config, "LOCAL_INDEX_MODE", "exact"),
+            n_probe=getattr(Config, "LOCAL_INDEX_PROBES", 8),
+            expected_model=getattr(Config, "EMBEDDING_MODEL", None) or Config.EMBEDDING_URL,
+        )
+    if backend == "local":
+        return LocalRetriever.from_collection(
+            collection,
+            mode=getattr(Config, "LOCAL_INDEX_MODE", "exact"),
+            n_probe=getattr(Config, "LOCAL_INDEX_PROBES", 8),
+            keep_documents=getattr(Config, "LOCAL_INDEX_KEEP_DOCUMENTS", False),
+        )
+    if backend != "atlas":
+        raise ValueError(f"Unknown retrieval backend: {backend}")
+    return AtlasRetriever(collection)
@@ -0,0 +1,221 @@
+"""
+Summary:
+Lazy discovery of customer stories from listing pages and sitemaps.
+
+`discover_stories` yields one descriptor per customer story
+({"customer_story_url", "customer_logo_url", "customer_story_overview"}) while the source is still
+being read, so the gatherer pipeline can fetch and extract the first stories before discovery
+finishes. Listing pages are read in chunks and only the customer container fragments are cut out and
+parsed with lxml; the rest of the page is scanned for a next-page link but never parsed, and read
+text is dropped as soon as it is scanned, so memory stays flat on very large listings. Containers are matched on the stable prefix of their generated
+class name, and descriptors with a missing logo or overview get None instead of raising.
+
+Sources:
+- a saved listing page (local path), read once;
+- a listing url, following `rel="next"` pagination links;
+- a sitemap or sitemap index (path or url ending in .xml), keeping story urls.
+
+Usage:
+    from story_discovery import discover_stories
+
+    for story in discover_stories("https://www.mongodb.com/who-uses-mongodb"):
+        ...
+"""
+
+import codecs
+import os
+import re
+from urllib.parse import urljoin
+import requests
+from lxml import etree
+
+CONTAINER_CLASS_PREFIX = "who-uses-mongodb__CustomerContainer"
+STORY_PATH = "/customers/"
+READ_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"\s+")
+_DIV_TAG = re.compile(r"<(/?)div\b", re.I)
+_NEXT_LINK = re.compile(r"<(?:a|link)\b[^>]*\brel=[\"'][^\"']*\bnext\b[^>]*>", re.I)
+_HTML_PARSER = etree.HTMLParser()
+_HREF = re.compile(r"\bhref=[\"']([^\"']*)", re.I)
+
+
+def clean_text(text):
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _classes(element):
+    return (element.get("class") or "").split()
+
+
+def _is_url(source):
+    return source.startswith(("http://", "https://"))
+
+
+def extract_customer_info(container):
+    """
+    Story descriptor of one customer container element; missing parts are None.
+    """
+    link = next(iter(container.iterfind(".//a[@href]")), None)
+    logo = None
+    overview = None
+    for div in container.iter("div"):
+        classes = _classes(div)
+        if logo is None and "relative" in classes:
+            image = div.find(".//img[@src]")
+            logo = image.get("src") if image is not None else None
+        if overview is None and "fnt-18" in classes:
+            span = div.find(".//span")
+            text = clean_text("".join(span.itertext())) if span is not None else ""
+            overview = text or None
+    return {
+        "customer_story_url": link.get("href") if link is not None else None,
+        "customer_logo_url": logo,
+        "customer_story_overview": overview,
+    }
+
+
+def _read_chunks(source, session):
+    if _is_url(source):
+        with session.get(source, stream=True, timeout=30) as response:
+            if response.status_code != 200:
+                raise Exception(f"Failed to fetch listing page {source}")
+            yield from response.iter_content(READ_SIZE)
+    else:
+        with open(source, "rb") as file:
+            while chunk := file.read(READ_SIZE):
+                yield chunk
+
+
+def _container_end(buffer, start):
+    # End of the div starting at `start`, or None while its closing tag has not been read yet
+    depth = 0
+    for match in _DIV_TAG.finditer(buffer, start):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            close = buffer.find(">", match.end())
+            return close + 1 if close != -1 else None
+    return None
+
+
+def _next_link(text, start, end):
+    for match in _NEXT_LINK.finditer(text, start, end):
+        href = _HREF.search(match.group(0))
+        if href:
+            return href.group(1)
+    return None
+
+
+def parse_listing(chunks, container_class_prefix=CONTAINER_CLASS_PREFIX):
+    """
+    Stream a listing page and yield its story descriptors, then ("next", href) if it links a next page.
+    """
+    container_start = re.compile(r"<div\b[^>]*\bclass=[\"'][^\"']*\b" + re.escape(container_class_prefix), re.I)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    next_href = None
+
+    def containers(final=False):
+        nonlocal buffer, next_href
+        position = 0
+        while True:
+            match = container_start.search(buffer, position)
+            if match is None:
+                # Keep the last, possibly incomplete, tag for the next chunk
+                cut = len(buffer) if final else max(buffer.rfind("<", position), position)
+                next_href = _next_link(buffer, position, cut) or next_href
+                break
+            next_href = _next_link(buffer, position, match.start()) or next_href
+            end = _container_end(buffer, match.start())
+            if end is None and not final:
+                cut = match.start()
+                break
+            fragment = buffer[match.start():end]
+            position = end if end is not None else len(buffer)
+            yield extract_customer_info(etree.fromstring(fragment, _HTML_PARSER).find("body/div"))
+        # Drop the scanned text
+        buffer = buffer[cut:]
+
+    for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        yield from containers()
+    buffer += decoder.decode(b"", final=True)
+    yield from containers(final=True)
+    if next_href:
+        yield ("next", next_href)
+
+
+def parse_sitemap(source, session, story_path=STORY_PATH):
+    """
+    Yield the story urls of a sitemap, following the child sitemaps of a sitemap index.
+    """
+    if _is_url(source):
+        response = session.get(source, stream=True, timeout=30)
+        response.raw.decode_content = True
+        stream = response.raw
+    else:
+        response = None
+        stream = open(source, "rb")
+    try:
+        children = []
+        for _, element in etree.iterparse(stream, events=("end",), tag="{*}loc"):
+            location = (element.text or "").strip()
+            parent = element.getparent()
+            if etree.QName(parent).localname == "sitemap":
+                children.append(location)
+            elif story_path in location:
+                yield location
+            parent.clear()
+            while parent.getprevious() is not None:
+                del parent.getparent()[0]
+    finally:
+        stream.close()
+        if response is not None:
+            response.close()
+    for child in children:
+        yield from parse_sitemap(child, session, story_path)
+
+
+def discover_stories(source, base_url=None, max_pages=50, session=None, container_class_prefix=CONTAINER_CLASS_PREFIX):
+    """
+    Lazily yield story descriptors from a listing page, a paginated listing url or a sitemap.
+    Args:
+        source (str): Local path or url of a listing page or sitemap.
+        base_url (str): Site relative pagination links of local listings are resolved against.
+        max_pages (int): Maximum number of listing pages followed.
+        session (requests.Session): Session used for urls (a new one by default).
+        container_class_prefix (str): Prefix of the class name of the customer containers.
+    Yields:
+        dict: customer_story_url, customer_logo_url and customer_story_overview; each story once.
+    """
+    session = session or requests.Session()
+    seen = set()
+
+    if source.endswith(".xml"):
+        for url in parse_sitemap(source, session):
+            if url not in seen:
+                seen.add(url)
+                yield {"customer_story_url": url, "customer_logo_url": None, "customer_story_overview": None}
+        return
+
+    page, pages = source, 0
+    while page and pages < max_pages:
+        pages += 1
+        if not _is_url(page) and not os.path.exists(page):
+            print(f"File not found: {page}")
+            return
+        next_page = None
+        for item in parse_listing(_read_chunks(page, session), container_class_prefix):
+            if isinstance(item, tuple):
+                next_page = item[1]
+                continue
+            url = item["customer_story_url"]
+            if url is None or url not in seen:
+                seen.add(url)
+                yield item
+        if next_page is None:
+            break
+        # A saved listing page links the live site
+        page = urljoin(page if _is_url(page) else (base_url or "") + "/", next_page)
+        if not _is_url(page):
+            break
@@ -0,0 +1,96 @@
+"""
+Shared fixtures of the proof-points-rag tests.
+
+The modules import `config` at import time, so a `Config` pointing at the local stand-ins of
+benchmark_fakes.py is installed before any of them is imported. The fake HTTP services run for
+the whole session; every test gets its own in-memory MongoDB stand-in.
+"""
+
+import contextlib
+import io
+import os
+import runpy
+import sys
+import tempfile
+import pytest
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+
+from benchmark_fakes import FakeServices, deterministic_vector, install_config, mongo_stand_in, use_mongo_client
+
+DIMENSION = 16
+WORK_DIR = tempfile.mkdtemp(prefix="proofpoints-tests-")
+SERVICES = FakeServices(dimension=DIMENSION, embed_latency=0, chat_latency=0, page_latency=0, batch_latency=0.1)
+Config = install_config(
+    MONGODB_URI="mongodb://localhost:27017",
+    MONGODB_DATABASE="proofpoints_test",
+    MONGODB_COLLECTION="proofpoints",
+    NUM_PROOF_POINTS=10,
+    HF_TOKEN="test",
+    EMBEDDING_URL=SERVICES.url + "/embed",
+    EMBEDDING_MODEL="fake-embedding",
+    EMBEDDING_CACHE_PATH=os.path.join(WORK_DIR, "embedding-cache.sqlite3"),
+    PAGE_CACHE_PATH=os.path.join(WORK_DIR, "page-cache.sqlite3"),
+    CUSTOMER_STORIES_BASE_URL=SERVICES.url,
+    OPENAI_REQUESTS_PER_MINUTE=1_000_000,
+    OPENAI_TOKENS_PER_MINUTE=1_000_000_000,
+    EMBEDDING_REQUESTS_PER_MINUTE=1_000_000,
+    TIMING_LOG=os.path.join(WORK_DIR, "timings.jsonl"),
+)
+
+
+class FakeEmbeddingClient:
+    """
+    In-process stand-in for EmbeddingClient; `fail` makes the next calls raise a transient error.
+    """
+
+    def __init__(self, model_id="fake-embedding", fail=0):
+        self.model_id = model_id
+        self.fail = fail
+        self.calls = 0
+        self.cache = None
+
+    def embed(self, texts):
+        self.calls += 1
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("transient embedding failure")
+        return [deterministic_vector(text, DIMENSION) for text in texts]
+
+
+@pytest.fixture(scope="session")
+def services():
+    with SERVICES:
+        os.environ["OPENAI_BASE_URL"] = SERVICES.url + "/v1"
+        os.environ["OPENAI_API_KEY"] = "test"
+        yield SERVICES
+
+
+@pytest.fixture
+def mongo():
+    """
+    A fresh in-memory MongoDB client, returned by the scripts' `MongoClient(...)` calls too.
+    """
+    with use_mongo_client(mongo_stand_in()) as client:
+        yield client
+
+
+@pytest.fixture
+def collection(mongo):
+    return mongo[Config.MONGODB_DATABASE][Config.MONGODB_COLLECTION]
+
+
+def run_script(name, *args):
+    """
+    Run one of the scripts as __main__ and return what it printed.
+    """
+    argv = sys.argv
+    sys.argv = [name, *args]
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            runpy.run_path(os.path.join(HERE, name), run_name="__main__")
+    finally:
+        sys.argv = argv
+    return output.getvalue()
@@ -0,0 +1,70 @@
+import pytest
+from pymongo import InsertOne
+from pymongo.errors import AutoReconnect
+from bulk_writer import BulkWriter
+
+
+def test_flush_reports_failed_operations_by_key(collection):
+    collection.insert_one({"_id": 1})
+    writer = BulkWriter(collection, verbose=False)
+    writer.insert_one({"_id": 1}, key="duplicate")
+    writer.insert_one({"_id": 2}, key="new")
+    writer.update_one({"_id": 2}, {"$set": {"x": 1}}, key="updated")
+
+    failures = writer.flush()
+
+    assert [key for key, _ in failures] == ["duplicate"]
+    assert "E11000" in failures[0][1]
+    assert collection.find_one({"_id": 2}) == {"_id": 2, "x": 1}
+    assert writer.stats()["failed"] == 1
+    assert writer.flush() == []
+
+
+def test_failures_of_automatic_flushes_are_kept_until_flush(mongo, collection):
+    mongo.fail_write = lambda operation: operation._doc.get("_id") == 1
+    writer = BulkWriter(collection, max_ops=2, verbose=False)
+    for document_id in range(5):
+        writer.insert_one({"_id": document_id}, key=document_id)
+
+    assert writer.stats()["batches"] == 2
+    assert writer.flush() == [(1, "Document failed validation")]
+    assert collection.count_documents({}) == 4
+
+
+def test_failed_bulk_write_keeps_operations_queued(collection, monkeypatch):
+    writer = BulkWriter(collection, verbose=False)
+    writer.insert_one({"_id": 1}, key="a")
+    writer.insert_one({"_id": 2}, key="b")
+
+    def unreachable(*args, **kwargs):
+        raise AutoReconnect("connection closed")
+
+    bulk_write = collection.bulk_write
+    monkeypatch.setattr(collection, "bulk_write", unreachable)
+    with pytest.raises(AutoReconnect):
+        writer.flush()
+    assert collection.count_documents({}) == 0
+
+    monkeypatch.setattr(collection, "bulk_write", bulk_write)
+    writer.add(InsertOne({"_id": 3}), key="c")
+    assert writer.flush() == []
+    assert sorted(collection.distinct("_id")) == [1, 2, 3]
+    assert writer.stats()["operations"] == 3
+
+
+def test_operations_are_dropped_after_repeated_failed_flushes(collection, monkeypatch):
+    def unreachable(*args, **kwargs):
+        raise AutoReconnect("connection closed")
+
+    monkeypatch.setattr(collection, "bulk_write", unreachable)
+    writer = BulkWriter(collection, max_ops=2, max_retries=2, verbose=False)
+    writer.insert_one({"_id": 1}, key=1)
+    for document_id in range(2, 5):
+        with pytest.raises(AutoReconnect):
+            writer.insert_one({"_id": document_id}, key=document_id)
+
+    # The third failed flush in a row dropped the buffer instead of keeping it
+    assert writer._ops == []
+    monkeypatch.undo()
+    assert sorted(key for key, _ in writer.flush()) == [1, 2, 3, 4]
+    assert writer.stats()["failed"] == 4
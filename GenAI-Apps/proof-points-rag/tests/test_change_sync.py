@@ -0,0 +1,137 @@
+import os
+import pytest
+import change_sync
+from bson import json_util
+from pymongo.errors import AutoReconnect, OperationFailure
+from benchmark_fakes import change_event, legacy_proof_point, sample_proof_point
+from change_sync import ProofPointSync, ResumeTokenStore
+from conftest import FakeEmbeddingClient, run_script
+from retrieval import ChunkRetriever
+from usecase_text import build_usecase_chunks
+
+
+@pytest.fixture
+def document(collection):
+    document = sample_proof_point()
+    document["_id"] = 1
+    collection.insert_one(document)
+    return document
+
+
+def test_changed_document_is_rechunked(collection, document):
+    client = FakeEmbeddingClient()
+    sync = ProofPointSync(collection, embedding_client=client, chunks=True)
+    sync.process(change_event(collection.find_one({"_id": 1}), "insert"))
+    retriever = ChunkRetriever.from_collection(collection, text_index=None)
+    sync.retriever = retriever
+    before = len(retriever.index)
+
+    changed = collection.find_one({"_id": 1})
+    changed["usecase"]["challenges"] = []
+    collection.replace_one({"_id": 1}, changed)
+    sync.process(change_event(collection.find_one({"_id": 1}), "replace"))
+
+    stored = collection.find_one({"_id": 1})
+    paths = [path for path, _ in build_usecase_chunks(stored)]
+    assert [chunk["path"] for chunk in stored["embeddings"]["chunks"]] == paths
+    assert len(retriever.index) == len(paths) < before
+    assert sorted(path for _, _, path in retriever.index.ids()) == sorted(paths)
+    assert sync.stats["rechunked"] == sync.stats["reembedded"] == 2
+
+    # Our own embedding write comes back as an event and is a no-op
+    calls = client.calls
+    sync.process(change_event(stored, "update"))
+    assert client.calls == calls
+
+    sync.process(change_event(stored, "delete"))
+    assert len(retriever.index) == 0
+
+
+def test_failing_event_is_retried(collection, document):
+    client = FakeEmbeddingClient(fail=2)
+    sync = ProofPointSync(collection, embedding_client=client, retries=3, retry_delay=0.001)
+
+    sync.process(change_event(document, "insert"))
+
+    assert client.calls == 3
+    assert sync.stats["failed"] == 0
+    assert "usecase_embedding" in collection.find_one({"_id": 1})["embeddings"]
+
+
+def test_event_failing_every_retry_is_skipped(collection, document, tmp_path):
+    store = ResumeTokenStore(str(tmp_path / "sync.token"))
+    # Fails the three attempts of the first event only
+    sync = ProofPointSync(collection, embedding_client=FakeEmbeddingClient(fail=3), token_store=store,
+                          retries=2, retry_delay=0.001)
+    other = sample_proof_point()
+    other["_id"] = 2
+    collection.insert_one(other)
+
+    sync.run([change_event(document, "insert"), change_event(other, "insert")])
+
+    assert sync.stats["failed"] == 1
+    assert "embeddings" not in collection.find_one({"_id": 1})
+    assert "usecase_embedding" in collection.find_one({"_id": 2})["embeddings"]
+    assert store.load() == sync.resume_token
+
+
+def test_legacy_embeddings_array_is_kept(collection):
+    document = legacy_proof_point()
+    document["_id"] = 1
+    collection.insert_one(document)
+    sync = ProofPointSync(collection, embedding_client=FakeEmbeddingClient())
+
+    sync.process(change_event(collection.find_one({"_id": 1}), "insert"))
+
+    embeddings = collection.find_one({"_id": 1})["embeddings"]
+    assert embeddings["openai_embedding"] == document["embeddings"]
+    assert embeddings["model"] == "fake-embedding"
+    assert len(embeddings["usecase_embedding"]) > 0
+
+
+def test_replay_does_not_save_the_resume_token(services, collection, document, tmp_path):
+    events = tmp_path / "events.jsonl"
+    events.write_text(json_util.dumps(change_event(document, "insert")) + "\n", encoding="utf-8")
+    token_file = tmp_path / "sync.token"
+
+    output = run_script("proofpoint-sync.py", "--replay", str(events), "--resume-token-file", str(token_file))
+
+    assert "'reembedded': 1" in output
+    assert not os.path.exists(token_file)
+    assert collection.find_one({"_id": 1})["embeddings"]["model"] == "fake-embedding"
+
+
+def test_lost_resume_token_rescans_instead_of_retrying(collection, document, tmp_path, monkeypatch):
+    store = ResumeTokenStore(str(tmp_path / "sync.token"))
+    store.save({"_data": "expired"})
+    opened = []
+
+    def watch_events(collection, resume_token=None, start_at=None):
+        opened.append(resume_token)
+        if len(opened) == 1:
+            raise OperationFailure("Resume of change stream was not possible", code=286)
+        yield from []
+
+    monkeypatch.setattr(change_sync, "watch_events", watch_events)
+    sync = ProofPointSync(collection, embedding_client=FakeEmbeddingClient(), token_store=store, retry_delay=0.001)
+
+    sync.follow(store.load())
+
+    assert opened == [{"_data": "expired"}, None]
+    assert sync.stats["rescans"] == 1
+    assert sync.stats["reconnects"] == 0
+    assert store.load() is None
+    assert "usecase_embedding" in collection.find_one({"_id": 1})["embeddings"]
+
+
+def test_reconnects_are_capped(collection, monkeypatch):
+    def watch_events(collection, resume_token=None, start_at=None):
+        raise AutoReconnect("connection refused")
+        yield
+
+    monkeypatch.setattr(change_sync, "watch_events", watch_events)
+    sync = ProofPointSync(collection, retry_delay=0.001)
+
+    with pytest.raises(AutoReconnect):
+        sync.follow(max_reconnects=3)
+    assert sync.stats["reconnects"] == 3
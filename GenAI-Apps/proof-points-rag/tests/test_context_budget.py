@@ -0,0 +1,38 @@
+from context_budget import MIN_CONTAINED_CHARS, build_context, count_tokens
+
+QUOTE = "MongoDB Atlas let our engineers ship new delivery features every week instead of every quarter."
+
+
+def proof_point(title, results, quotes=()):
+    return {"customer": {"company_name": title}, "usecase": {
+        "title": title,
+        "results": [{"heading": "Results", "paragraphs": [paragraph]} for paragraph in results],
+        "quotes": [{"quote": quote, "person": "Jane Doe", "role": "CTO"} for quote in quotes],
+    }}
+
+
+def test_short_paragraphs_contained_in_others_are_kept():
+    documents = [proof_point("Acme", ["Results", "Results were 40% faster releases across every team."])]
+
+    context = build_context("results", documents, budget=500)
+
+    assert "\nResults\n" in context
+    assert "40% faster releases" in context
+
+
+def test_repeated_paragraphs_and_long_passages_are_dropped():
+    assert len(QUOTE) >= MIN_CONTAINED_CHARS
+    documents = [proof_point("Acme", [QUOTE]), proof_point("Globex", [QUOTE, "Globex cut costs by half."]),
+                 proof_point("Initech", ["The team said: " + QUOTE])]
+
+    context = build_context("delivery features", documents, budget=1000)
+
+    assert context.count("ship new delivery features") == 1
+    assert "cut costs by half" in context
+
+
+def test_context_fits_the_budget():
+    paragraphs = [f"Sentence {index} about scaling the platform with Atlas. " * 5 for index in range(30)]
+    context = build_context("scaling", [proof_point("Acme", paragraphs)], budget=200)
+
+    assert 0 < count_tokens(context) <= 200
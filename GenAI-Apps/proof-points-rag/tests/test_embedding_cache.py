@@ -0,0 +1,49 @@
+import pytest
+from embedding_cache import EmbeddingCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(str(tmp_path / "embedding-cache.sqlite3"))
+
+
+def test_only_misses_are_computed(cache):
+    computed = []
+
+    def compute(texts):
+        computed.extend(texts)
+        return [[float(len(text)), 0.5] for text in texts]
+
+    first = cache.get_or_compute("model", ["a b", "cd"], compute)
+    # Whitespace differences and repeats within a call hit the same entry
+    second = cache.get_or_compute("model", ["a  b\n", "cd", "efg", "efg"], compute)
+
+    assert computed == ["a b", "cd", "efg"]
+    assert first == [[3.0, 0.5], [2.0, 0.5]]
+    assert second == [[3.0, 0.5], [2.0, 0.5], [3.0, 0.5], [3.0, 0.5]]
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["entries"] == 3
+
+
+def test_entries_are_per_model(cache):
+    cache.put_many("model-a", ["text"], [[1.0]])
+    assert cache.get_many("model-b", ["text"]) == [None]
+    assert cache.get_many("model-a", ["text"]) == [[1.0]]
+
+
+def test_entries_survive_reopening(cache):
+    cache.put_many("model", ["text"], [[0.25, 0.5]])
+    reopened = EmbeddingCache(cache.path)
+    assert reopened.get_many("model", ["text"]) == [[0.25, 0.5]]
+    assert reopened.stats()["entries"] == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "small.sqlite3"), max_entries=2)
+    cache.put_many("model", ["old"], [[1.0]])
+    cache.put_many("model", ["used"], [[2.0]])
+    cache.get_many("model", ["old"])
+    cache.put_many("model", ["new"], [[3.0]])
+
+    assert cache.get_many("model", ["old", "used", "new"]) == [[1.0], None, [3.0]]
+    assert cache.stats()["evictions"] == 1
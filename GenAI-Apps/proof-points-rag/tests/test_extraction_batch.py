@@ -0,0 +1,31 @@
+import json
+from types import SimpleNamespace
+from extraction_batch import read_results
+
+
+def batch_client(*results):
+    # Serves one output file holding `results`, like client.files.content(...) of the OpenAI client
+    text = "\n".join(json.dumps(result) for result in results)
+    return SimpleNamespace(files=SimpleNamespace(content=lambda file_id: SimpleNamespace(text=text)))
+
+
+def result(custom_id, message, finish_reason="stop"):
+    body = {"choices": [{"index": 0, "message": message, "finish_reason": finish_reason}]}
+    return {"custom_id": custom_id, "error": None, "response": {"status_code": 200, "body": body}}
+
+
+def test_completion_without_content_is_an_error():
+    client = batch_client(
+        result("answered", {"role": "assistant", "content": "{}"}),
+        result("refused", {"role": "assistant", "content": None, "refusal": "I can't help with that."}),
+        result("filtered", {"role": "assistant", "content": None}, finish_reason="content_filter"),
+        {"custom_id": "failed", "error": None, "response": {"status_code": 500, "body": {"error": "server error"}}},
+    )
+    batch = SimpleNamespace(output_file_id="file-output", error_file_id=None)
+
+    results = {custom_id: (content, error) for custom_id, content, error in read_results(client, batch)}
+
+    assert results["answered"] == ("{}", None)
+    assert results["refused"] == (None, "Completion has no content (I can't help with that.)")
+    assert results["filtered"] == (None, "Completion has no content (finish_reason content_filter)")
+    assert results["failed"] == (None, "server error")
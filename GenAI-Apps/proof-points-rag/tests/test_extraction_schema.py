@@ -0,0 +1,87 @@
+import json
+import pytest
+from benchmark_fakes import public_proof_point, sample_proof_point
+from extraction_schema import (NULLABLE_FIELDS, field_request, field_schema, invalid_fields, merge_fields,
+                               parse_extraction, parse_json, schema_template, to_document)
+
+
+def test_valid_extraction_passes():
+    assert invalid_fields(parse_extraction(json.dumps(sample_proof_point()))) == {}
+
+
+def test_code_fences_and_surrounding_text_are_stripped():
+    text = "Here is the document:\n```json\n" + json.dumps({"a": 1}) + "\n```"
+    assert parse_json(text) == {"a": 1}
+
+
+def test_truncated_completion_is_closed():
+    assert parse_json('{"a": {"b": [1, 2], "c": "unfinished') == {"a": {"b": [1, 2], "c": "unfinished"}}
+    # A cut inside a key backs off to the last complete value
+    assert parse_json('{"a": 1, "b": [1, 2], "ke') == {"a": 1, "b": [1, 2]}
+
+
+def test_unrepairable_completion_raises():
+    with pytest.raises(ValueError):
+        parse_json("I could not find a customer story on this page.")
+
+
+def test_values_are_coerced_to_the_schema():
+    document = sample_proof_point()
+    document["customer"]["size"] = "8,186 employees"
+    document["customer"]["founded"] = 2014.0
+    document["customer"]["specialties"] = "Food delivery"
+    document["customer_validated"] = "yes"
+    document["unexpected"] = "dropped"
+
+    coerced = parse_extraction(json.dumps(document))
+
+    assert coerced["customer"]["size"] == 8186
+    assert coerced["customer"]["founded"] == 2014
+    assert coerced["customer"]["specialties"] == ["Food delivery"]
+    assert coerced["customer_validated"] is True
+    assert "unexpected" not in coerced
+    assert invalid_fields(coerced) == {}
+
+
+def test_public_story_nulls_are_valid():
+    document = public_proof_point()
+    document["account"]["deal_type"] = "Not specified"
+    document["customer"]["size"] = "unknown"
+
+    coerced = parse_extraction(json.dumps(document))
+
+    assert coerced["champion"]["name"] is None
+    assert coerced["account"]["deal_type"] is None
+    assert coerced["customer"]["size"] is None
+    assert invalid_fields(coerced) == {}
+    assert schema_template(field_schema("customer.size")) == "integer or null"
+
+
+def test_null_in_a_required_field_is_reported():
+    document = sample_proof_point()
+    assert "customer.company_name" not in NULLABLE_FIELDS
+    document["customer"]["company_name"] = None
+    del document["usecase"]
+
+    errors = invalid_fields(parse_extraction(json.dumps(document)))
+
+    assert set(errors) == {"customer.company_name", "usecase"}
+    assert errors["usecase"] == "missing"
+    assert '"customer.company_name": string' in field_request(errors)
+
+
+def test_reasked_fields_are_merged_and_coerced():
+    document = parse_extraction(json.dumps(sample_proof_point()))
+    document["customer"]["size"] = "a lot"
+
+    merge_fields(document, {"customer.size": "8186", "not.a_field": 1})
+
+    assert document["customer"]["size"] == 8186
+    assert "not" not in document
+    assert invalid_fields(document) == {}
+
+
+def test_dates_become_datetimes():
+    document = to_document(public_proof_point())
+    assert document["date_proof_point_created"].year > 2000
+    assert document["account"]["date_signed"] is None
@@ -0,0 +1,48 @@
+from benchmark_fakes import listing_page
+from conftest import run_script
+from progress_journal import ProgressJournal
+
+
+def test_failed_upserts_are_not_journaled_as_written(services, mongo, collection, tmp_path):
+    listing = tmp_path / "listing.html"
+    listing.write_text(listing_page(3), encoding="utf-8")
+    journal_path = str(tmp_path / "progress-journal.sqlite3")
+    failing = services.url + "/customers/bench-1"
+    mongo.fail_write = lambda operation: operation._filter == {"link_to_web": failing}
+
+    run_script("proofpoint-gatherer.py", "--listing", str(listing), "--journal", journal_path)
+
+    journal = ProgressJournal(journal_path, "gatherer")
+    assert journal.is_done(services.url + "/customers/bench-0")
+    assert not journal.is_done(failing)
+    assert journal.get(failing)["failed_stage"] == "write"
+    assert collection.count_documents({}) == 2
+    stored = collection.find_one({"link_to_web": services.url + "/customers/bench-0"})
+    assert list(stored["embeddings"]) == ["openai_embedding"]
+    assert stored["champion"]["name"] is None
+
+    # The next run only writes the story whose upsert failed
+    mongo.fail_write = None
+    output = run_script("proofpoint-gatherer.py", "--listing", str(listing), "--journal", journal_path)
+
+    assert "'already_written': 2" in output
+    assert journal.is_done(failing)
+    assert journal.get(failing)["failed_stage"] is None
+    assert collection.count_documents({}) == 3
+
+
+def test_batch_requests_each_story_once(services, collection, tmp_path):
+    # The same story linked by relative and by absolute url
+    page = listing_page(3)
+    duplicate = page[page.index('<div class="who-uses'):page.index("</div></div>") + len("</div></div>")]
+    listing = tmp_path / "listing.html"
+    listing.write_text(page.replace("</body>", duplicate.replace('href="/', f'href="{services.url}/') + "</body>"),
+                       encoding="utf-8")
+    requests = services.requests["batch_requests"]
+
+    output = run_script("proofpoint-gatherer.py", "--listing", str(listing), "--journal", str(tmp_path / "journal.sqlite3"),
+                        "--batch", "--batch-dir", str(tmp_path / "batches"), "--batch-poll", "0.05")
+
+    assert "'duplicates': 1" in output
+    assert services.requests["batch_requests"] - requests == 3
+    assert collection.count_documents({}) == 3
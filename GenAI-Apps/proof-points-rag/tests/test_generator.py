@@ -0,0 +1,37 @@
+import pytest
+from conftest import run_script
+
+
+def test_failed_inserts_fail_the_run(mongo, collection):
+    mongo.fail_write = lambda operation: operation._doc["customer"]["size"] % 2 == 0
+
+    with pytest.raises(SystemExit) as exit_info:
+        run_script("proofpoint-generator.py", "--count", "20", "--seed", "7", "--reference-date", "2024-01-01")
+
+    assert exit_info.value.code == 1
+    assert 0 < collection.count_documents({}) < 20
+
+
+def test_generated_proof_points_are_inserted(collection):
+    output = run_script("proofpoint-generator.py", "--count", "20", "--seed", "7", "--reference-date", "2024-01-01")
+
+    assert "inserted into MongoDB collection" in output
+    assert collection.count_documents({}) == 20
+
+
+def test_location_table_is_built_by_main_only(capsys):
+    import os
+    import runpy
+    from conftest import HERE
+
+    module = runpy.run_path(os.path.join(HERE, "proofpoint-generator.py"), run_name="proofpoint_generator")
+    # Importing the script (as a spawned worker does) does not resolve the cities
+    assert module["location_table"] == []
+    assert capsys.readouterr().out == ""
+
+    table = module["build_location_table"](["Berlin", "Nowhereville", "Berlin"])
+    module["set_location_table"](table)
+    assert table == [("Berlin", "Germany", "Europe")] * 2
+    assert "Nowhereville" in capsys.readouterr().out
+    documents = module["generate_chunk"]((1, 0, 3, module["datetime"](2024, 1, 1)))
+    assert {document["region"]["city"] for document in documents} == {"Berlin"}
@@ -0,0 +1,40 @@
+import pytest
+from benchmark_fakes import story_page
+from page_cache import PageCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PageCache(str(tmp_path / "page-cache.sqlite3"))
+
+
+def test_revalidated_page_is_served_from_the_cache(services, cache):
+    url = services.url + "/customers/acme"
+
+    first = cache.fetch(url)
+    second = cache.fetch(url)
+
+    assert (first.status, first.changed) == (200, True)
+    assert (second.status, second.changed) == (304, False)
+    assert second.text == first.text == story_page("acme")
+    stats = cache.stats()
+    assert stats["not_modified"] == 1
+    assert stats["bytes_served_from_cache"] == len(first.text.encode("utf-8"))
+
+
+def test_identical_body_is_reported_unchanged(services, cache):
+    url = services.url + "/customers/same"
+    cache.fetch(url)
+    # A server that lost its validators (or changed them) sends the same body again
+    cache._conn.execute("UPDATE pages SET etag = ? WHERE url = ?", ('"stale"', url))
+
+    page = cache.fetch(url)
+
+    assert (page.status, page.changed) == (200, False)
+    assert cache.stats()["same_content"] == 1
+    assert cache.fetch(url).status == 304
+
+
+def test_failed_fetch_raises(services, cache):
+    with pytest.raises(Exception, match="Failed to fetch"):
+        cache.fetch(services.url + "/missing")
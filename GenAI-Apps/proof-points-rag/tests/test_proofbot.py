@@ -0,0 +1,29 @@
+import json
+import embedding_client
+from conftest import Config, FakeEmbeddingClient, run_script
+
+
+def test_bad_lines_and_failed_batches_get_error_records(services, collection, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(Config, "RETRIEVAL_BACKEND", "local", raising=False)
+    # The first embedding request fails; the batches after it are answered
+    monkeypatch.setattr(embedding_client, "get_embedding_client", lambda: FakeEmbeddingClient(fail=1))
+    questions = tmp_path / "questions.jsonl"
+    questions.write_text("\n".join([
+        json.dumps("Who uses Atlas?"),
+        json.dumps({"id": "q2", "question": "Which banks use MongoDB?"}),
+        '{"question": "truncated',
+        json.dumps({"id": "q4"}),
+        json.dumps("What does Atlas Search replace?"),
+    ]) + "\n", encoding="utf-8")
+    answers = tmp_path / "answers.jsonl"
+
+    run_script("proofbot.py", "--batch", str(questions), "--output", str(answers), "--batch-size", "2")
+
+    records = [json.loads(line) for line in answers.read_text(encoding="utf-8").splitlines()]
+    assert [record["id"] for record in records] == [1, "q2", 3, 4, 5]
+    assert records[0]["error"] == records[1]["error"] == "ConnectionError: transient embedding failure"
+    assert records[1]["question"] == "Which banks use MongoDB?"
+    assert records[2]["error"].startswith("Invalid JSON")
+    assert "question" in records[3]["error"]
+    assert "error" not in records[4] and records[4]["answer"]
+    assert "Answered 1 of 5 questions" in capsys.readouterr().err
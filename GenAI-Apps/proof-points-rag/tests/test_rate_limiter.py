@@ -0,0 +1,114 @@
+import pytest
+import rate_limiter
+from conftest import Config
+from rate_limiter import RateLimiter, RetryableError, RetryPolicy, TokenBucket, get_rate_limiter, parse_retry_after
+
+
+def test_bucket_goes_into_debt_and_reports_the_wait():
+    bucket = TokenBucket(60, capacity=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    # One token per second: the third caller waits about a second
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+    assert not bucket.try_take()
+
+
+def test_limiter_waits_on_the_tighter_limit():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=600, name="test")
+    assert limiter._reserve(600) == 0.0
+    # The token bucket is empty; 60 more tokens take six seconds at 10 tokens/s
+    assert limiter._reserve(60) == pytest.approx(6.0, abs=0.05)
+
+
+def test_pause_holds_back_every_caller():
+    limiter = RateLimiter(requests_per_minute=1_000_000, name="test")
+    limiter.pause(5)
+    assert limiter._reserve(1) == pytest.approx(5.0, abs=0.05)
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"Retry-After": "3"}, 3.0),
+    ({"retry-after-ms": "250"}, 0.25),
+    ({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "1m2.5s"}, 62.5),
+    ({"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "20ms",
+      "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2s"}, 2.0),
+    ({"x-ratelimit-remaining-requests": "5", "x-ratelimit-reset-requests": "2s"}, None),
+    ({}, None),
+])
+def test_parse_retry_after(headers, expected):
+    assert parse_retry_after(headers) == expected
+
+
+def test_retries_until_success(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RetryableError("busy")
+        return "ok"
+
+    policy = RetryPolicy(max_attempts=5)
+    assert policy.call(flaky) == "ok"
+    assert policy.retries == 2
+
+
+def test_gives_up_after_the_last_attempt(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+
+    def failing():
+        raise TimeoutError("slow")
+
+    with pytest.raises(TimeoutError):
+        RetryPolicy(max_attempts=3).call(failing, retry_on=(TimeoutError,))
+
+
+def test_errors_outside_retry_on_are_not_retried():
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise KeyError("bug")
+
+    with pytest.raises(KeyError):
+        RetryPolicy().call(failing)
+    assert len(calls) == 1
+
+
+def test_retry_budget_is_shared(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    policy = RetryPolicy(max_attempts=10, retry_budget_per_minute=2)
+
+    def failing():
+        raise RetryableError("busy")
+
+    with pytest.raises(RetryableError):
+        policy.call(failing)
+    assert policy.retries == 2
+
+
+def test_server_wait_pauses_the_limiter(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    limiter = RateLimiter(requests_per_minute=1_000_000, name="test")
+    attempts = []
+
+    def throttled():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RetryableError("slow down", retry_after=4)
+        return "ok"
+
+    assert RetryPolicy().call(throttled, limiter=limiter) == "ok"
+    assert limiter.waited >= 4
+
+
+def test_limiters_meter_tokens_by_default(monkeypatch, capsys):
+    monkeypatch.setattr(rate_limiter, "_limiters", {})
+    monkeypatch.delattr(Config, "OPENAI_TOKENS_PER_MINUTE")
+
+    assert get_rate_limiter("openai").tokens.capacity == rate_limiter.DEFAULT_TOKENS_PER_MINUTE["openai"]
+    assert capsys.readouterr().out == ""
+    # No published token limit for the embedding endpoint: requests only, and said so at startup
+    assert get_rate_limiter("embedding").tokens is None
+    assert "EMBEDDING_TOKENS_PER_MINUTE" in capsys.readouterr().out
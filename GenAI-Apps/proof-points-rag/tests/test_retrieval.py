@@ -0,0 +1,73 @@
+import pytest
+from bson.binary import Binary, BinaryVectorDtype
+from retrieval import ChunkRetriever, LocalRetriever, reciprocal_rank_fusion
+from vector_index import LocalVectorIndex
+
+
+def chunk(path, vector):
+    return {"path": path, "embedding": Binary.from_vector(vector, BinaryVectorDtype.FLOAT32)}
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [item for item, _ in fused] == ["b", "a", "d", "c"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[1][1] == pytest.approx(1 / 61)
+
+
+def test_rrf_of_empty_rankings():
+    assert reciprocal_rank_fusion([[], []]) == []
+    assert [item for item, _ in reciprocal_rank_fusion([["a"], []])] == ["a"]
+
+
+@pytest.fixture
+def chunk_collection(collection):
+    collection.insert_many([
+        {"_id": 1, "name": "one", "embeddings": {"chunks": [chunk("usecase.challenges", [1.0, 0.0, 0.0]),
+                                                             chunk("usecase.results", [0.9, 0.1, 0.0])]}},
+        {"_id": 2, "name": "two", "embeddings": {"chunks": [chunk("usecase.solutions", [0.0, 1.0, 0.0])]}},
+    ])
+    return collection
+
+
+def test_chunk_hits_collapse_to_documents(chunk_collection):
+    retriever = ChunkRetriever.from_collection(chunk_collection, text_index=None)
+
+    results = retriever.search([1.0, 0.05, 0.0], k=2)
+
+    assert [document["_id"] for document in results] == [1, 2]
+    assert results[0]["matched_sections"] == ["usecase.challenges", "usecase.results"]
+    assert "chunks" not in results[0]["embeddings"]
+
+
+def test_local_retriever_follows_document_changes(collection):
+    documents = {1: {"_id": 1, "name": "one"}, 2: {"_id": 2, "name": "two"}}
+    retriever = LocalRetriever(collection, LocalVectorIndex([1, 2], [[1.0, 0.0], [0.0, 1.0]]), documents)
+
+    assert not retriever.upsert_document(3, {"_id": 3, "embeddings": [0.5, 0.5]})
+    assert retriever.upsert_document(3, {"_id": 3, "name": "three", "embeddings": {"usecase_embedding": [1.0, 0.1]}})
+    retriever.delete_document(1)
+
+    results = retriever.search([1.0, 0.0], k=2)
+    assert [document["name"] for document in results] == ["three", "two"]
+    assert results[0]["score"] > results[1]["score"]
+
+
+def test_chunk_upsert_drops_obsolete_chunks(chunk_collection):
+    retriever = ChunkRetriever.from_collection(chunk_collection, text_index=None)
+    assert len(retriever.index) == 3
+
+    assert retriever.upsert_document(1, {"embeddings": {"chunks": [chunk("usecase.title", [0.0, 0.0, 1.0])]}})
+
+    assert sorted(retriever.index.ids()) == [(1, 0, "usecase.title"), (2, 0, "usecase.solutions")]
+    assert retriever.search([0.0, 0.0, 1.0], k=1)[0]["matched_sections"] == ["usecase.title"]
+
+
+def test_chunk_delete_and_document_without_chunks(chunk_collection):
+    retriever = ChunkRetriever.from_collection(chunk_collection, text_index=None)
+
+    retriever.delete_document(2)
+    assert not retriever.upsert_document(1, {"embeddings": [0.1, 0.2]})
+
+    assert len(retriever.index) == 0
+    assert retriever.search([0.0, 1.0, 0.0], k=1) == []
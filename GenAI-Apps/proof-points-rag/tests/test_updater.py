@@ -0,0 +1,70 @@
+import pytest
+from benchmark_fakes import legacy_proof_point, sample_proof_point
+from conftest import DIMENSION, run_script
+from progress_journal import ProgressJournal
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "progress-journal.sqlite3")
+
+
+def insert_proof_points(collection, count):
+    for document_id in range(count):
+        document = sample_proof_point()
+        document["_id"] = document_id
+        document["usecase"]["title"] = f"Proof point {document_id}"
+        collection.insert_one(document)
+
+
+def test_failed_updates_are_journaled_and_retried(services, mongo, collection, journal_path):
+    insert_proof_points(collection, 3)
+    mongo.fail_write = lambda operation: operation._filter == {"_id": 1}
+
+    output = run_script("proofpoint-updater.py", "--journal", journal_path)
+
+    assert "updated for 2 of 3" in output
+    assert "usecase_embedding" not in collection.find_one({"_id": 1}).get("embeddings", {})
+    journal = ProgressJournal(journal_path, "updater")
+    assert journal.get("1")["failed_stage"] == "written"
+    assert journal.get("0") is None
+    assert journal.summary() == {"new": 1, "failed": 1}
+
+    # The failed document is still stale, so the next run picks it up and clears its failure
+    mongo.fail_write = None
+    output = run_script("proofpoint-updater.py", "--journal", journal_path)
+
+    assert "updated for 1 of 1" in output
+    assert journal.get("1") is None
+
+
+def test_text_edited_in_place_needs_verify(services, collection, journal_path):
+    insert_proof_points(collection, 2)
+    run_script("proofpoint-updater.py", "--journal", journal_path)
+    embedded = collection.find_one({"_id": 1})["embeddings"]["usecase_embedding"]
+    collection.update_one({"_id": 1}, {"$set": {"usecase.title": "Edited title"}})
+
+    output = run_script("proofpoint-updater.py", "--journal", journal_path)
+
+    assert "updated for 0 of 0" in output
+    assert "--verify" in output
+    assert collection.find_one({"_id": 1})["embeddings"]["usecase_embedding"] == embedded
+
+    output = run_script("proofpoint-updater.py", "--verify", "--journal", journal_path)
+
+    assert "updated for 1 of 2" in output
+    assert collection.find_one({"_id": 1})["embeddings"]["usecase_embedding"] != embedded
+
+
+def test_legacy_embeddings_array_becomes_a_sub_document(services, collection, journal_path):
+    document = legacy_proof_point()
+    document["_id"] = 1
+    collection.insert_one(document)
+
+    run_script("proofpoint-updater.py", "--chunks", "--journal", journal_path)
+
+    embeddings = collection.find_one({"_id": 1})["embeddings"]
+    assert embeddings["openai_embedding"] == document["embeddings"]
+    assert len(embeddings["usecase_embedding"]) == DIMENSION
+    assert embeddings["chunks"] and embeddings["chunks_fingerprint"]
+    assert "updated for 0 of 0" in run_script("proofpoint-updater.py", "--chunks", "--journal", journal_path)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from vector_index import LocalVectorIndex
+
+VECTORS = {"a": [1.0, 0.0, 0.0], "b": [0.0, 1.0, 0.0], "c": [0.0, 0.0, 1.0], "d": [1.0, 1.0, 0.0]}
+
+
+@pytest.fixture
+def index():
+    return LocalVectorIndex(list(VECTORS), list(VECTORS.values()))
+
+
+def test_search_ranks_by_cosine_with_atlas_scores(index):
+    hits = index.search([2.0, 0.1, 0.0], k=2)
+    assert [document_id for document_id, _ in hits] == ["a", "d"]
+    assert 0.5 < hits[1][1] < hits[0][1] <= 1.0
+    # An opposite vector scores 0 and ranks last
+    assert index.search([0.0, 0.0, -1.0], k=4)[-1] == ("c", pytest.approx(0.0, abs=1e-6))
+
+
+def test_upsert_replaces_and_inserts(index):
+    index.upsert("a", [0.0, 0.0, 1.0])
+    index.upsert("e", [0.0, -1.0, 0.0])
+
+    assert len(index) == 5
+    assert sorted(document_id for document_id, _ in index.search([0.0, 0.0, 1.0], k=2)) == ["a", "c"]
+    assert index.search([0.0, -1.0, 0.0], k=1)[0][0] == "e"
+
+
+def test_deleted_documents_are_not_found(index):
+    index.delete("a")
+    index.delete("missing")
+
+    assert len(index) == 3
+    assert sorted(index.ids()) == ["b", "c", "d"]
+    assert "a" not in [document_id for document_id, _ in index.search([1.0, 0.0, 0.0], k=4)]
+
+
+def test_empty_index_grows_on_upsert():
+    index = LocalVectorIndex([], [])
+    assert index.search([1.0, 0.0], k=3) == []
+    for number in range(40):
+        index.upsert(("doc", number), [1.0, float(number)])
+    assert len(index) == 40
+    assert index.search([0.0, 1.0], k=1)[0][0] == ("doc", 39)
+
+
+def test_ivf_search_matches_exact_search():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 8))
+    exact = LocalVectorIndex(list(range(500)), vectors)
+    ivf = LocalVectorIndex(list(range(500)), vectors, mode="ivf", n_lists=10, n_probe=10)
+    query = rng.normal(size=8)
+
+    assert [document_id for document_id, _ in ivf.search(query, k=5)] == \
+        [document_id for document_id, _ in exact.search(query, k=5)]
+    ivf.delete(exact.search(query, k=1)[0][0])
+    assert ivf.search(query, k=1)[0][0] == exact.search(query, k=2)[1][0]
+
+
+def test_read_only_snapshot_is_copied_on_write():
+    matrix = np.eye(3, dtype=np.float32)
+    matrix.flags.writeable = False
+    index = LocalVectorIndex(["a", "b", "c"], matrix, normalized=True)
+
+    index.upsert("a", [0.0, 1.0, 0.0])
+
+    assert matrix[0, 0] == 1.0
+    assert sorted(document_id for document_id, _ in index.search([0.0, 1.0, 0.0], k=2)) == ["a", "b"]
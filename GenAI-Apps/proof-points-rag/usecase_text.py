@@ -0,0 +1,144 @@
+"""
+Summary:
+Builds the use case text that is embedded into `embeddings.usecase_embedding`, and the fingerprint
+stored next to the embedding so unchanged documents can be skipped on later runs.
+
+The fingerprint is a SHA-256 of the embedding model id and the concatenated text, so either a
+content change or a model change makes the stored embedding stale.
+"""
+
+import hashlib
+
+# Only the fields that feed the concatenated text (plus the stored fingerprint) are fetched
+USECASE_TEXT_PROJECTION = {
+    "customer.industry": 1,
+    "usecase.type": 1,
+    "usecase.title": 1,
+    "usecase.overview": 1,
+    "usecase.introduction": 1,
+    "usecase.challenges": 1,
+    "usecase.solutions": 1,
+    "embeddings.usecase_fingerprint": 1,
+    "embeddings.model": 1,
+}
+
+
+def build_usecase_text(document: dict) -> str:
+    """
+    Concatenate the industry, type, title, overview, introduction, challenges and solutions of a proof point.
+    Args:
+        document (dict): Proof point document with `customer` and `usecase` sub-documents.
+    Returns:
+        str: Text to be encoded for the use case embedding.
+    """
+    usecase = document["usecase"]
+    usecase_concatenated_text = ''
+    usecase_concatenated_text += 'Industry: ' + document["customer"]["industry"] + '; '
+    usecase_concatenated_text += 'Type: ' + usecase["type"] + '; Title: ' + usecase["title"] + '; Overview:  ' + usecase["overview"] + '; '
+    usecase_concatenated_text += 'Introduction: ' + usecase["introduction"]["heading"] + ' ' + ' '.join(usecase["introduction"]["paragraphs"]) + '; '
+    # Add challenges to the concatenated text
+    for challenge in usecase.get("challenges", []):
+        usecase_concatenated_text += 'The Challenge: ' + challenge["heading"] + ' ' + ' '.join(challenge["paragraphs"]) + '; '
+    # Add solutions to the concatenated text
+    for solution in usecase.get("solutions", []):
+        usecase_concatenated_text += 'The Solution: ' + solution["heading"] + ' ' + ' '.join(solution["paragraphs"]) + ' '
+    return usecase_concatenated_text
+
+
+def usecase_fingerprint(text: str, model_id: str) -> str:
+    """
+    Fingerprint of the embedded text and the model that embedded it.
+    """
+    return hashlib.sha256(f"{model_id}\0{text}".encode("utf-8")).hexdigest()
+
+
+def stale_embedding_filter(model_id: str) -> dict:
+    """
+    Query selecting documents whose use case embedding is missing or was produced by another model.
+    New documents (generator inserts, gatherer upserts, which replace the whole document) have no
+    fingerprint and are selected. Use case text edited in place is not: change_sync re-embeds edits
+    it sees, and `proofpoint-updater.py --verify` compares every fingerprint to catch the rest; a
+    fingerprint cannot be recomputed inside a query, so catching edits always means reading the text.
+    """
+    return {
+        "$or": [
+            {"embeddings.usecase_fingerprint": {"$exists": False}},
+            {"embeddings.model": {"$ne": model_id}},
+        ]
+    }
+
+
+# Sections embedded one chunk per item (or per part of a long item) for chunk retrieval
+CHUNK_SECTIONS = ["introduction", "challenges", "solutions", "results"]
+
+CHUNK_TEXT_PROJECTION = {
+    **USECASE_TEXT_PROJECTION,
+    "customer.company_name": 1,
+    "usecase.results": 1,
+    "usecase.quotes": 1,
+    "usecase.metrics": 1,
+    "embeddings.chunks_fingerprint": 1,
+}
+
+
+def _split_paragraphs(paragraphs, max_chars):
+    # Greedily pack whole paragraphs into parts of at most max_chars (a single longer paragraph stays whole)
+    parts, current = [], ""
+    for paragraph in paragraphs:
+        if current and len(current) + len(paragraph) + 1 > max_chars:
+            parts.append(current)
+            current = ""
+        current = f"{current} {paragraph}" if current else paragraph
+    if current:
+        parts.append(current)
+    return parts
+
+
+def build_usecase_chunks(document: dict, max_chars: int = 1200) -> list:
+    """
+    Split a proof point into per-section chunks small enough for the embedding model.
+    Every chunk is prefixed with the customer and title so it can be embedded on its own.
+    Args:
+        document (dict): Proof point document.
+        max_chars (int): Target chunk size (about 300 tokens by default).
+    Returns:
+        list[tuple]: (path, text) pairs; `path` is the field the chunk came from, e.g. "usecase.challenges.0".
+    """
+    usecase = document.get("usecase", {})
+    prefix = f'{document.get("customer", {}).get("company_name", "")} - {usecase.get("title", "")}: '
+    chunks = [("usecase.overview", prefix + f'Type: {usecase.get("type", "")}; {usecase.get("overview", "")}')]
+
+    for section in CHUNK_SECTIONS:
+        items = usecase.get(section) or []
+        # The introduction is a single item, the other sections are lists of them
+        if isinstance(items, dict):
+            items = [items]
+        for index, item in enumerate(items):
+            path = f"usecase.{section}" if section == "introduction" else f"usecase.{section}.{index}"
+            for part in _split_paragraphs(item.get("paragraphs", []), max_chars):
+                chunks.append((path, prefix + f'{item.get("heading", "")}. {part}'))
+
+    for index, quote in enumerate(usecase.get("quotes") or []):
+        chunks.append((f"usecase.quotes.{index}",
+                       prefix + f'"{quote.get("quote", "")}" - {quote.get("person", "")}, {quote.get("role", "")}'))
+
+    metrics = "; ".join(f'{metric.get("kpi", "")}: {metric.get("result", "")}' for metric in usecase.get("metrics") or [])
+    if metrics:
+        chunks.append(("usecase.metrics", prefix + "Metrics: " + metrics))
+    return chunks
+
+
+def chunks_fingerprint(chunks: list, model_id: str) -> str:
+    """
+    Fingerprint of all chunk texts of a document and the model that embedded them.
+    """
+    return usecase_fingerprint("\0".join(f"{path}\0{text}" for path, text in chunks), model_id)
+
+
+def stale_chunks_filter(model_id: str) -> dict:
+    """
+    Query selecting documents whose use case or chunk embeddings are missing or stale.
+    """
+    stale = stale_embedding_filter(model_id)
+    stale["$or"].append({"embeddings.chunks_fingerprint": {"$exists": False}})
+    return stale
@@ -1,9 +1,14 @@
 from openai import OpenAI
+from embedding_cache import get_embedding_cache
 client = OpenAI()
+embedding_cache = get_embedding_cache()
 
 def get_embedding(text, model="text-embedding-3-small"):
    text = text.replace("\n", " ")
-   return client.embeddings.create(input = [text], model=model).data[0].embedding
+   # Only texts missing from the persistent cache are sent to OpenAI
+   return embedding_cache.get_or_compute(
+      model, [text],
+      lambda texts: [item.embedding for item in client.embeddings.create(input=texts, model=model).data])[0]
 
 def main():
     # Prompt the user for a statement and store it in a string variable
@@ -0,0 +1,181 @@
+"""
+Summary:
+In-process vector index over proof point embeddings.
+
+Vectors are kept L2-normalized in one contiguous float32 NumPy matrix, so a cosine search is a
+single matrix-vector product. Two search modes are available:
+- exact: score every vector (fast enough for tens of thousands of proof points).
+- ivf: an inverted-file index built with spherical k-means; a query only scores the vectors in
+  the `n_probe` lists whose centroids are closest to it, trading a little recall for speed on
+  large collections.
+
+Scores are reported like Atlas `$vectorSearch` cosine scores, `(1 + cosine) / 2`, so results are
+interchangeable with the Atlas path. The index supports upserts and deletes for incremental
+maintenance.
+"""
+
+import threading
+import numpy as np
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class LocalVectorIndex:
+    """
+    Cosine-similarity index over (id, vector) pairs.
+    Args:
+        ids (list): Document ids, one per row of `vectors`.
+        vectors (array-like): Matrix of shape (len(ids), dimension).
+        mode (str): "exact" or "ivf".
+        n_lists (int): Number of IVF lists; defaults to about sqrt(len(ids)).
+        n_probe (int): IVF lists scored per query.
+        normalized (bool): `vectors` is already an L2-normalized float32 matrix (e.g. a memory-mapped
+            snapshot) and is used as-is, without a copy.
+    """
+
+    def __init__(self, ids, vectors, mode="exact", n_lists=None, n_probe=8, normalized=False):
+        if not len(ids):
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        elif not normalized:
+            vectors = _unit(vectors)
+        self.dimension = vectors.shape[1] if len(ids) else 0
+        self._matrix = vectors
+        self._ids = list(ids)
+        self._alive = np.ones(len(self._ids), dtype=bool)
+        self._rows = {document_id: row for row, document_id in enumerate(self._ids)}
+        self._size = len(self._ids)
+        # Searches and changes may come from different threads (e.g. a change stream worker)
+        self._lock = threading.RLock()
+
+        self.mode = mode
+        self.n_probe = n_probe
+        self._centroids = None
+        self._lists = None
+        if mode == "ivf" and self._size:
+            self.build_ivf(n_lists or max(1, int(np.sqrt(self._size))))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def ids(self):
+        """
+        Ids of the documents in the index.
+        """
+        with self._lock:
+            return list(self._rows)
+
+    @property
+    def matrix(self):
+        """
+        The used float32 matrix rows; rows of deleted documents are masked out at search time.
+        """
+        return self._matrix[:self._size]
+
+    def build_ivf(self, n_lists, n_iter=10, seed=0):
+        """
+        Cluster the vectors with spherical k-means and build the inverted lists.
+        """
+        alive = self._alive[:self._size]
+        data = self.matrix if alive.all() else self.matrix[alive]
+        n_lists = min(n_lists, len(data))
+        rng = np.random.default_rng(seed)
+        centroids = data[rng.choice(len(data), n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignment = np.argmax(data @ centroids.T, axis=1)
+            for index in range(n_lists):
+                members = data[assignment == index]
+                # Re-seed empty lists with a random vector
+                centroids[index] = members.sum(axis=0) if len(members) else data[rng.integers(len(data))]
+            centroids = _unit(centroids)
+        self._centroids = centroids
+
+        assignment = np.argmax(self.matrix @ centroids.T, axis=1)
+        rows = np.flatnonzero(self._alive[:self._size])
+        self._lists = [rows[assignment[rows] == index] for index in range(n_lists)]
+        self.mode = "ivf"
+
+    def search(self, query_vector, k=1):
+        """
+        Find the k most similar vectors.
+        Args:
+            query_vector (list[float]): Query embedding.
+            k (int): Number of results.
+        Returns:
+            list[tuple]: (document id, score) pairs, best first.
+        """
+        query = _unit(query_vector)
+        with self._lock:
+            return self._search(query, k)
+
+    def _search(self, query, k):
+        if not self._rows:
+            return []
+        if self.mode == "ivf" and self._centroids is not None:
+            probes = np.argsort(-(self._centroids @ query))[:self.n_probe]
+            candidates = np.concatenate([self._lists[probe] for probe in probes])
+            candidates = candidates[self._alive[candidates]]
+            # Fall back to an exact search when the probed lists are too small
+            if len(candidates) < k:
+                candidates = np.flatnonzero(self._alive[:self._size])
+            scores = self._matrix[candidates] @ query
+        else:
+            # Score the whole matrix in place and mask out deleted rows
+            scores = self.matrix @ query
+            scores[~self._alive[:self._size]] = -np.inf
+            candidates = np.arange(self._size)
+
+        k = min(k, len(self._rows), len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[candidates[index]], float((1 + scores[index]) / 2)) for index in top]
+
+    def upsert(self, document_id, vector):
+        """
+        Insert or replace the vector of a document.
+        """
+        vector = _unit(vector)
+        with self._lock:
+            self._upsert(document_id, vector)
+
+    def _upsert(self, document_id, vector):
+        if not self.dimension:
+            self.dimension = vector.shape[0]
+            self._matrix = np.zeros((16, self.dimension), dtype=np.float32)
+            self._alive = np.zeros(16, dtype=bool)
+        if not self._matrix.flags.writeable:
+            # Read-only memory-mapped snapshot: take a private copy on the first change
+            self._matrix = np.array(self._matrix)
+        row = self._rows.get(document_id)
+        if row is None:
+            if self._size == len(self._matrix):
+                # Grow geometrically so repeated upserts stay amortized O(1)
+                grown = np.zeros((max(16, 2 * len(self._matrix)), self.dimension), dtype=np.float32)
+                grown[:self._size] = self._matrix[:self._size]
+                self._matrix = grown
+                self._alive = np.concatenate([self._alive, np.zeros(len(grown) - len(self._alive), dtype=bool)])
+            row = self._size
+            self._size += 1
+            self._ids.append(document_id)
+            self._rows[document_id] = row
+        elif self._lists is not None:
+            for index, members in enumerate(self._lists):
+                self._lists[index] = members[members != row]
+        self._matrix[row] = vector
+        self._alive[row] = True
+        if self._lists is not None:
+            nearest = int(np.argmax(self._centroids @ vector))
+            self._lists[nearest] = np.append(self._lists[nearest], row)
+
+    def delete(self, document_id):
+        """
+        Remove a document from the index.
+        """
+        with self._lock:
+            row = self._rows.pop(document_id, None)
+            if row is not None:
+                self._alive[row] = False